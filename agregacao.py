@@ -0,0 +1,238 @@
+# Agregação mensal das ocorrências, guardada entre execuções
+#
+# groupby('munic').sum() refazia a soma de todo o histórico a cada execução.
+# Aqui guardamos em disco as somas parciais por município e por mês
+# (ano*100 + mes, ex.: 202403), junto com a impressão digital do arquivo de
+# dados de onde vieram. Enquanto o arquivo for o mesmo, as parciais são usadas
+# sem reler os dados brutos, e os filtros de período (--from/--to) são
+# respondidos a partir delas. Com outro arquivo (outro ISP_ENDERECO ou uma
+# nova publicação, que pode revisar meses antigos) os dados são relidos, mas
+# só os meses novos ou alterados são somados de novo: cada mês guarda um
+# resumo (soma dos hashes das suas linhas) e os meses com o mesmo resumo
+# continuam vindo das parciais guardadas.
+#
+# Nas parciais por município, o município é guardado como o código int32 de
+# municipios.IndiceMunicipios: somas e filtros rodam sobre inteiros e os
+# nomes só voltam no resultado final (um categórico pequeno). As outras
+# chaves ficam com o tipo de leitura de dados.TIPOS_PADRAO (cisp em int32).
+import json
+import re
+from pathlib import Path
+
+import pandas as pd
+
+from dados import (TIPOS_PADRAO, colunas_arquivo, diretorio_cache_padrao, feather,
+                   impressao_digital, ler_ocorrencias, obter_fonte)
+from instrumentacao import etapa
+from municipios import caminho_indice, indice_padrao
+
+
+NOME_ARQUIVO_PARCIAIS = 'parciais_mensais'
+
+
+def periodo_para_int(texto, fim=False):
+    """Converte '2024-03', '2024/03' ou '202403' em 202403 (ano*100 + mes).
+
+    Só o ano ('2024') vira janeiro, ou dezembro quando `fim` é verdadeiro.
+    """
+    if texto is None:
+        return None
+    digitos = re.sub(r'\D', '', str(texto))
+    if len(digitos) == 4:
+        return int(digitos) * 100 + (12 if fim else 1)
+    # '2024-3' (5 dígitos) -> ano 2024, mês 3
+    if len(digitos) in (5, 6) and 1 <= int(digitos[4:]) <= 12:
+        return int(digitos[:4]) * 100 + int(digitos[4:])
+    raise ValueError(f'Período inválido: {texto!r} (use AAAA-MM)')
+
+
+def caminho_parciais(chave, diretorio_cache=None):
+    """Arquivo das parciais por `chave` no cache: .feather com pyarrow, .pkl sem."""
+    diretorio = Path(diretorio_cache) if diretorio_cache else diretorio_cache_padrao()
+    extensao = '.feather' if feather is not None else '.pkl'
+    return diretorio / f'{NOME_ARQUIVO_PARCIAIS}_{chave}{extensao}'
+
+
+def ler_parciais(caminho):
+    """Tabela gravada por gravar_parciais em `caminho`, ou None se ela não existe."""
+    try:
+        if caminho.suffix == '.feather':
+            return pd.read_feather(caminho)
+        return pd.read_pickle(caminho)
+    except FileNotFoundError:
+        return None
+
+
+def gravar_parciais(df, caminho):
+    """Grava `df` em `caminho`, no formato indicado pela extensão (.feather ou .pkl)."""
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    if caminho.suffix == '.feather':
+        df.to_feather(caminho)
+    else:
+        df.to_pickle(caminho)
+
+
+def _caminho_fonte(caminho):
+    # Impressão digital do arquivo de dados, ao lado das parciais
+    return caminho.with_name(caminho.stem + '.fonte.json')
+
+
+def _ler_registro_fonte(caminho):
+    try:
+        registro = json.loads(_caminho_fonte(caminho).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    return registro if isinstance(registro, dict) else {}
+
+
+def ler_fonte(caminho):
+    """Impressão digital dos dados de onde saiu o arquivo derivado `caminho` (ou None)."""
+    return _ler_registro_fonte(caminho).get('digital')
+
+
+def gravar_fonte(caminho, digital, **extras):
+    _caminho_fonte(caminho).write_text(json.dumps({'digital': digital, **extras}),
+                                       encoding='utf-8')
+
+
+def _tipo_chave(chave):
+    # Município: código do índice; as outras chaves, o tipo com que são lidas
+    return 'int32' if chave == 'munic' else TIPOS_PADRAO.get(chave, 'category')
+
+
+def _resumos_mensais(df, colunas, periodo):
+    # Soma (módulo 2**64) dos hashes das linhas de cada mês: não depende da
+    # ordem das linhas e muda se qualquer uma delas mudar
+    hashes = pd.util.hash_pandas_object(df[colunas], index=False)
+    return hashes.groupby(periodo.to_numpy()).sum()
+
+
+def atualizar_parciais(indicadores, chave='munic', diretorio_cache=None, reconstruir=False,
+                       arquivo=None, endereco=None, tipos=None, usar_snapshot=True,
+                       **opcoes_cache):
+    """Parciais mensais de `indicadores` (e dos que já estavam guardados) por `chave`.
+
+    As parciais guardadas são usadas inteiras se vieram do mesmo arquivo de
+    dados (mesma impressão digital); de outro arquivo, só os meses cujo resumo
+    não mudou. `arquivo` é um ResultadoCache já obtido.
+    """
+    arquivo = arquivo or obter_fonte(endereco, diretorio_cache=diretorio_cache, **opcoes_cache)
+    digital = impressao_digital(arquivo.caminho)
+    caminho = caminho_parciais(chave, diretorio_cache)
+    parciais = None if reconstruir else ler_parciais(caminho)
+    indice = indice_padrao(diretorio_cache) if chave == 'munic' else None
+    meses_guardados = {}
+
+    if parciais is not None:
+        guardados = [coluna for coluna in parciais.columns if coluna not in (chave, 'periodo')]
+        registro = _ler_registro_fonte(caminho)
+        # Parciais antigas, com o nome do município em vez do código ou a CISP
+        # como texto, são refeitas
+        mesmo_tipo = str(parciais[chave].dtype) == _tipo_chave(chave)
+        if (registro.get('digital') == digital and set(indicadores) <= set(guardados)
+                and mesmo_tipo):
+            return parciais
+        # Refeitas com todos os indicadores já guardados (que ainda existam nos
+        # dados): quem pede um só indicador não apaga os outros
+        existentes = set(colunas_arquivo(arquivo.caminho))
+        indicadores = [*indicadores, *(coluna for coluna in guardados
+                                       if coluna not in indicadores and coluna in existentes)]
+        # Os resumos só valem para as mesmas colunas; outro conjunto soma tudo de novo
+        if mesmo_tipo and registro.get('indicadores') == sorted(indicadores):
+            meses_guardados = registro.get('meses') or {}
+
+    df = ler_ocorrencias(colunas=[chave, 'ano', 'mes', *indicadores], tipos=tipos,
+                         usar_snapshot=usar_snapshot, arquivo=arquivo,
+                         diretorio_cache=diretorio_cache)
+    periodo = df['ano'].astype('int32') * 100 + df['mes'].astype('int32')
+    resumos = _resumos_mensais(df, [chave, 'ano', 'mes', *sorted(indicadores)], periodo)
+    alterados = [mes for mes, resumo in resumos.items()
+                 if meses_guardados.get(str(mes)) != int(resumo)]
+    mantidas = None
+    if meses_guardados:
+        # Meses que sumiram dos dados também saem das parciais
+        mantidas = parciais[parciais['periodo'].isin(resumos.index)
+                            & ~parciais['periodo'].isin(alterados)]
+        novos = periodo.isin(alterados)
+        df, periodo = df[novos], periodo[novos]
+
+    with etapa('agregacao', linhas=len(df), meses=len(alterados),
+               incremental=mantidas is not None):
+        if indice is not None:
+            tamanho_indice = len(indice)
+            valores_chave = indice.codificar_coluna(df[chave])
+            if len(indice) != tamanho_indice:
+                indice.salvar(caminho_indice(diretorio_cache))
+        else:
+            valores_chave = df[chave]
+        df_parciais = (df[indicadores]
+                       .assign(**{chave: valores_chave}, periodo=periodo)
+                       .groupby([chave, 'periodo'], observed=True)
+                       .sum()
+                       .reset_index())
+        if mantidas is not None:
+            df_parciais = pd.concat([mantidas, df_parciais], ignore_index=True)
+
+        if indice is None:
+            df_parciais[chave] = df_parciais[chave].astype(_tipo_chave(chave))
+        df_parciais = df_parciais.sort_values([chave, 'periodo'], ignore_index=True)
+        gravar_parciais(df_parciais, caminho)
+        gravar_fonte(caminho, digital, indicadores=sorted(indicadores),
+                     meses={str(mes): int(resumo) for mes, resumo in resumos.items()})
+    return df_parciais
+
+
+def totalizar_periodo(parciais, indicadores, chave='munic', inicio=None, fim=None, indice=None):
+    """Totaliza as parciais mensais por `chave` dentro de [inicio, fim].
+
+    Se o município está em códigos inteiros, os nomes vêm de `indice`
+    (padrão: o índice do cache) e o resultado sai em ordem alfabética, como antes.
+    """
+    inicio, fim = periodo_para_int(inicio), periodo_para_int(fim, fim=True)
+    filtro = pd.Series(True, index=parciais.index)
+    if inicio is not None:
+        filtro &= parciais['periodo'] >= inicio
+    if fim is not None:
+        filtro &= parciais['periodo'] <= fim
+    with etapa('totalizacao_periodo', inicio=inicio, fim=fim):
+        df = (parciais.loc[filtro, [chave, *indicadores]]
+              .groupby(chave, observed=True)
+              .sum()
+              .reset_index())
+        # Outras chaves (cisp, em int32) já são o próprio valor
+        if chave != 'munic' or not pd.api.types.is_integer_dtype(df[chave]):
+            return df
+        # Decodificação só das linhas do resultado (uma por município)
+        indice = indice if indice is not None else indice_padrao()
+        df[chave] = indice.categorizar(df[chave].to_numpy())
+        return df.sort_values(chave, ignore_index=True)
+
+
+def totalizar_ocorrencias(indicadores, chave='munic', inicio=None, fim=None, **opcoes):
+    """Atalho para os relatórios: atualiza as parciais e totaliza o período pedido."""
+    parciais = atualizar_parciais(indicadores, chave, **opcoes)
+    indice = indice_padrao(opcoes.get('diretorio_cache')) if chave == 'munic' else None
+    return totalizar_periodo(parciais, indicadores, chave, inicio, fim, indice)
+
+
+def filtrar_periodo(df, inicio=None, fim=None):
+    """Linhas brutas (com colunas ano e mes) dentro de [inicio, fim]."""
+    inicio, fim = periodo_para_int(inicio), periodo_para_int(fim, fim=True)
+    if inicio is None and fim is None:
+        return df
+    periodo = df['ano'].astype('int32') * 100 + df['mes'].astype('int32')
+    filtro = pd.Series(True, index=df.index)
+    if inicio is not None:
+        filtro &= periodo >= inicio
+    if fim is not None:
+        filtro &= periodo <= fim
+    return df[filtro]
+
+
+def adicionar_argumentos_periodo(parser):
+    """Acrescenta --from/--to a um argparse.ArgumentParser de relatório."""
+    parser.add_argument('--from', dest='inicio', metavar='AAAA-MM',
+                        help='primeiro mês considerado (ex.: 2023-01)')
+    parser.add_argument('--to', dest='fim', metavar='AAAA-MM',
+                        help='último mês considerado (ex.: 2023-12)')
+    return parser
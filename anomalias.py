@@ -0,0 +1,220 @@
+# Anomalias na série mensal de cada município
+#
+# O limite de 1.5*IQR sobre o total do período só aponta municípios que são
+# diferentes dos outros; não vê um município que de repente dispara neste
+# mês. Aqui cada município é comparado com o próprio histórico:
+#   - 'movel': mediana e IQR dos `janela` meses anteriores;
+#   - 'sazonal': mediana e IQR do mesmo mês nos `anos` anos anteriores
+#     (março comparado com os marços anteriores).
+# Um mês é anomalia quando fica fora de [q1 - k*IQR, q3 + k*IQR] da sua base.
+#
+# A série vem das parciais mensais (agregacao.py) e vira uma matriz
+# (municípios x meses); as bases de todos os meses saem de uma vez, com
+# janelas deslizantes do numpy. O resultado fica guardado no cache junto com
+# a série de onde saiu; quando o ISP publica uma versão nova, a série nova é
+# comparada com a guardada e só são calculados os meses a partir do primeiro
+# que mudou (um mês revisado ou um mês novo), usando só o trecho da série que
+# as suas janelas alcançam.
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from agregacao import (atualizar_parciais, caminho_parciais, gravar_parciais, ler_parciais,
+                       periodo_para_int)
+from estatisticas import MULTIPLICADOR_IQR
+from instrumentacao import etapa
+from municipios import indice_padrao
+
+
+MODOS = ('movel', 'sazonal')
+JANELA_PADRAO = 12
+ANOS_PADRAO = 3
+
+# Com contagens pequenas o IQR da base costuma ser 0 e qualquer ocorrência
+# viraria anomalia; o IQR usado nunca é menor que isto
+IQR_MINIMO = 1.0
+
+COLUNAS_BASE = ['valor', 'q1', 'mediana', 'q3', 'limite_inferior', 'limite_superior', 'escore']
+
+
+def periodo_para_mes(periodo):
+    """202403 -> número absoluto do mês (ano*12 + mes - 1), para contar distâncias."""
+    periodo = np.asarray(periodo)
+    return periodo // 100 * 12 + periodo % 100 - 1
+
+
+def mes_para_periodo(mes):
+    mes = np.asarray(mes)
+    return mes // 12 * 100 + mes % 12 + 1
+
+
+def serie_mensal(parciais, indicador, chave='munic'):
+    """Matriz (chaves x meses) com NaN nos meses sem dados, as chaves e o primeiro mês."""
+    meses = periodo_para_mes(parciais['periodo'].to_numpy())
+    chaves, linhas = np.unique(parciais[chave].to_numpy(), return_inverse=True)
+    primeiro = int(meses.min())
+    matriz = np.full((len(chaves), int(meses.max()) - primeiro + 1), np.nan)
+    matriz[linhas.ravel(), meses - primeiro] = parciais[indicador].to_numpy(dtype=np.float64)
+    return matriz, chaves, primeiro
+
+
+def alcance(modo, janela=JANELA_PADRAO, anos=ANOS_PADRAO):
+    """Quantos meses para trás a base de um mês precisa olhar."""
+    return janela if modo == 'movel' else 12 * anos
+
+
+def _janelas(matriz, modo, janela, anos):
+    # Para cada mês t (a partir de `alcance`), os valores da base: shape
+    # (chaves, meses avaliados, tamanho da base)
+    if modo == 'movel':
+        # A janela k cobre os meses [k, k + janela): é a base do mês k + janela
+        return sliding_window_view(matriz, janela, axis=1)[:, :-1]
+    passo = 12 * anos
+    n = matriz.shape[1] - passo
+    return np.stack([matriz[:, passo - 12 * j:passo - 12 * j + n] for j in range(1, anos + 1)],
+                    axis=-1)
+
+
+def calcular_bases(matriz, modo='movel', janela=JANELA_PADRAO, anos=ANOS_PADRAO,
+                   metodo='weibull', multiplicador=MULTIPLICADOR_IQR, minimo_observacoes=None):
+    """Quartis da base, limites e escore de cada mês com histórico suficiente.
+
+    Devolve um dict de matrizes (chaves x meses avaliados); o primeiro mês
+    avaliado é a coluna `alcance(modo, janela, anos)` de `matriz`.
+    """
+    if modo not in MODOS:
+        raise ValueError(f'Modo inválido: {modo!r} (use {" ou ".join(MODOS)})')
+    inicio = alcance(modo, janela, anos)
+    if matriz.shape[1] <= inicio:
+        vazio = np.empty((matriz.shape[0], 0))
+        return {nome: vazio for nome in COLUNAS_BASE}
+
+    janelas = _janelas(matriz, modo, janela, anos)
+    tamanho_base = janelas.shape[-1]
+    minimo_observacoes = minimo_observacoes or min(tamanho_base, max(2, tamanho_base // 2))
+    suficientes = (~np.isnan(janelas)).sum(axis=-1) >= minimo_observacoes
+    with warnings.catch_warnings():
+        # Bases só com NaN geram "All-NaN slice"; elas viram NaN logo abaixo
+        warnings.simplefilter('ignore', RuntimeWarning)
+        q1, mediana, q3 = np.nanquantile(janelas, [0.25, 0.5, 0.75], axis=-1, method=metodo)
+    q1, mediana, q3 = (np.where(suficientes, q, np.nan) for q in (q1, mediana, q3))
+    iqr = np.maximum(q3 - q1, IQR_MINIMO)
+    valor = matriz[:, inicio:]
+    return {
+        'valor': valor,
+        'q1': q1,
+        'mediana': mediana,
+        'q3': q3,
+        'limite_inferior': q1 - multiplicador * iqr,
+        'limite_superior': q3 + multiplicador * iqr,
+        'escore': (valor - mediana) / iqr,
+    }
+
+
+def _caminho_anomalias(indicador, chave, modo, janela, anos, metodo, multiplicador,
+                       diretorio_cache=None):
+    # Ao lado das parciais, com os parâmetros no nome
+    parciais = caminho_parciais(chave, diretorio_cache)
+    nome = (f'anomalias_{chave}_{indicador}_{modo}{alcance(modo, janela, anos)}'
+            f'_{metodo}_{multiplicador:g}')
+    return parciais.with_name(nome + parciais.suffix)
+
+
+def _caminho_serie(caminho):
+    return caminho.with_name(caminho.stem + '_serie.npz')
+
+
+def _primeiro_mes_alterado(caminho, matriz, chaves, primeiro):
+    # Primeiro mês (absoluto) em que a série atual difere da guardada com as
+    # bases; sem diferença, o mês seguinte ao último guardado
+    try:
+        with np.load(_caminho_serie(caminho)) as guardada:
+            matriz_antiga, chaves_antigas = guardada['matriz'], guardada['chaves']
+            primeiro_antigo = int(guardada['primeiro'])
+    except (OSError, ValueError, KeyError):
+        return primeiro
+    if primeiro_antigo != primeiro or not np.array_equal(chaves_antigas, chaves.astype(str)):
+        return primeiro
+    n = min(matriz_antiga.shape[1], matriz.shape[1])
+    antiga, atual = matriz_antiga[:, :n], matriz[:, :n]
+    iguais = (antiga == atual) | (np.isnan(antiga) & np.isnan(atual))
+    alterados = np.flatnonzero(~iguais.all(axis=0))
+    return primeiro + (int(alterados[0]) if len(alterados) else n)
+
+
+def _gravar_serie(caminho, matriz, chaves, primeiro):
+    np.savez(_caminho_serie(caminho), matriz=matriz, chaves=chaves.astype(str), primeiro=primeiro)
+
+
+def atualizar_bases(indicador, chave='munic', modo='movel', janela=JANELA_PADRAO,
+                    anos=ANOS_PADRAO, metodo='weibull', multiplicador=MULTIPLICADOR_IQR,
+                    diretorio_cache=None, reconstruir=False, **opcoes_leitura):
+    """Base e escore de cada chave x mês, calculando só os meses novos ou revisados."""
+    parciais = atualizar_parciais([indicador], chave, diretorio_cache=diretorio_cache,
+                                  **opcoes_leitura)
+    caminho = _caminho_anomalias(indicador, chave, modo, janela, anos, metodo, multiplicador,
+                                 diretorio_cache)
+    guardadas = None if reconstruir else ler_parciais(caminho)
+
+    matriz, chaves, primeiro = serie_mensal(parciais, indicador, chave)
+    meses_base = alcance(modo, janela, anos)
+    ultimo = primeiro + matriz.shape[1] - 1
+    desde = primeiro + meses_base
+    if guardadas is not None and len(guardadas):
+        alterado = _primeiro_mes_alterado(caminho, matriz, chaves, primeiro)
+        # As bases dos meses a partir do alterado olham para ele: são refeitas
+        validas = periodo_para_mes(guardadas['periodo'].to_numpy()) < alterado
+        if not validas.all():
+            guardadas = guardadas[validas].reset_index(drop=True)
+        desde = max(desde, alterado)
+        if desde > ultimo:
+            if not validas.all():
+                gravar_parciais(guardadas, caminho)
+                _gravar_serie(caminho, matriz, chaves, primeiro)
+            return guardadas
+    else:
+        guardadas = None
+
+    with etapa('anomalias', indicador=indicador, modo=modo, meses=max(ultimo - desde + 1, 0),
+               incremental=guardadas is not None):
+        # Só o trecho final da série que as bases dos meses novos alcançam
+        bases = calcular_bases(matriz[:, max(desde - meses_base - primeiro, 0):], modo, janela,
+                               anos, metodo, multiplicador)
+        n_chaves, n_meses = bases['valor'].shape
+        periodos = mes_para_periodo(np.arange(ultimo - n_meses + 1, ultimo + 1))
+        tabela = pd.DataFrame({
+            chave: np.repeat(chaves, n_meses),
+            'periodo': np.tile(periodos, n_chaves).astype(np.int32),
+            **{nome: valores.ravel() for nome, valores in bases.items()},
+        }).dropna(subset=['valor'])
+        if guardadas is not None:
+            tabela = pd.concat([guardadas, tabela], ignore_index=True)
+        tabela = tabela.reset_index(drop=True)
+        gravar_parciais(tabela, caminho)
+        _gravar_serie(caminho, matriz, chaves, primeiro)
+    return tabela
+
+
+def detectar_anomalias(indicador, chave='munic', modo='movel', janela=JANELA_PADRAO,
+                       anos=ANOS_PADRAO, inicio=None, fim=None, metodo='weibull',
+                       multiplicador=MULTIPLICADOR_IQR, **opcoes):
+    """Meses fora dos limites da base, com o nome do município e o tipo da anomalia."""
+    tabela = atualizar_bases(indicador, chave, modo, janela, anos, metodo, multiplicador,
+                             **opcoes)
+    inicio, fim = periodo_para_int(inicio), periodo_para_int(fim, fim=True)
+    filtro = ((tabela['valor'] > tabela['limite_superior'])
+              | (tabela['valor'] < tabela['limite_inferior']))
+    if inicio is not None:
+        filtro &= tabela['periodo'] >= inicio
+    if fim is not None:
+        filtro &= tabela['periodo'] <= fim
+    resultado = tabela[filtro].copy()
+    resultado['tipo'] = np.where(resultado['valor'] > resultado['limite_superior'],
+                                 'superior', 'inferior')
+    if chave == 'munic' and pd.api.types.is_integer_dtype(resultado[chave]):
+        indice = indice_padrao(opcoes.get('diretorio_cache'))
+        resultado[chave] = indice.categorizar(resultado[chave].to_numpy())
+    return resultado.sort_values(['periodo', 'escore'], ascending=[True, False],
+                                 ignore_index=True)
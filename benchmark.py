@@ -0,0 +1,380 @@
+# Benchmark do pipeline com dados sintéticos no formato do ISP
+#
+# Gera arquivos com o mesmo esquema do BaseDPEvolucaoMensalCisp.csv (separado
+# por ';', codificação Latin-1, colunas cisp/mes/ano/munic/... e indicadores)
+# em 1x, 10x e 100x o tamanho real, e mede cada "motor" de leitura ->
+# agregação -> estatísticas -> filtro de outliers. Os resultados são
+# acrescentados a um arquivo .jsonl e comparados com a última rodada de cada
+# motor/escala, para que regressões apareçam entre execuções.
+#
+# A memória de cada motor é medida numa execução à parte, num processo novo:
+# o pico de RSS durante a execução menos o RSS de antes dela. O RSS inclui o
+# que o tracemalloc não vê (buffers do Arrow, páginas lidas por memory-map);
+# o pico do pool do Arrow vai junto no registro. No Linux o pico é zerado
+# antes da execução (/proc/self/clear_refs); em outros sistemas vem do
+# resource.getrusage e, sem o módulo resource (Windows), do tracemalloc.
+#
+# Uso:
+#   python benchmark.py                          # escalas 1 e 10
+#   python benchmark.py --escalas 1 10 100 --repeticoes 5
+#   python benchmark.py --motores original snapshot
+#   python benchmark.py --memoria                # munic como texto x códigos
+import argparse
+import json
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import dados
+from estatisticas import analisar_indicadores, calcular_medidas
+from municipios import IndiceMunicipios, memoria_por_codificacao
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover
+    pa = None
+
+
+# Tamanho aproximado do arquivo real: ~140 delegacias (CISP) em 92
+# municípios, com dados mensais desde 2003
+CISPS_REAIS = 140
+MUNICIPIOS_REAIS = 92
+ANO_INICIAL, ANO_FINAL = 2003, 2024
+
+INDICADORES = (
+    'hom_doloso', 'lesao_corp_morte', 'latrocinio', 'cvli', 'hom_por_interv_policial',
+    'letalidade_violenta', 'tentat_hom', 'lesao_corp_dolosa', 'estupro', 'hom_culposo',
+    'lesao_corp_culposa', 'roubo_transeunte', 'roubo_celular', 'roubo_em_coletivo',
+    'roubo_rua', 'roubo_carga', 'roubo_comercio', 'roubo_residencia', 'roubo_veiculo',
+    'roubo_banco', 'roubo_cx_eletronico', 'roubo_conducao_saque', 'roubo_apos_saque',
+    'roubo_bicicleta', 'outros_roubos', 'total_roubos', 'furto_veiculos',
+    'furto_transeunte', 'furto_coletivo', 'furto_celular', 'furto_bicicleta',
+    'outros_furtos', 'total_furtos', 'sequestro', 'extorsao', 'sequestro_relampago',
+    'estelionato', 'apreensao_drogas', 'posse_drogas', 'trafico_drogas',
+    'recuperacao_veiculos', 'apf', 'aaapai', 'cmp', 'cmba', 'ameaca',
+    'pessoas_desaparecidas', 'encontro_cadaver', 'registro_ocorrencias',
+)
+
+DIRETORIO_PADRAO = dados.diretorio_cache_padrao() / 'benchmark'
+
+
+def gerar_dados_sinteticos(escala=1, semente=0):
+    """DataFrame com o esquema do CSV do ISP e `escala` vezes o número de CISPs reais."""
+    rng = np.random.default_rng(semente)
+    n_cisps = CISPS_REAIS * escala
+    municipios = np.array([f'Município {i:03d} - São João' for i in range(MUNICIPIOS_REAIS)])
+    # Poucos municípios concentram muitas delegacias, como a capital no real
+    pesos = 1 / np.arange(1, MUNICIPIOS_REAIS + 1)
+    munic_da_cisp = rng.choice(MUNICIPIOS_REAIS, n_cisps, p=pesos / pesos.sum())
+
+    anos = np.arange(ANO_INICIAL, ANO_FINAL + 1)
+    n_meses = len(anos) * 12
+    cisp = np.repeat(np.arange(n_cisps), n_meses)
+    ano = np.tile(np.repeat(anos, 12), n_cisps)
+    mes = np.tile(np.arange(1, 13), len(anos) * n_cisps)
+    indice_munic = munic_da_cisp[cisp]
+
+    df = pd.DataFrame({
+        'cisp': cisp + 1,
+        'mes': mes,
+        'ano': ano,
+        'mes_ano': pd.Series(ano).astype(str) + 'm' + pd.Series(mes).astype(str).str.zfill(2),
+        'aisp': indice_munic % 41 + 1,
+        'risp': indice_munic % 7 + 1,
+        'munic': municipios[indice_munic],
+        'mcirc': indice_munic + 3300000,
+        'regiao': np.where(indice_munic == 0, 'Capital', 'Interior'),
+    })
+    # Cada CISP tem um nível próprio, o que gera outliers entre municípios
+    nivel = rng.gamma(2.0, 10.0, n_cisps)[cisp]
+    for indicador in INDICADORES:
+        df[indicador] = rng.poisson(nivel * rng.uniform(0.1, 2.0)).astype('int32')
+    df['fase'] = 3
+    return df
+
+
+def arquivo_sintetico(escala, diretorio=DIRETORIO_PADRAO):
+    """Caminho do CSV sintético da `escala`, gerando-o se ainda não existir."""
+    caminho = Path(diretorio) / f'BaseDPEvolucaoMensalCisp_x{escala}.csv'
+    if not caminho.exists():
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        print(f'Gerando {caminho.name}...')
+        gerar_dados_sinteticos(escala).to_csv(caminho, sep=dados.SEPARADOR,
+                                              encoding=dados.CODIFICACAO, index=False)
+    return caminho
+
+
+# ##### MOTORES #####
+# Cada motor recebe o caminho do CSV e o indicador, e faz todo o caminho até
+# os outliers. Novos motores só precisam ser acrescentados a MOTORES.
+
+def _outliers(df_agrupado, indicador, medidas):
+    valores = df_agrupado[indicador]
+    return (df_agrupado[valores < medidas.limite_inferior],
+            df_agrupado[valores > medidas.limite_superior])
+
+
+def motor_original(caminho, indicador):
+    # O pipeline dos exemplos antes das otimizações, para referência
+    df = pd.read_csv(caminho, sep=';', encoding='iso-8859-1')
+    df = df[['munic', indicador]]
+    df_agrupado = df.groupby('munic').sum(numeric_only=True).reset_index()
+    array = np.array(df_agrupado[indicador])
+    np.mean(array)
+    np.median(array)
+    q1 = np.quantile(array, 0.25, method='weibull')
+    np.quantile(array, 0.50, method='weibull')
+    q3 = np.quantile(array, 0.75, method='weibull')
+    np.max(array)
+    np.min(array)
+    iqr = q3 - q1
+    return (df_agrupado[df_agrupado[indicador] < q1 - 1.5 * iqr],
+            df_agrupado[df_agrupado[indicador] > q3 + 1.5 * iqr])
+
+
+def motor_csv_podado(caminho, indicador):
+    df = dados.ler_csv(caminho, ['munic', indicador])
+    df_agrupado = df.groupby('munic', observed=True).sum().reset_index()
+    return _outliers(df_agrupado, indicador, calcular_medidas(df_agrupado[indicador].to_numpy()))
+
+
+def motor_csv_blocos(caminho, indicador):
+    df_agrupado = dados.agregar_csv_em_blocos(caminho, [indicador])
+    return _outliers(df_agrupado, indicador, calcular_medidas(df_agrupado[indicador].to_numpy()))
+
+
+def _snapshot(caminho):
+    caminho_snap = Path(caminho).with_suffix('.feather')
+    if not dados.snapshot_atualizado(caminho, caminho_snap):
+        dados.gerar_snapshot(caminho, caminho_snap)
+    return caminho_snap
+
+
+def motor_snapshot(caminho, indicador):
+    df = dados.ler_snapshot(_snapshot(caminho), ['munic', indicador])
+    df_agrupado = df.groupby('munic', observed=True).sum().reset_index()
+    return _outliers(df_agrupado, indicador, calcular_medidas(df_agrupado[indicador].to_numpy()))
+
+
+def motor_snapshot_lote(caminho, indicador):
+    # Todos os indicadores de uma vez (o indicador pedido é ignorado)
+    df = dados.ler_snapshot(_snapshot(caminho), ['munic', *INDICADORES])
+    df_agrupado = df.groupby('munic', observed=True).sum().reset_index()
+    return analisar_indicadores(df_agrupado, indicadores=list(INDICADORES))
+
+
+MOTORES = {
+    'original': motor_original,
+    'csv_podado': motor_csv_podado,
+    'csv_blocos': motor_csv_blocos,
+    'snapshot': motor_snapshot,
+    'snapshot_lote': motor_snapshot_lote,
+}
+
+# Motores que dependem do pyarrow
+MOTORES_PYARROW = ('snapshot', 'snapshot_lote')
+
+
+# ru_maxrss vem em KiB no Linux e em bytes no macOS
+_UNIDADE_RSS = 1 if sys.platform == 'darwin' else 1024
+
+_STATUS_PROCESSO = Path('/proc/self/status')
+_ZERAR_PICO = Path('/proc/self/clear_refs')
+
+
+def metodo_memoria():
+    """Como medir() mede a memória: 'rss_proc', 'rss_getrusage' ou 'tracemalloc'."""
+    if _ZERAR_PICO.exists():
+        return 'rss_proc'
+    return 'rss_getrusage' if resource is not None else 'tracemalloc'
+
+
+DESCRICAO_METODO_MEMORIA = {
+    'rss_proc': 'pico de RSS (VmHWM, zerado antes da execução) menos o RSS de antes, '
+                'num processo novo',
+    'rss_getrusage': 'aumento do pico de RSS (resource.getrusage) num processo novo; '
+                     'pode ficar abaixo do real se os imports tiveram pico maior',
+    'tracemalloc': 'pico do tracemalloc (só Python/numpy, sem Arrow nem memory-map) '
+                   'num processo novo',
+}
+
+
+def _rss_proc(campo):
+    # Valores de /proc/self/status em KiB (VmRSS: atual, VmHWM: pico)
+    for linha in _STATUS_PROCESSO.read_text().splitlines():
+        if linha.startswith(campo + ':'):
+            return int(linha.split()[1]) * 1024
+    raise ValueError(f'{campo} não encontrado em {_STATUS_PROCESSO}')
+
+
+def _memoria_de_uma_execucao(motor, caminho, indicador, metodo):
+    # Roda num processo novo, só com os imports: nada herdado de outros motores
+    memoria = {'pico_memoria_bytes': None, 'pico_arrow_bytes': None}
+    if metodo == 'rss_proc':
+        # '5' zera o pico (VmHWM) para o RSS atual
+        _ZERAR_PICO.write_text('5')
+        antes = _rss_proc('VmRSS')
+        motor(caminho, indicador)
+        memoria['pico_memoria_bytes'] = _rss_proc('VmHWM') - antes
+    elif metodo == 'rss_getrusage':
+        antes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        motor(caminho, indicador)
+        depois = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memoria['pico_memoria_bytes'] = (depois - antes) * _UNIDADE_RSS
+    else:
+        tracemalloc.start()
+        try:
+            motor(caminho, indicador)
+            memoria['pico_memoria_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    if pa is not None:
+        memoria['pico_arrow_bytes'] = pa.default_memory_pool().max_memory()
+    return memoria
+
+
+def medir(motor, caminho, indicador, repeticoes):
+    """Tempos de `repeticoes` execuções e a memória de uma execução extra (ver metodo_memoria)."""
+    # Execução de aquecimento, fora da medição: gera o snapshot quando o motor
+    # usa um e coloca o arquivo no cache do sistema operacional para todos
+    motor(caminho, indicador)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        motor(caminho, indicador)
+        tempos.append(time.perf_counter() - inicio)
+    # spawn: processo sem a memória herdada deste (o fork copiaria o pico atual)
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        memoria = executor.submit(_memoria_de_uma_execucao, motor, caminho, indicador,
+                                  metodo_memoria()).result()
+    return tempos, memoria
+
+
+def _versao_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ultimos_resultados(caminho_resultados):
+    """Último resultado registrado de cada (motor, escala)."""
+    ultimos = {}
+    if Path(caminho_resultados).exists():
+        with open(caminho_resultados, encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                registro = json.loads(linha)
+                ultimos[(registro['motor'], registro['escala'])] = registro
+    return ultimos
+
+
+def executar(escalas=(1, 10), motores=None, repeticoes=3, indicador='roubo_veiculo',
+             diretorio=DIRETORIO_PADRAO, tolerancia=0.10):
+    """Roda o benchmark, grava os resultados e devolve a lista de registros."""
+    motores = motores or [nome for nome in MOTORES
+                          if dados.feather is not None or nome not in MOTORES_PYARROW]
+    caminho_resultados = Path(diretorio) / 'resultados.jsonl'
+    anteriores = ultimos_resultados(caminho_resultados)
+    versao = _versao_codigo()
+    registros = []
+
+    metodo = metodo_memoria()
+    print(f'Memória: {DESCRICAO_METODO_MEMORIA[metodo]}')
+    print(f'{"motor":<15}{"escala":>7}{"mediana (s)":>13}{"mínimo (s)":>12}'
+          f'{"pico (MB)":>11}{"Arrow (MB)":>12}  comparação')
+    for escala in escalas:
+        caminho = arquivo_sintetico(escala, diretorio)
+        with open(caminho, 'rb') as arquivo:
+            linhas = sum(1 for _ in arquivo) - 1
+        for nome in motores:
+            tempos, memoria = medir(MOTORES[nome], caminho, indicador, repeticoes)
+            registro = {
+                'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'versao': versao,
+                'motor': nome,
+                'escala': escala,
+                'linhas': linhas,
+                'repeticoes': repeticoes,
+                'mediana_s': statistics.median(tempos),
+                'minimo_s': min(tempos),
+                **memoria,
+                'metodo_memoria': metodo,
+            }
+            comparacao = ''
+            anterior = anteriores.get((nome, escala))
+            if anterior:
+                variacao = registro['mediana_s'] / anterior['mediana_s'] - 1
+                comparacao = f'{variacao:+.1%} vs {anterior.get("versao") or "anterior"}'
+                if variacao > tolerancia:
+                    comparacao += '  <-- REGRESSÃO'
+            arrow = memoria['pico_arrow_bytes']
+            arrow = '-' if arrow is None else f'{arrow / 2**20:.1f}'
+            print(f'{nome:<15}{escala:>7}{registro["mediana_s"]:>13.4f}'
+                  f'{registro["minimo_s"]:>12.4f}{memoria["pico_memoria_bytes"] / 2**20:>11.1f}'
+                  f'{arrow:>12}  {comparacao}')
+            registros.append(registro)
+
+    caminho_resultados.parent.mkdir(parents=True, exist_ok=True)
+    with open(caminho_resultados, 'a', encoding='utf-8') as arquivo:
+        for registro in registros:
+            print(json.dumps(registro), file=arquivo)
+    print(f'\nResultados acrescentados em {caminho_resultados}')
+    return registros
+
+
+def relatorio_memoria(escalas=(1, 10), indicador='roubo_veiculo', diretorio=DIRETORIO_PADRAO):
+    """Memória da coluna munic e tempo do groupby como texto, categórico e código int32."""
+    print(f'{"escala":>6}{"codificação":>13}{"munic (MB)":>12}{"groupby (s)":>13}')
+    for escala in escalas:
+        df = pd.read_csv(arquivo_sintetico(escala, diretorio), sep=dados.SEPARADOR,
+                         encoding=dados.CODIFICACAO, usecols=['munic', indicador])
+        indice = IndiceMunicipios()
+        memoria = memoria_por_codificacao(df['munic'], indice)
+        chaves = {
+            'objeto': df['munic'].astype(object),
+            'categoria': df['munic'].astype('category'),
+            'int32': indice.codificar_coluna(df['munic']),
+        }
+        for nome, chave in chaves.items():
+            inicio = time.perf_counter()
+            df[indicador].groupby(chave, observed=True).sum()
+            segundos = time.perf_counter() - inicio
+            print(f'{escala:>6}{nome:>13}{memoria[nome] / 2**20:>12.2f}{segundos:>13.4f}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do pipeline com dados sintéticos')
+    parser.add_argument('--escalas', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--motores', nargs='+', choices=sorted(MOTORES))
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--indicador', default='roubo_veiculo', choices=INDICADORES)
+    parser.add_argument('--diretorio', type=Path, default=DIRETORIO_PADRAO,
+                        help='onde ficam os CSVs sintéticos e o resultados.jsonl')
+    parser.add_argument('--tolerancia', type=float, default=0.10,
+                        help='aumento relativo da mediana considerado regressão (0.10 = 10%%)')
+    parser.add_argument('--memoria', action='store_true',
+                        help='só compara a memória e o groupby de munic como texto e como código')
+    args = parser.parse_args(argv)
+    if args.memoria:
+        relatorio_memoria(args.escalas, args.indicador, args.diretorio)
+        return
+    executar(args.escalas, args.motores, args.repeticoes, args.indicador,
+             args.diretorio, args.tolerancia)
+
+
+if __name__ == '__main__':
+    main()
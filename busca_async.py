@@ -0,0 +1,328 @@
+# Download concorrente de vários arquivos do ISP com asyncio
+#
+# Os relatórios precisam de mais de um arquivo do ispdados.rj.gov.br (dados
+# mensais por CISP, por município, população...). Em vez de baixar um por
+# vez, aqui todos são baixados ao mesmo tempo, com:
+#   - um pool de conexões HTTP/1.1 keep-alive por servidor (a mesma conexão
+#     TLS é reaproveitada entre arquivos do mesmo host);
+#   - novas tentativas com espera exponencial (backoff) em falhas de rede e
+#     respostas 429/5xx;
+#   - corpo da resposta gravado em disco aos poucos, descompactando gzip em
+#     fluxo quando o servidor comprime a resposta;
+#   - o mesmo cache e os mesmos cabeçalhos ETag/Last-Modified de dados.py,
+#     então obter_arquivo() enxerga os arquivos baixados aqui.
+#
+# Só usa a biblioteca padrão. Para testes, basta apontar as URLs para um
+# servidor local (python -m http.server).
+import asyncio
+import json
+import os
+import random
+import ssl
+import tempfile
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+import dados
+from instrumentacao import etapa
+
+
+# Atalhos para os arquivos publicados pelo ISP
+CONJUNTOS_ISP = {
+    'cisp_mensal': dados.ENDERECO_DADOS,
+    'municipio_mensal': 'https://www.ispdados.rj.gov.br/Arquivos/BaseMunicipioMensal.csv',
+    'populacao_cisp': 'https://www.ispdados.rj.gov.br/Arquivos/PopulacaoEvolucaoMensalCisp.csv',
+}
+
+CONEXOES_POR_HOST = 4
+TENTATIVAS = 4
+ESPERA_INICIAL = 0.5
+MAX_REDIRECIONAMENTOS = 5
+TAMANHO_LEITURA = 64 * 1024
+
+# Respostas que valem uma nova tentativa
+STATUS_TEMPORARIOS = {429, 500, 502, 503, 504}
+
+
+class ErroHTTP(Exception):
+    def __init__(self, status, url):
+        super().__init__(f'HTTP {status} em {url}')
+        self.status = status
+        self.url = url
+
+
+class _Conexao:
+    def __init__(self, leitor, escritor):
+        self.leitor = leitor
+        self.escritor = escritor
+
+    def fechar(self):
+        self.escritor.close()
+
+
+class _Corpo:
+    """Corpo de uma resposta, lido aos poucos com `async for`.
+
+    A conexão volta ao pool (ou é fechada) e a vaga do host é devolvida uma
+    única vez: ao fim da leitura, numa falha dela ou em aclose(), mesmo que a
+    leitura nem tenha começado.
+    """
+
+    def __init__(self, pool, destino, conexao, status, cabecalhos):
+        self._pool = pool
+        self._destino = destino
+        self._conexao = conexao
+        self._liberado = False
+        self.reutilizavel = cabecalhos.get('connection', '').lower() != 'close'
+        self._blocos = self._ler(status, cabecalhos)
+
+    def __aiter__(self):
+        return self._blocos
+
+    async def _ler(self, status, cabecalhos):
+        conexao, esperar = self._conexao, self._pool._esperar
+        try:
+            if status in (204, 304):
+                return
+            if 'chunked' in cabecalhos.get('transfer-encoding', '').lower():
+                while True:
+                    linha = await esperar(conexao.leitor.readuntil(b'\r\n'))
+                    tamanho = int(linha.split(b';')[0], 16)
+                    if tamanho == 0:
+                        # Trailers opcionais até a linha vazia
+                        while await esperar(conexao.leitor.readuntil(b'\r\n')) != b'\r\n':
+                            pass
+                        break
+                    while tamanho:
+                        bloco = await esperar(conexao.leitor.read(min(tamanho, TAMANHO_LEITURA)))
+                        if not bloco:
+                            raise asyncio.IncompleteReadError(b'', tamanho)
+                        tamanho -= len(bloco)
+                        yield bloco
+                    await esperar(conexao.leitor.readexactly(2))
+            elif 'content-length' in cabecalhos:
+                restante = int(cabecalhos['content-length'])
+                while restante:
+                    bloco = await esperar(conexao.leitor.read(min(restante, TAMANHO_LEITURA)))
+                    if not bloco:
+                        raise asyncio.IncompleteReadError(b'', restante)
+                    restante -= len(bloco)
+                    yield bloco
+            else:
+                # Sem tamanho definido: o corpo vai até o servidor fechar
+                self.reutilizavel = False
+                while bloco := await esperar(conexao.leitor.read(TAMANHO_LEITURA)):
+                    yield bloco
+        except BaseException:
+            self.reutilizavel = False
+            raise
+        finally:
+            self._liberar()
+
+    def _liberar(self):
+        if self._liberado:
+            return
+        self._liberado = True
+        if self.reutilizavel:
+            self._pool._livres[self._destino].append(self._conexao)
+        else:
+            self._conexao.fechar()
+        self._pool._semaforos[self._destino].release()
+
+    async def aclose(self):
+        await self._blocos.aclose()
+        # Leitura que nem começou: o corpo ficou na conexão, que não serve mais
+        self.reutilizavel = False
+        self._liberar()
+
+
+class PoolConexoes:
+    """Conexões keep-alive reaproveitáveis, no máximo `limite_por_host` por servidor."""
+
+    def __init__(self, limite_por_host=CONEXOES_POR_HOST, timeout=60):
+        self.limite_por_host = limite_por_host
+        self.timeout = timeout
+        self._livres = defaultdict(list)
+        self._semaforos = defaultdict(lambda: asyncio.Semaphore(self.limite_por_host))
+        self._ssl = ssl.create_default_context()
+        # Quantas conexões novas foram abertas (para conferir o reaproveitamento)
+        self.conexoes_abertas = 0
+
+    async def _abrir(self, destino):
+        esquema, host, porta = destino
+        leitor, escritor = await asyncio.wait_for(
+            asyncio.open_connection(host, porta, ssl=self._ssl if esquema == 'https' else None),
+            self.timeout)
+        self.conexoes_abertas += 1
+        return _Conexao(leitor, escritor)
+
+    async def requisitar(self, url, cabecalhos):
+        """Faz um GET e devolve (status, cabeçalhos, corpo), com o corpo como iterador assíncrono."""
+        partes = urlsplit(url)
+        porta = partes.port or (443 if partes.scheme == 'https' else 80)
+        destino = (partes.scheme, partes.hostname, porta)
+        caminho = partes.path or '/'
+        if partes.query:
+            caminho += '?' + partes.query
+
+        semaforo = self._semaforos[destino]
+        await semaforo.acquire()
+        reaproveitada = bool(self._livres[destino])
+        conexao = None
+        try:
+            conexao = self._livres[destino].pop() if reaproveitada else await self._abrir(destino)
+            linhas = [f'GET {caminho} HTTP/1.1', f'Host: {partes.netloc}',
+                      'Connection: keep-alive', 'Accept-Encoding: gzip']
+            linhas += [f'{nome}: {valor}' for nome, valor in cabecalhos.items()]
+            conexao.escritor.write(('\r\n'.join(linhas) + '\r\n\r\n').encode('latin-1'))
+            await self._esperar(conexao.escritor.drain())
+            status, resposta = await self._esperar(self._ler_cabecalhos(conexao))
+        except BaseException as e:
+            # Qualquer falha (inclusive ao conectar ou cancelamento) devolve a vaga do host
+            if conexao is not None:
+                conexao.fechar()
+            semaforo.release()
+            if reaproveitada and isinstance(e, (OSError, asyncio.IncompleteReadError)):
+                # O servidor pode ter fechado a conexão ociosa: tenta uma nova
+                return await self.requisitar(url, cabecalhos)
+            raise
+        return status, resposta, _Corpo(self, destino, conexao, status, resposta)
+
+    async def _esperar(self, leitura):
+        # Nenhuma leitura fica presa além de `timeout` num servidor que parou de responder
+        return await asyncio.wait_for(leitura, self.timeout)
+
+    async def _ler_cabecalhos(self, conexao):
+        linha_status = await conexao.leitor.readuntil(b'\r\n')
+        status = int(linha_status.split()[1])
+        cabecalhos = {}
+        while True:
+            linha = await conexao.leitor.readuntil(b'\r\n')
+            if linha == b'\r\n':
+                break
+            nome, _, valor = linha.decode('latin-1').partition(':')
+            cabecalhos[nome.strip().lower()] = valor.strip()
+        return status, cabecalhos
+
+    async def fechar(self):
+        for conexoes in self._livres.values():
+            for conexao in conexoes:
+                conexao.fechar()
+        self._livres.clear()
+
+
+async def _gravar_corpo(corpo, destino, compactado):
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=destino.parent, prefix=destino.name, suffix='.tmp')
+    # wbits 16 + MAX_WBITS: formato gzip
+    descompactador = zlib.decompressobj(16 + zlib.MAX_WBITS) if compactado else None
+    recebidos = 0
+    try:
+        with os.fdopen(fd, 'wb') as arquivo:
+            async for bloco in corpo:
+                recebidos += len(bloco)
+                arquivo.write(descompactador.decompress(bloco) if descompactador else bloco)
+            if descompactador:
+                arquivo.write(descompactador.flush())
+        os.replace(temporario, destino)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    return recebidos
+
+
+async def _descartar(corpo):
+    async for _ in corpo:
+        pass
+
+
+async def baixar(pool, endereco, diretorio_cache=None, tentativas=TENTATIVAS,
+                 espera_inicial=ESPERA_INICIAL):
+    """Baixa (ou revalida) `endereco` para o cache local, com novas tentativas."""
+    diretorio = Path(diretorio_cache) if diretorio_cache else dados.diretorio_cache_padrao()
+    arquivo, caminho_meta = dados.caminhos_cache(endereco, diretorio)
+    meta = dados.ler_meta(caminho_meta) if arquivo.exists() else {}
+    # Mesmo nome de arquivo vindo de outro endereço: a cópia local não serve
+    if meta.get('endereco', endereco) != endereco:
+        meta = {}
+    tamanho_local = arquivo.stat().st_size if meta else 0
+
+    cabecalhos = {}
+    if meta.get('etag'):
+        cabecalhos['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        cabecalhos['If-Modified-Since'] = meta['last_modified']
+
+    for tentativa in range(tentativas):
+        try:
+            url = endereco
+            for _ in range(MAX_REDIRECIONAMENTOS + 1):
+                status, resposta, corpo = await pool.requisitar(url, cabecalhos)
+                if status in (301, 302, 303, 307, 308) and 'location' in resposta:
+                    await _descartar(corpo)
+                    url = urljoin(url, resposta['location'])
+                    continue
+                break
+
+            if status == 304 and meta:
+                await _descartar(corpo)
+                meta['baixado_em'] = time.time()
+                caminho_meta.write_text(json.dumps(meta), encoding='utf-8')
+                return dados.ResultadoCache(arquivo, 'revalidado', 0, tamanho_local)
+            if status != 200:
+                await _descartar(corpo)
+                raise ErroHTTP(status, url)
+
+            compactado = resposta.get('content-encoding', '').lower() == 'gzip'
+            try:
+                with etapa('download_async', endereco=endereco, tentativa=tentativa + 1):
+                    recebidos = await _gravar_corpo(corpo, arquivo, compactado)
+            finally:
+                # Falha antes de ler o corpo (ex.: ao criar o arquivo temporário)
+                # também devolve a conexão e a vaga do host
+                await corpo.aclose()
+            caminho_meta.write_text(json.dumps({
+                'endereco': endereco,
+                'etag': resposta.get('etag'),
+                'last_modified': resposta.get('last-modified'),
+                'baixado_em': time.time(),
+                'tamanho': arquivo.stat().st_size,
+            }), encoding='utf-8')
+            return dados.ResultadoCache(arquivo, 'miss', recebidos, 0)
+
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ErroHTTP) as e:
+            temporario = isinstance(e, ErroHTTP) and e.status in STATUS_TEMPORARIOS
+            if (isinstance(e, ErroHTTP) and not temporario) or tentativa + 1 == tentativas:
+                raise
+            # Espera exponencial com variação aleatória para não sincronizar
+            espera = espera_inicial * 2 ** tentativa * (1 + random.random())
+            print(f'Falha ao baixar {endereco} ({e}); nova tentativa em {espera:.1f}s')
+            await asyncio.sleep(espera)
+
+
+async def baixar_varios(enderecos, diretorio_cache=None, limite_por_host=CONEXOES_POR_HOST,
+                        **opcoes):
+    """Baixa todos os `enderecos` ao mesmo tempo; devolve {endereco: ResultadoCache ou erro}."""
+    pool = PoolConexoes(limite_por_host)
+    try:
+        resultados = await asyncio.gather(
+            *(baixar(pool, endereco, diretorio_cache, **opcoes) for endereco in enderecos),
+            return_exceptions=True)
+    finally:
+        await pool.fechar()
+    return dict(zip(enderecos, resultados))
+
+
+def obter_arquivos(nomes_ou_enderecos, **opcoes):
+    """Versão síncrona de baixar_varios; aceita atalhos de CONJUNTOS_ISP ou URLs."""
+    enderecos = [CONJUNTOS_ISP.get(nome, nome) for nome in nomes_ou_enderecos]
+    resultados = asyncio.run(baixar_varios(enderecos, **opcoes))
+    for endereco, resultado in resultados.items():
+        if isinstance(resultado, BaseException):
+            print(f'Erro ao baixar {endereco}: {resultado}')
+        else:
+            print(f'{endereco}: {resultado.resumo()}')
+    return resultados
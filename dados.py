@@ -0,0 +1,375 @@
+# Camada compartilhada de obtenção dos dados do ISP (Instituto de Segurança Pública)
+#
+# Em vez de cada script baixar o CSV inteiro a cada execução, o arquivo é
+# guardado em disco (cache local) e revalidado com o servidor usando os
+# cabeçalhos HTTP ETag / Last-Modified. Se o servidor responder 304 (Not
+# Modified), usamos a cópia local sem baixar nada de novo.
+#
+# Variáveis de ambiente:
+#   ISP_CACHE_DIR  - diretório do cache (padrão: ~/.cache/isp_dados)
+#   ISP_CACHE_TTL  - segundos em que a cópia local é considerada fresca sem
+#                    nem consultar o servidor (padrão: 0, sempre revalida)
+#   ISP_OFFLINE    - se "1", nunca acessa a rede, usa somente a cópia local
+#   ISP_ENDERECO   - endereço alternativo dos dados (outro servidor HTTP ou
+#                    um arquivo local, útil para testes com um arquivo fixo)
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+from instrumentacao import etapa
+
+# pyarrow é opcional: sem ele, os dados são sempre lidos do CSV
+# pip install pyarrow
+try:
+    import pyarrow.feather as feather
+except ImportError:  # pragma: no cover
+    feather = None
+
+
+ENDERECO_DADOS = "https://www.ispdados.rj.gov.br/Arquivos/BaseDPEvolucaoMensalCisp.csv"
+
+# Configurações de leitura do CSV do ISP
+SEPARADOR = ';'
+CODIFICACAO = 'iso-8859-1'
+
+TAMANHO_BLOCO = 1024 * 1024
+TAMANHO_BLOCO_HASH = 1024 * 1024
+
+# Tipos declarados de antemão para as colunas de identificação do CSV.
+# Sem isso o pandas guarda os textos como objetos Python e infere int64
+# para tudo; os indicadores podem ter seus tipos passados por quem chama.
+TIPOS_PADRAO = {
+    'cisp': 'int32',
+    'mes': 'int8',
+    'ano': 'int16',
+    'aisp': 'int32',
+    'risp': 'int32',
+    'mcirc': 'int32',
+    'munic': 'category',
+    'regiao': 'category',
+    'mes_ano': 'category',
+}
+
+# Colunas que identificam a linha (delegacia, período, região...) e portanto
+# NÃO são indicadores de criminalidade, mesmo sendo numéricas
+COLUNAS_IDENTIFICACAO = (*TIPOS_PADRAO, 'fase')
+
+# Número de linhas por bloco na leitura em blocos (chunks)
+LINHAS_POR_BLOCO = 200_000
+
+
+@dataclass
+class ResultadoCache:
+    # caminho do arquivo local que deve ser lido
+    caminho: Path
+    # 'hit' (cópia fresca pelo TTL), 'revalidado' (304 do servidor),
+    # 'miss' (baixado agora), 'offline' (sem rede, cópia local) ou 'local'
+    # (o endereço já era um arquivo em disco)
+    situacao: str
+    bytes_baixados: int = 0
+    bytes_economizados: int = 0
+
+    @property
+    def acerto(self):
+        return self.situacao in ('hit', 'revalidado', 'offline', 'local')
+
+    def resumo(self):
+        return (f'Cache: {self.situacao} | baixados: {self.bytes_baixados} bytes'
+                f' | economizados: {self.bytes_economizados} bytes')
+
+
+def diretorio_cache_padrao():
+    return Path(os.environ.get('ISP_CACHE_DIR', Path.home() / '.cache' / 'isp_dados'))
+
+
+def _ttl_padrao():
+    return float(os.environ.get('ISP_CACHE_TTL', '0'))
+
+
+def _offline_padrao():
+    return os.environ.get('ISP_OFFLINE', '') == '1'
+
+
+def _eh_remoto(endereco):
+    return str(endereco).startswith(('http://', 'https://'))
+
+
+def caminhos_cache(endereco, diretorio):
+    """Caminhos da cópia local de `endereco` e do seu .meta.json dentro de `diretorio`."""
+    nome = str(endereco).rstrip('/').rsplit('/', 1)[-1] or 'dados.csv'
+    arquivo = Path(diretorio) / nome
+    return arquivo, arquivo.with_name(arquivo.name + '.meta.json')
+
+
+def ler_meta(caminho_meta):
+    """Conteúdo de um .meta.json, ou {} se não existir ou estiver corrompido."""
+    try:
+        return json.loads(caminho_meta.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def _baixar(resposta, destino):
+    # Grava em arquivo temporário e só depois renomeia, para que uma queda no
+    # meio do download nunca deixe uma cópia corrompida no cache
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=destino.parent, prefix=destino.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as arquivo:
+            shutil.copyfileobj(resposta, arquivo, TAMANHO_BLOCO)
+        os.replace(temporario, destino)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    return destino.stat().st_size
+
+
+def endereco_padrao():
+    return os.environ.get('ISP_ENDERECO', ENDERECO_DADOS)
+
+
+def obter_arquivo(endereco=None, diretorio_cache=None, ttl=None,
+                  offline=None, timeout=60):
+    """Garante uma cópia local atualizada de `endereco` e diz como foi obtida."""
+    endereco = endereco or endereco_padrao()
+    if not _eh_remoto(endereco):
+        caminho = Path(str(endereco).removeprefix('file://'))
+        return ResultadoCache(caminho, 'local')
+
+    diretorio = Path(diretorio_cache) if diretorio_cache else diretorio_cache_padrao()
+    ttl = _ttl_padrao() if ttl is None else ttl
+    offline = _offline_padrao() if offline is None else offline
+
+    arquivo, caminho_meta = caminhos_cache(endereco, diretorio)
+    meta = ler_meta(caminho_meta) if arquivo.exists() else {}
+    # Mesmo nome de arquivo vindo de outro endereço: a cópia local não serve
+    if meta.get('endereco', endereco) != endereco:
+        meta = {}
+    tamanho_local = arquivo.stat().st_size if meta else 0
+
+    if offline:
+        if not meta:
+            raise FileNotFoundError(f'Modo offline e sem cópia local de {endereco} em {diretorio}')
+        return ResultadoCache(arquivo, 'offline', 0, tamanho_local)
+
+    if meta and ttl > 0 and time.time() - meta.get('baixado_em', 0) < ttl:
+        return ResultadoCache(arquivo, 'hit', 0, tamanho_local)
+
+    requisicao = urllib.request.Request(endereco)
+    if meta.get('etag'):
+        requisicao.add_header('If-None-Match', meta['etag'])
+    if meta.get('last_modified'):
+        requisicao.add_header('If-Modified-Since', meta['last_modified'])
+
+    try:
+        with urllib.request.urlopen(requisicao, timeout=timeout) as resposta:
+            tamanho = _baixar(resposta, arquivo)
+            novo_meta = {
+                'endereco': endereco,
+                'etag': resposta.headers.get('ETag'),
+                'last_modified': resposta.headers.get('Last-Modified'),
+                'baixado_em': time.time(),
+                'tamanho': tamanho,
+            }
+    except urllib.error.HTTPError as e:
+        if e.code != 304 or not meta:
+            raise
+        meta['baixado_em'] = time.time()
+        caminho_meta.write_text(json.dumps(meta), encoding='utf-8')
+        return ResultadoCache(arquivo, 'revalidado', 0, tamanho_local)
+
+    caminho_meta.write_text(json.dumps(novo_meta), encoding='utf-8')
+    return ResultadoCache(arquivo, 'miss', tamanho, 0)
+
+
+def obter_fonte(endereco=None, **opcoes_cache):
+    """obter_arquivo dentro da etapa 'download', com o resumo do cache impresso."""
+    with etapa('download'):
+        resultado = obter_arquivo(endereco, **opcoes_cache)
+    print(resultado.resumo())
+    return resultado
+
+
+def impressao_digital(caminho):
+    """SHA-256 do arquivo, recalculado só quando tamanho ou data de modificação mudam."""
+    caminho = Path(caminho)
+    estado = caminho.stat()
+    assinatura = {'tamanho': estado.st_size, 'modificado_ns': estado.st_mtime_ns}
+    caminho_hash = caminho.with_name(caminho.name + '.sha256.json')
+    try:
+        guardado = json.loads(caminho_hash.read_text(encoding='utf-8'))
+        if guardado['assinatura'] == assinatura:
+            return guardado['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO_HASH), b''):
+            sha.update(bloco)
+    try:
+        caminho_hash.write_text(json.dumps({'assinatura': assinatura, 'sha256': sha.hexdigest()}),
+                                encoding='utf-8')
+    except OSError:
+        # Arquivo de dados em diretório somente leitura: só não guardamos o hash
+        pass
+    return sha.hexdigest()
+
+
+def tipar_colunas(df):
+    """Converte textos repetidos em categóricos e contagens em inteiros compactos."""
+    df = df.copy()
+    for coluna in df.columns:
+        serie = df[coluna]
+        if pd.api.types.is_numeric_dtype(serie):
+            if pd.api.types.is_integer_dtype(serie):
+                df[coluna] = pd.to_numeric(serie, downcast='integer')
+            elif serie.notna().all() and (serie % 1 == 0).all():
+                df[coluna] = pd.to_numeric(serie.astype('int64'), downcast='integer')
+            else:
+                df[coluna] = pd.to_numeric(serie, downcast='float')
+        else:
+            df[coluna] = serie.astype('category')
+    return df
+
+
+def caminho_snapshot(caminho_csv, diretorio_cache=None):
+    # O caminho completo entra no nome: dois x.csv em pastas diferentes não
+    # dividem o mesmo snapshot
+    diretorio = Path(diretorio_cache) if diretorio_cache else diretorio_cache_padrao()
+    caminho_csv = Path(caminho_csv).resolve()
+    sufixo = hashlib.sha256(str(caminho_csv).encode('utf-8')).hexdigest()[:12]
+    return diretorio / f'{caminho_csv.name}.{sufixo}.feather'
+
+
+def _assinatura_csv(caminho_csv):
+    caminho_csv = Path(caminho_csv).resolve()
+    estado = caminho_csv.stat()
+    return {'arquivo': str(caminho_csv), 'tamanho': estado.st_size,
+            'modificado_ns': estado.st_mtime_ns}
+
+
+def _caminho_meta_snapshot(caminho_snap):
+    return caminho_snap.with_name(caminho_snap.name + '.meta.json')
+
+
+def snapshot_atualizado(caminho_csv, caminho_snap):
+    """O snapshot existe e foi gerado deste CSV, com o mesmo tamanho e data de modificação."""
+    return (caminho_snap.exists()
+            and ler_meta(_caminho_meta_snapshot(caminho_snap)) == _assinatura_csv(caminho_csv))
+
+
+def gerar_snapshot(caminho_csv, caminho_snap):
+    """Lê o CSV uma única vez e grava um snapshot colunar (Feather/Arrow) tipado."""
+    if feather is None:
+        raise ImportError('pyarrow é necessário para gerar o snapshot (pip install pyarrow)')
+    df = tipar_colunas(pd.read_csv(caminho_csv, sep=SEPARADOR, encoding=CODIFICACAO))
+    caminho_snap.parent.mkdir(parents=True, exist_ok=True)
+    temporario = caminho_snap.with_name(caminho_snap.name + '.tmp')
+    assinatura = _assinatura_csv(caminho_csv)
+    # Sem compressão, para que o arquivo possa ser lido por memory-map
+    feather.write_feather(df, temporario, compression='uncompressed')
+    os.replace(temporario, caminho_snap)
+    _caminho_meta_snapshot(caminho_snap).write_text(json.dumps(assinatura), encoding='utf-8')
+    return df
+
+
+def ler_snapshot(caminho_snap, colunas=None):
+    """Lê somente as `colunas` pedidas do snapshot, com memory-map."""
+    tabela = feather.read_table(caminho_snap, columns=colunas, memory_map=True)
+    return tabela.to_pandas()
+
+
+def colunas_arquivo(caminho):
+    """Nomes das colunas do CSV, sem ler as linhas."""
+    return list(pd.read_csv(caminho, sep=SEPARADOR, encoding=CODIFICACAO, nrows=0).columns)
+
+
+def colunas_indicadores(df):
+    """Lista as colunas numéricas de `df` que são indicadores (roubo_veiculo, ...)."""
+    return [coluna for coluna in df.columns
+            if coluna not in COLUNAS_IDENTIFICACAO
+            and pd.api.types.is_numeric_dtype(df[coluna])]
+
+
+def _tipos_para(colunas, tipos):
+    tipos = {**TIPOS_PADRAO, **(tipos or {})}
+    if colunas is None:
+        return tipos
+    return {coluna: tipo for coluna, tipo in tipos.items() if coluna in colunas}
+
+
+def ler_csv(caminho, colunas=None, tipos=None):
+    """Lê o CSV do ISP carregando apenas `colunas`, já com os tipos declarados."""
+    return pd.read_csv(caminho, sep=SEPARADOR, encoding=CODIFICACAO,
+                       usecols=colunas, dtype=_tipos_para(colunas, tipos))
+
+
+def agregar_csv_em_blocos(caminho, valores, chave='munic', tipos=None,
+                          linhas_por_bloco=LINHAS_POR_BLOCO):
+    """Soma `valores` por `chave` lendo o CSV em blocos de tamanho fixo.
+
+    Só um bloco fica na memória por vez; cada bloco é agrupado e somado ao
+    total acumulado, então o pico de memória não depende do tamanho do arquivo.
+    A soma sai em int64/float64: os totais podem não caber no tipo compacto
+    das colunas (tipos=...).
+    """
+    colunas = [chave, *valores]
+    # A chave é lida como texto: as categorias de cada bloco seriam diferentes
+    tipos = {**_tipos_para(colunas, tipos), chave: 'str'}
+    total = None
+    blocos = pd.read_csv(caminho, sep=SEPARADOR, encoding=CODIFICACAO, usecols=colunas,
+                         dtype=tipos, chunksize=linhas_por_bloco)
+    for bloco in blocos:
+        parcial = bloco.groupby(chave).sum(numeric_only=True)
+        largos = {coluna: 'int64' if pd.api.types.is_integer_dtype(tipo) else 'float64'
+                  for coluna, tipo in parcial.dtypes.items()}
+        parcial = parcial.astype(largos)
+        total = parcial if total is None else total.add(parcial, fill_value=0)
+    if total is None:
+        return pd.DataFrame(columns=colunas)
+    # add() com fill_value devolve float quando os índices diferem: volta a int64
+    return total[list(valores)].astype(largos).sort_index().reset_index()
+
+
+def agregar_ocorrencias(valores, chave='munic', endereco=None, tipos=None,
+                        linhas_por_bloco=LINHAS_POR_BLOCO, **opcoes_cache):
+    """Totaliza `valores` por `chave` direto do CSV em cache, em blocos."""
+    with etapa('download'):
+        resultado = obter_arquivo(endereco, **opcoes_cache)
+    print(resultado.resumo())
+    with etapa('leitura_agregacao', origem='csv_blocos'):
+        return agregar_csv_em_blocos(resultado.caminho, valores, chave, tipos, linhas_por_bloco)
+
+
+def ler_ocorrencias(endereco=None, colunas=None, tipos=None, usar_snapshot=True, arquivo=None,
+                    **opcoes_cache):
+    """Lê os dados do ISP a partir do cache local, baixando/revalidando se preciso.
+
+    Com pyarrow instalado, o CSV é convertido uma vez em snapshot colunar e as
+    leituras seguintes carregam só as `colunas` pedidas direto do snapshot.
+    Sem pyarrow, o CSV é lido só com as `colunas` pedidas e seus `tipos`.
+    `arquivo` é um ResultadoCache já obtido por quem chama (sem revalidar de novo).
+    """
+    resultado = arquivo or obter_fonte(endereco, **opcoes_cache)
+
+    if usar_snapshot and feather is not None:
+        caminho_snap = caminho_snapshot(resultado.caminho, opcoes_cache.get('diretorio_cache'))
+        if not snapshot_atualizado(resultado.caminho, caminho_snap):
+            with etapa('leitura', origem='csv_para_snapshot'):
+                df = gerar_snapshot(resultado.caminho, caminho_snap)
+            return df[colunas] if colunas else df
+        with etapa('leitura', origem='snapshot'):
+            return ler_snapshot(caminho_snap, colunas)
+
+    with etapa('leitura', origem='csv'):
+        return ler_csv(resultado.caminho, colunas, tipos)
@@ -0,0 +1,253 @@
+# Medidas de estatística descritiva usadas nos relatórios de ocorrências
+#
+# Antes cada script calculava média, mediana, quartis, IQR e limites com
+# chamadas separadas (np.median, três np.quantile, np.max, np.min), e cada
+# uma delas percorria ou particionava o array de novo. Aqui todas as medidas
+# de posição saem de UMA chamada np.quantile com um vetor de probabilidades.
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import pandas as pd
+
+from agregacao import filtrar_periodo
+from dados import colunas_indicadores, ler_ocorrencias
+from instrumentacao import etapa
+
+
+# Probabilidades calculadas de uma vez: mínimo, Q1, Q2 (mediana), Q3, máximo
+PROBABILIDADES = (0.0, 0.25, 0.50, 0.75, 1.0)
+
+# Multiplicador do IQR usado para os limites de outliers (regra de Tukey)
+MULTIPLICADOR_IQR = 1.5
+
+
+@dataclass(frozen=True)
+class MedidasEstatisticas:
+    media: float
+    mediana: float
+    distancia: float
+    minimo: float
+    q1: float
+    q2: float
+    q3: float
+    maximo: float
+    amplitude_total: float
+    iqr: float
+    limite_inferior: float
+    limite_superior: float
+    # Erro de rank dos quantis: 0 quando exatos (np.quantile), maior que 0
+    # quando vêm de um esboço aproximado (ver quantis_aproximados.py)
+    erro_rank: float = 0.0
+
+    def como_dict(self):
+        return asdict(self)
+
+
+def calcular_medidas(valores, metodo='weibull', multiplicador=MULTIPLICADOR_IQR):
+    """Calcula todas as medidas descritivas de `valores` em uma só passada de quantis."""
+    array = np.asarray(valores)
+    with etapa('estatisticas', n=len(array)):
+        minimo, q1, q2, q3, maximo = np.quantile(array, PROBABILIDADES, method=metodo)
+        media = np.mean(array)
+    # Mínimo e máximo são valores do próprio array: mantêm o tipo original
+    minimo, maximo = array.dtype.type(minimo), array.dtype.type(maximo)
+    # Com o método weibull (e os demais métodos contínuos), Q2 é a mediana
+    mediana = q2
+
+    # Distância relativa entre média e mediana (medida de assimetria)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distancia = abs((media - mediana) / mediana)
+
+    iqr = q3 - q1
+    return MedidasEstatisticas(
+        media=media,
+        mediana=mediana,
+        distancia=distancia,
+        minimo=minimo,
+        q1=q1,
+        q2=q2,
+        q3=q3,
+        maximo=maximo,
+        amplitude_total=maximo - minimo,
+        iqr=iqr,
+        limite_inferior=q1 - (multiplicador * iqr),
+        limite_superior=q3 + (multiplicador * iqr),
+    )
+
+
+@dataclass
+class AnaliseIndicador:
+    # Tudo o que os exemplos imprimem para um indicador totalizado por município
+    df_agrupado: pd.DataFrame
+    medidas: MedidasEstatisticas
+    menores: pd.DataFrame
+    maiores: pd.DataFrame
+    outliers_inferiores: pd.DataFrame
+    outliers_superiores: pd.DataFrame
+
+
+def analisar_indicador(df_agrupado, indicador, metodo='weibull', multiplicador=MULTIPLICADOR_IQR):
+    """Medidas, municípios abaixo de Q1/acima de Q3 e outliers de um indicador.
+
+    Os DataFrames já saem ordenados: menores e outliers inferiores do menor
+    para o maior valor, maiores e outliers superiores do maior para o menor.
+    """
+    valores = df_agrupado[indicador].to_numpy()
+    medidas = calcular_medidas(valores, metodo, multiplicador)
+    extremos = selecionar_extremos(valores, medidas, k=0)
+    return AnaliseIndicador(
+        df_agrupado=df_agrupado,
+        medidas=medidas,
+        menores=df_agrupado.iloc[extremos.abaixo_q1],
+        maiores=df_agrupado.iloc[extremos.acima_q3],
+        outliers_inferiores=df_agrupado.iloc[extremos.outliers_inferiores],
+        outliers_superiores=df_agrupado.iloc[extremos.outliers_superiores],
+    )
+
+
+# ##### SELEÇÃO DOS EXTREMOS #####
+# Os relatórios filtravam abaixo de Q1/acima de Q3 e ordenavam cada parte
+# com sort_values; os gráficos ordenavam de novo e pegavam head(10). Aqui
+# uma passada com máscaras separa os conjuntos e só eles são ordenados (um
+# quarto dos dados cada); os outliers são o começo desses conjuntos já
+# ordenados e os k menores/maiores saem de np.argpartition, em O(n), quando
+# não cabem nos conjuntos. Tudo em posições (para .iloc ou indexação numpy).
+
+TOP_K_PADRAO = 10
+
+
+@dataclass
+class Extremos:
+    # Posições em ordem crescente de valor
+    menores_k: np.ndarray
+    abaixo_q1: np.ndarray
+    outliers_inferiores: np.ndarray
+    # Posições em ordem decrescente de valor
+    maiores_k: np.ndarray
+    acima_q3: np.ndarray
+    outliers_superiores: np.ndarray
+
+
+def _ordenar(valores, posicoes, decrescente=False):
+    # Estável: empates ficam na ordem original das linhas
+    chave = -valores[posicoes] if decrescente else valores[posicoes]
+    return posicoes[np.argsort(chave, kind='stable')]
+
+
+def _k_menores(valores, k, decrescente=False):
+    n = len(valores)
+    if k >= n:
+        return _ordenar(valores, np.arange(n), decrescente)
+    if decrescente:
+        candidatos = np.argpartition(valores, n - k)[n - k:]
+    else:
+        candidatos = np.argpartition(valores, k - 1)[:k]
+    return _ordenar(valores, candidatos, decrescente)
+
+
+def selecionar_extremos(valores, medidas, k=TOP_K_PADRAO):
+    """k menores/maiores, conjuntos abaixo de Q1/acima de Q3 e outliers, já ordenados."""
+    if k < 0:
+        raise ValueError(f'k deve ser maior ou igual a zero: {k}')
+    valores = np.asarray(valores)
+    abaixo_q1 = _ordenar(valores, np.flatnonzero(valores < medidas.q1))
+    acima_q3 = _ordenar(valores, np.flatnonzero(valores > medidas.q3), decrescente=True)
+    # Limite inferior < Q1 e limite superior > Q3: os outliers são prefixos
+    n_inferiores = np.searchsorted(valores[abaixo_q1], medidas.limite_inferior, side='left')
+    n_superiores = np.searchsorted(-valores[acima_q3], -medidas.limite_superior, side='left')
+
+    k = min(k, len(valores))
+    menores_k = abaixo_q1[:k] if k <= len(abaixo_q1) else _k_menores(valores, k)
+    maiores_k = acima_q3[:k] if k <= len(acima_q3) else _k_menores(valores, k, decrescente=True)
+    return Extremos(
+        menores_k=menores_k,
+        abaixo_q1=abaixo_q1,
+        outliers_inferiores=abaixo_q1[:n_inferiores],
+        maiores_k=maiores_k,
+        acima_q3=acima_q3,
+        outliers_superiores=acima_q3[:n_superiores],
+    )
+
+
+# ##### ANÁLISE EM LOTE #####
+# Em vez de repetir o script para cada indicador (e baixar/agrupar tudo de
+# novo a cada vez), agrupamos por município UMA vez sobre todas as colunas
+# numéricas e calculamos quartis, limites e outliers da matriz inteira
+# (municípios x indicadores) com np.quantile(..., axis=0).
+
+@dataclass
+class ResultadoLote:
+    # Uma linha por indicador, colunas com as medidas (limite_inferior, q1...)
+    medidas: pd.DataFrame
+    # Formato longo: indicador, chave (ex.: munic), valor e tipo do outlier
+    # ('inferior' ou 'superior')
+    outliers: pd.DataFrame
+
+
+def calcular_medidas_matriz(matriz, metodo='weibull', multiplicador=MULTIPLICADOR_IQR):
+    """Versão vetorizada de calcular_medidas: uma coluna de `matriz` por indicador."""
+    matriz = np.asarray(matriz)
+    minimo, q1, q2, q3, maximo = np.quantile(matriz, PROBABILIDADES, axis=0, method=metodo)
+    media = np.mean(matriz, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distancia = np.abs((media - q2) / q2)
+    iqr = q3 - q1
+    return {
+        'media': media,
+        'mediana': q2,
+        'distancia': distancia,
+        'minimo': minimo,
+        'q1': q1,
+        'q2': q2,
+        'q3': q3,
+        'maximo': maximo,
+        'amplitude_total': maximo - minimo,
+        'iqr': iqr,
+        'limite_inferior': q1 - (multiplicador * iqr),
+        'limite_superior': q3 + (multiplicador * iqr),
+    }
+
+
+def analisar_indicadores(df_agrupado, chave='munic', indicadores=None, metodo='weibull',
+                         multiplicador=MULTIPLICADOR_IQR):
+    """Medidas e outliers de todos os `indicadores` de um DataFrame já totalizado por `chave`."""
+    if indicadores is None:
+        indicadores = [coluna for coluna in df_agrupado.columns
+                       if coluna != chave and pd.api.types.is_numeric_dtype(df_agrupado[coluna])]
+    matriz = df_agrupado[indicadores].to_numpy()
+    with etapa('estatisticas_lote', linhas=matriz.shape[0], indicadores=len(indicadores)):
+        medidas = calcular_medidas_matriz(matriz, metodo, multiplicador)
+    df_medidas = pd.DataFrame(medidas, index=pd.Index(indicadores, name='indicador'))
+
+    # Máscaras booleanas da matriz inteira, comparando cada coluna com seus limites
+    inferiores = matriz < medidas['limite_inferior']
+    superiores = matriz > medidas['limite_superior']
+    linhas, colunas = np.nonzero(inferiores | superiores)
+    nomes = df_agrupado[chave].to_numpy()
+    df_outliers = pd.DataFrame({
+        'indicador': np.asarray(indicadores, dtype=object)[colunas],
+        chave: nomes[linhas],
+        'valor': matriz[linhas, colunas],
+        'tipo': np.where(superiores[linhas, colunas], 'superior', 'inferior'),
+    })
+    df_outliers = df_outliers.sort_values(['indicador', 'tipo', 'valor'], ignore_index=True)
+    return ResultadoLote(df_medidas, df_outliers)
+
+
+def analisar_ocorrencias(indicadores=None, chave='munic', metodo='weibull',
+                         multiplicador=MULTIPLICADOR_IQR, populacao=None, inicio=None, fim=None,
+                         **opcoes_leitura):
+    """Lê os dados uma vez, totaliza por `chave` e analisa todos os indicadores.
+
+    Só entram os meses entre `inicio` e `fim` ('AAAA-MM', inclusive). Com
+    `populacao` (uma taxas.TabelaPopulacao), os totais viram taxas por 100
+    mil habitantes antes da análise.
+    """
+    df = filtrar_periodo(ler_ocorrencias(**opcoes_leitura), inicio, fim)
+    if indicadores is None:
+        indicadores = colunas_indicadores(df)
+    with etapa('agregacao', linhas=len(df), indicadores=len(indicadores)):
+        df_agrupado = df[[chave, *indicadores]].groupby(chave, observed=True).sum().reset_index()
+    if populacao is not None:
+        df_agrupado = populacao.taxas(df_agrupado, indicadores, chave)
+    return analisar_indicadores(df_agrupado, chave, indicadores, metodo, multiplicador)
@@ -1,27 +1,39 @@
 # Importa a biblioteca Matplotlib para criar os gráficos
 # pip install matplotlib
 import matplotlib.pyplot as plt
-import pandas as pd
 import numpy as np
+import argparse
 
+from agregacao import adicionar_argumentos_periodo, totalizar_ocorrencias
+from estatisticas import calcular_medidas, selecionar_extremos
+from graficos import adicionar_argumento_salvar, mostrar_ou_salvar, usar_modo_headless
+
+
+# Argumentos de linha de comando
+# --from e --to limitam o período analisado (ex.: --from 2023-01 --to 2023-12)
+parser = adicionar_argumentos_periodo(argparse.ArgumentParser())
+# --salvar grafico.png gera o gráfico em arquivo, sem abrir janela (servidores)
+parser = adicionar_argumento_salvar(parser)
+args = parser.parse_args()
+if args.salvar:
+    usar_modo_headless()
 
 try:
     print("Obtendo dados...")
-    ENDERECO_DADOS = "https://www.ispdados.rj.gov.br/Arquivos/BaseDPEvolucaoMensalCisp.csv"
 
     # Buscar a base de dados CSV online do site ISP (Instituto de Segurança Pública)
+    # O arquivo fica guardado em cache local (ver dados.py) e só é baixado de
+    # novo quando o ISP publica uma versão nova.
     # encoding='iso-8859-1' - Codificação dos caracteres com acentuação
     # outras opções: utf-8, iso-8859-1, latin1, cp1252
     # encodings principais: https://docs.python.org/3/library/codecs.html#standard-encodings
-    df_ocorrencias = pd.read_csv(ENDERECO_DADOS, sep=';', encoding='iso-8859-1')
-
-    # Demilitando somente as variáveis do Exemplo01: munic e roubo_veiculo
-    df_ocorrencias = df_ocorrencias[['munic', 'roubo_veiculo']]
 
     # Totalizar roubo de veiculo por municipio (agrupar e somar)
-    # reset_index(), traz de volta os índices que numera as colunas, pois se
-    # perdem nesta operação
-    df_roubo_veiculo = df_ocorrencias.groupby('munic').sum(['roubo_veiculo']).reset_index()
+    # Somente as variáveis do Exemplo01 são usadas: munic e roubo_veiculo
+    # As somas por município e mês ficam guardadas (ver agregacao.py): a cada
+    # execução só os meses novos são somados, e o período pedido em
+    # --from/--to é totalizado a partir dessas somas parciais.
+    df_roubo_veiculo = totalizar_ocorrencias(['roubo_veiculo'], inicio=args.inicio, fim=args.fim)
 
     # Printando as linhas iniciais com o método head() apenas para ver se os dados
     # foram obtidos corretamente
@@ -49,13 +61,18 @@ try:
     # Uso do array significa ganho computacional
     array_roubo_veiculo = np.array(df_roubo_veiculo['roubo_veiculo'])
 
+    # Todas as medidas abaixo são calculadas de uma vez pelo módulo
+    # estatisticas.py (uma única chamada np.quantile para mínimo, quartis e
+    # máximo). Aqui apenas explicamos e usamos cada uma delas.
+    medidas = calcular_medidas(array_roubo_veiculo, metodo='weibull')
+
     # Obtendo média de roubo_veiculo
-    media_roubo_veiculo = np.mean(array_roubo_veiculo)
+    media_roubo_veiculo = medidas.media
 
     # Obtendo mediana de roubo_veiculo
     # Mediana é o valor que divide a distribuição em duas partes iguais
     # (50% dos dados estão abaixo e 50% acima)
-    mediana_roubo_veiculo = np.median(array_roubo_veiculo)
+    mediana_roubo_veiculo = medidas.mediana
 
     # Distânicia entre média e mediana
     # A distância entre a média e a mediana é uma medida de assimetria
@@ -71,7 +88,7 @@ try:
     # influência de valores extremos. Se a distância for maior que 0.25, a
     # distribuição tende a ser assimétrica forte. A tendência é, que nestes 
     # caso, a média esteja sofrendo influência de valores extremos.
-    distancia = abs((media_roubo_veiculo-mediana_roubo_veiculo) / mediana_roubo_veiculo)
+    distancia = medidas.distancia
 
     # Medidas de tendência central
     # Se a média for muito diferente da mediana, distribuição é assimétrica. 
@@ -100,9 +117,9 @@ try:
     # q1 = np.quantile(array_roubo_veiculo, 0.25)
     # q2 = np.quantile(array_roubo_veiculo, 0.50)
     # q3 = np.quantile(array_roubo_veiculo, 0.75)
-    q1 = np.quantile(array_roubo_veiculo, 0.25, method='weibull') # Q1 é 25% 
-    q2 = np.quantile(array_roubo_veiculo, 0.50, method='weibull') # Q2 é 50% (mediana)
-    q3 = np.quantile(array_roubo_veiculo, 0.75, method='weibull') # Q3 é 75%
+    q1 = medidas.q1 # Q1 é 25% 
+    q2 = medidas.q2 # Q2 é 50% (mediana)
+    q3 = medidas.q3 # Q3 é 75%
 
     # print('\nMedidas de posição: ')
     # print(30*'-')
@@ -119,22 +136,27 @@ try:
     # Serve para identificar a variabilidade dos dados. Quanto maior a
     # amplitude, maior a variabilidade. Quanto mais perto do zero, menor
     # a variabilidade.
-    maximo = np.max(array_roubo_veiculo)
-    minimo = np.min(array_roubo_veiculo)
-    amplitude_total = maximo - minimo
+    maximo = medidas.maximo
+    minimo = medidas.minimo
+    amplitude_total = medidas.amplitude_total
 
     # OBTENDO OS MUNÍCIPIOS COM MAIORES E MONORES NÚMEROS DE ROUBOS DE VEÍCULOS
-    # Filtramos os registros do DataFrame df_roubo_veiculo para achar os municípios
-    # com menores e maiores números de roubos de veículos.
-    df_roubo_veiculo_menores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] < q1]
-    df_roubo_veiculo_maiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] > q3]
+    # selecionar_extremos separa (com máscaras) os municípios abaixo de Q1 e
+    # acima de Q3 e ordena só esses conjuntos, sem ordenar o DataFrame inteiro
+    # (ver estatisticas.py). Os outliers são o começo desses conjuntos, então
+    # também já saem ordenados. Tudo vem em posições, para usar com .iloc
+    extremos = selecionar_extremos(array_roubo_veiculo, medidas)
+    # Do menor para o maior número de roubos
+    df_roubo_veiculo_menores = df_roubo_veiculo.iloc[extremos.abaixo_q1]
+    # Do maior para o menor número de roubos
+    df_roubo_veiculo_maiores = df_roubo_veiculo.iloc[extremos.acima_q3]
 
     print('\nMunicípios com Menores números de Roubos: ')
     print(70*'-')
-    print(df_roubo_veiculo_menores.sort_values(by='roubo_veiculo', ascending=True))
+    print(df_roubo_veiculo_menores)
     print('\nMunicípios com Maiores números de Roubos:')
     print(45*'-')
-    print(df_roubo_veiculo_maiores.sort_values(by='roubo_veiculo', ascending=False))
+    print(df_roubo_veiculo_maiores)
 
     # ##### DESCOBRIR OUTLIERS #########
     # IQR (Intervalo interquartil)
@@ -144,15 +166,15 @@ try:
     # Não sofre a interferência dos valores extremos.
     # Quanto mais próximo de zero, mais homogêneo são os dados.
     # Quanto mais próximo do q3, mais heterogêneo são os dados.
-    iqr = q3 - q1
+    iqr = medidas.iqr
 
     # Limite superior
     # Vai identificar os outliers acima de q3
-    limite_superior = q3 + (1.5 * iqr)
+    limite_superior = medidas.limite_superior
 
     # Limite inferior
     # Vai identificar os outliers abaixo de q1
-    limite_inferior = q1 - (1.5 * iqr)
+    limite_inferior = medidas.limite_inferior
 
     # print('\nLimites - Medidas de Posição')
     # print(45*'-')
@@ -181,28 +203,28 @@ try:
 
     # #### OUTLIERS
     # Obtendo os ouliers inferiores
-    # Filtrar o dataframe df_roubo_veiculo para o munics com roubo de veículo
-    # abaixo limite inferior (OUTLIERS INFERIORES)
-    df_roubo_veiculo_outliers_inferiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] < limite_inferior]
+    # Munics com roubo de veículo abaixo limite inferior (OUTLIERS INFERIORES),
+    # do menor para o maior
+    df_roubo_veiculo_outliers_inferiores = df_roubo_veiculo.iloc[extremos.outliers_inferiores]
     
     # Obtendo os ouliers superiores
-    # Filtrar o dataframe df_roubo_veiculo para o munics com roubo de veículo
-    # acima de limite superior (OUTLIERS SUPERIORES)
-    df_roubo_veiculo_outliers_superiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] > limite_superior]
+    # Munics com roubo de veículo acima de limite superior (OUTLIERS SUPERIORES),
+    # do maior para o menor
+    df_roubo_veiculo_outliers_superiores = df_roubo_veiculo.iloc[extremos.outliers_superiores]
 
     print('\nMunicípios com outliers inferiores: ')
     print(45*'-')
     if len(df_roubo_veiculo_outliers_inferiores) == 0:
         print('Não existem outliers inferiores!')
     else:
-        print(df_roubo_veiculo_outliers_inferiores.sort_values(by='roubo_veiculo', ascending=True))
+        print(df_roubo_veiculo_outliers_inferiores)
 
     print('\nMunicípios com outliers superiores: ')
     print(45*'-')
     if len(df_roubo_veiculo_outliers_superiores) == 0:
         print('Não existe outliers superiores!')
     else:
-        print(df_roubo_veiculo_outliers_superiores.sort_values(by='roubo_veiculo', ascending=False))
+        print(df_roubo_veiculo_outliers_superiores)
 
 except Exception as e:
     print(f'Erro ao obter informações sobre padrão de roubo de veículos: {e}')
@@ -220,15 +242,16 @@ try:
     # OUTLIERS INFERIORES
     # Verifica se existem outliers inferiores
     if not df_roubo_veiculo_outliers_inferiores.empty:
-        # Ordena os dados de forma crescente pelo número de roubos
-        dados_inferiores = df_roubo_veiculo_outliers_inferiores.sort_values(by='roubo_veiculo', ascending=True)
+        # Os outliers inferiores já estão em ordem crescente pelo número de roubos
+        dados_inferiores = df_roubo_veiculo_outliers_inferiores
         
         # Cria gráfico de barras horizontais com os municípios e seus valores
         ax[0].barh(dados_inferiores['munic'], dados_inferiores['roubo_veiculo'])
     
     else:
         # Caso não haja outliers inferiores, exibe os 10 municípios que obtiveram menos roubos (bootom 10)
-        dados_inferiores = df_roubo_veiculo_menores.sort_values(by='roubo_veiculo', ascending=True).head(10)
+        # (os municípios abaixo de Q1 já vêm ordenados de selecionar_extremos)
+        dados_inferiores = df_roubo_veiculo.iloc[extremos.abaixo_q1[:10]]
 
         # ax[0].text(0.5, 0.5, 'Sem Outliers Inferiores', ha='center', va='center', fontsize=12)
         barras = ax[0].bar(dados_inferiores['munic'], dados_inferiores['roubo_veiculo'], color='black')
@@ -250,8 +273,8 @@ try:
     # OUTLIERS SUPERIORES
     # Verifica se existem outliers superiores
     if not df_roubo_veiculo_outliers_superiores.empty:
-        # Ordena os dados de forma crescente
-        dados_superiores = df_roubo_veiculo_outliers_superiores.sort_values(by='roubo_veiculo', ascending=True)
+        # Os outliers superiores vêm em ordem decrescente: invertidos, ficam em ordem crescente
+        dados_superiores = df_roubo_veiculo_outliers_superiores.iloc[::-1]
 
         # Cria o gráfico de barras horizontais com os municípios e seus valores
         # ax[1].barh(dados_superiores['munic'], dados_superiores['roubo_veiculo'], color='black')
@@ -280,8 +303,8 @@ try:
     # Ajusta automaticamente os elementos do layout para não se sobreporem
     plt.tight_layout()
 
-    # Exibe os gráficos
-    plt.show()
+    # Exibe os gráficos (ou salva em arquivo, com --salvar)
+    mostrar_ou_salvar(args.salvar)
 
 except Exception as e:
     print(f'Erro ao plotar {e}')
\ No newline at end of file
@@ -1,16 +1,27 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt  # biblioteca de gráficos
+import argparse
 
-try:
-    ENDERECO_DADOS = "https://www.ispdados.rj.gov.br/Arquivos/BaseDPEvolucaoMensalCisp.csv"
-    df_ocorrencia = pd.read_csv(ENDERECO_DADOS, sep=';', encoding='iso-8859-1')
+from agregacao import adicionar_argumentos_periodo
+from memoizacao import analisar_indicador_memoizado
+from graficos import adicionar_argumento_salvar, mostrar_ou_salvar, usar_modo_headless
 
-    # Delimitando variáveis
-    df_ocorrencia = df_ocorrencia[['munic', 'roubo_veiculo']]
+# Período analisado: --from AAAA-MM --to AAAA-MM
+parser = adicionar_argumentos_periodo(argparse.ArgumentParser())
+# --salvar grafico.png gera o gráfico em arquivo, sem abrir janela (servidores)
+parser = adicionar_argumento_salvar(parser)
+args = parser.parse_args()
+if args.salvar:
+    usar_modo_headless()
 
-    # Totalizando
-    df_roubo_veiculo = df_ocorrencia.groupby('munic').sum(numeric_only=True).reset_index()
+try:
+    # CSV do ISP lido do cache local (ver dados.py)
+    # Totalizando roubo_veiculo por munic a partir das somas mensais (ver agregacao.py)
+    # Agrupamento, medidas e filtros ficam memoizados (ver memoizacao.py): se
+    # os dados não mudaram, o resultado da execução anterior é reaproveitado
+    analise = analisar_indicador_memoizado('roubo_veiculo', metodo='weibull', multiplicador=1.5,
+                                           inicio=args.inicio, fim=args.fim)
+    df_roubo_veiculo = analise.df_agrupado
     print(df_roubo_veiculo.to_string())
 
 except Exception as e:
@@ -21,36 +32,39 @@ except Exception as e:
 try:
     print('Obtendo informações sobre padrão de roubos de veículos...')
     array_roubo_veiculo = np.array(df_roubo_veiculo['roubo_veiculo'])
-    media_roubo_veiculo = np.mean(array_roubo_veiculo)
-    mediana_roubo_veiculo = np.median(array_roubo_veiculo)
-    distancia = abs((media_roubo_veiculo - mediana_roubo_veiculo) / mediana_roubo_veiculo)
+
+    # Todas as medidas de uma vez (ver estatisticas.py)
+    medidas = analise.medidas
+    media_roubo_veiculo = medidas.media
+    mediana_roubo_veiculo = medidas.mediana
+    distancia = medidas.distancia
 
     # Quartis
-    q1 = np.quantile(array_roubo_veiculo, 0.25, method='weibull')
-    q2 = np.quantile(array_roubo_veiculo, 0.50, method='weibull')
-    q3 = np.quantile(array_roubo_veiculo, 0.75, method='weibull')
+    q1 = medidas.q1
+    q2 = medidas.q2
+    q3 = medidas.q3
 
     # Medidas de dispersão
     print("\nMEDIDAS DE DISPERSÃO")
     print("~" * 67)
-    maximo = np.max(array_roubo_veiculo)
-    minimo = np.min(array_roubo_veiculo)
-    amplitude_total = maximo - minimo
+    maximo = medidas.maximo
+    minimo = medidas.minimo
+    amplitude_total = medidas.amplitude_total
 
-    # Menores roubos
-    df_roubo_veiculo_menores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] < q1]
+    # Menores roubos (menores, maiores e outliers já vêm ordenados)
+    df_roubo_veiculo_menores = analise.menores
     print('\nMunicípio com Menores números de Roubos')
-    print(df_roubo_veiculo_menores.sort_values(by='roubo_veiculo', ascending=True))
+    print(df_roubo_veiculo_menores)
 
     # Maiores roubos
-    df_roubo_veiculo_maiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] > q3]
+    df_roubo_veiculo_maiores = analise.maiores
     print('\nMunicípios com Maior números de Roubos')
-    print(df_roubo_veiculo_maiores.sort_values(by='roubo_veiculo', ascending=False))
+    print(df_roubo_veiculo_maiores)
 
     # Identificando outliers
-    iqr = q3 - q1
-    limite_superior = q3 + (1.5 * iqr)
-    limite_inferior = q1 - (1.5 * iqr)
+    iqr = medidas.iqr
+    limite_superior = medidas.limite_superior
+    limite_inferior = medidas.limite_inferior
 
     print("\nMEDIDAS")
     print("~" * 67)
@@ -67,20 +81,20 @@ try:
     print(f'Distância média e mediana: {distancia:.3f}')
 
     # Descobrindo outliers
-    df_outliers_superiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] > limite_superior]
-    df_outliers_inferiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] < limite_inferior]
+    df_outliers_superiores = analise.outliers_superiores
+    df_outliers_inferiores = analise.outliers_inferiores
 
     print('\nOutliers Inferiores')
     if df_outliers_inferiores.empty:
         print('Não há outliers inferiores')
     else:
-        print(df_outliers_inferiores.sort_values(by='roubo_veiculo', ascending=True))
+        print(df_outliers_inferiores)
 
     print('\nOutliers Superiores')
     if df_outliers_superiores.empty:
         print('Não há outliers superiores')
     else:
-        print(df_outliers_superiores.sort_values(by='roubo_veiculo', ascending=False))
+        print(df_outliers_superiores)
 
 except Exception as e:
     print(f"Erro de processamento de dados: {e}")
@@ -89,10 +103,10 @@ except Exception as e:
 # Gráfico Boxplot
 try:
     fig, ax = plt.subplots(figsize=(10, 6))
-    ax.boxplot(array_roubo_veiculo, vert=False, patch_artist=True,
+    ax.boxplot(array_roubo_veiculo, orientation='horizontal', patch_artist=True,
                boxprops=dict(facecolor='lightblue'))
     plt.tight_layout()
-    plt.show()
+    mostrar_ou_salvar(args.salvar)
 
 except Exception as e:
     print(f"Erro: {e}")
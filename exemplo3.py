@@ -1,16 +1,23 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt  # biblioteca de gráficos
+import argparse
 
-try:
-    ENDERECO_DADOS = "https://www.ispdados.rj.gov.br/Arquivos/BaseDPEvolucaoMensalCisp.csv"
-    df_ocorrencia = pd.read_csv(ENDERECO_DADOS, sep=';', encoding='iso-8859-1')
+from agregacao import adicionar_argumentos_periodo, totalizar_ocorrencias
+from estatisticas import calcular_medidas, selecionar_extremos
+from graficos import adicionar_argumento_salvar, mostrar_ou_salvar, usar_modo_headless
 
-    # Delimitando variáveis
-    df_ocorrencia = df_ocorrencia[['munic', 'roubo_veiculo']]
+# Período analisado: --from AAAA-MM --to AAAA-MM
+parser = adicionar_argumentos_periodo(argparse.ArgumentParser())
+# --salvar grafico.png gera o gráfico em arquivo, sem abrir janela (servidores)
+parser = adicionar_argumento_salvar(parser)
+args = parser.parse_args()
+if args.salvar:
+    usar_modo_headless()
 
-    # Totalizando
-    df_roubo_veiculo = df_ocorrencia.groupby('munic').sum(numeric_only=True).reset_index()
+try:
+    # CSV do ISP lido do cache local (ver dados.py)
+    # Totalizando roubo_veiculo por munic a partir das somas mensais (ver agregacao.py)
+    df_roubo_veiculo = totalizar_ocorrencias(['roubo_veiculo'], inicio=args.inicio, fim=args.fim)
     print(df_roubo_veiculo.to_string())
 
 except Exception as e:
@@ -21,36 +28,41 @@ except Exception as e:
 try:
     print('Obtendo informações sobre padrão de roubos de veículos...')
     array_roubo_veiculo = np.array(df_roubo_veiculo['roubo_veiculo'])
-    media_roubo_veiculo = np.mean(array_roubo_veiculo)
-    mediana_roubo_veiculo = np.median(array_roubo_veiculo)
-    distancia = abs((media_roubo_veiculo - mediana_roubo_veiculo) / mediana_roubo_veiculo)
+
+    # Todas as medidas de uma vez (ver estatisticas.py)
+    medidas = calcular_medidas(array_roubo_veiculo, metodo='weibull')
+    # Municípios abaixo de Q1/acima de Q3 e outliers, já ordenados (ver estatisticas.py)
+    extremos = selecionar_extremos(array_roubo_veiculo, medidas)
+    media_roubo_veiculo = medidas.media
+    mediana_roubo_veiculo = medidas.mediana
+    distancia = medidas.distancia
 
     # Quartis
-    q1 = np.quantile(array_roubo_veiculo, 0.25, method='weibull')
-    q2 = np.quantile(array_roubo_veiculo, 0.50, method='weibull')
-    q3 = np.quantile(array_roubo_veiculo, 0.75, method='weibull')
+    q1 = medidas.q1
+    q2 = medidas.q2
+    q3 = medidas.q3
 
     # Medidas de dispersão
     print("\nMEDIDAS DE DISPERSÃO")
     print("~" * 67)
-    maximo = np.max(array_roubo_veiculo)
-    minimo = np.min(array_roubo_veiculo)
-    amplitude_total = maximo - minimo
+    maximo = medidas.maximo
+    minimo = medidas.minimo
+    amplitude_total = medidas.amplitude_total
 
     # Menores roubos
-    df_roubo_veiculo_outliers_inferiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] < q1]
+    df_roubo_veiculo_outliers_inferiores = df_roubo_veiculo.iloc[extremos.abaixo_q1]
     print('\nMunicípio com Menores números de Roubos')
-    print(df_roubo_veiculo_outliers_inferiores.sort_values(by='roubo_veiculo', ascending=True))
+    print(df_roubo_veiculo_outliers_inferiores)
 
     # Maiores roubos
-    df_roubo_veiculo_outliers_superiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] > q3]
+    df_roubo_veiculo_outliers_superiores = df_roubo_veiculo.iloc[extremos.acima_q3]
     print('\nMunicípios com Maior números de Roubos')
-    print(df_roubo_veiculo_outliers_superiores.sort_values(by='roubo_veiculo', ascending=False))
+    print(df_roubo_veiculo_outliers_superiores)
 
     # Identificando outliers
-    iqr = q3 - q1
-    limite_superior = q3 + (1.5 * iqr)
-    limite_inferior = q1 - (1.5 * iqr)
+    iqr = medidas.iqr
+    limite_superior = medidas.limite_superior
+    limite_inferior = medidas.limite_inferior
 
     print("\nMEDIDAS")
     print("~" * 67)
@@ -67,20 +79,20 @@ try:
     print(f'Distância média e mediana: {distancia:.3f}')
 
     # Descobrindo outliers
-    df_outliers_superiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] > limite_superior]
-    df_outliers_inferiores = df_roubo_veiculo[df_roubo_veiculo['roubo_veiculo'] < limite_inferior]
+    df_outliers_superiores = df_roubo_veiculo.iloc[extremos.outliers_superiores]
+    df_outliers_inferiores = df_roubo_veiculo.iloc[extremos.outliers_inferiores]
 
     print('\nOutliers Inferiores')
     if df_outliers_inferiores.empty:
         print('Não há outliers inferiores')
     else:
-        print(df_outliers_inferiores.sort_values(by='roubo_veiculo', ascending=True))
+        print(df_outliers_inferiores)
 
     print('\nOutliers Superiores')
     if df_outliers_superiores.empty:
         print('Não há outliers superiores')
     else:
-        print(df_outliers_superiores.sort_values(by='roubo_veiculo', ascending=False))
+        print(df_outliers_superiores)
 
 except Exception as e:
     print(f"Erro de processamento de dados: {e}")
@@ -90,7 +102,7 @@ except Exception as e:
 try:
     # import matplotlib.pyplot as plt
     # fig, ax = plt.subplots(figsize=(10, 6))
-    # ax.boxplot(array_roubo_veiculo, vert=False, showmeans=True)
+    # ax.boxplot(array_roubo_veiculo, orientation='horizontal', showmeans=True)
     
     plt.subplots(2, 2, figsize=(16, 10))
     plt.suptitle('Análise de roubo de veículos no RJ') 
@@ -98,7 +110,7 @@ try:
     # POSIÇÃO 01
     # BOXPLOT
     plt.subplot(2, 2, 1)  
-    plt.boxplot(array_roubo_veiculo, vert=False, showmeans=True)
+    plt.boxplot(array_roubo_veiculo, orientation='horizontal', showmeans=True)
     plt.title("Boxplot dos Dados")
 
     # POSIÇÃO 02
@@ -125,7 +137,7 @@ try:
     plt.title('Outliers Inferiores')
     # Se o DataFrame do outliers não estiver vazio
     if not df_roubo_veiculo_outliers_inferiores.empty:
-        dados_inferiores = df_roubo_veiculo_outliers_inferiores.sort_values(by='roubo_veiculo', ascending=True) #crescente
+        dados_inferiores = df_roubo_veiculo_outliers_inferiores #já em ordem crescente
         # Gráfico de Barras
         plt.barh(dados_inferiores['munic'], dados_inferiores['roubo_veiculo'])
     else:
@@ -140,7 +152,8 @@ try:
     plt.subplot(2, 2, 4)
     plt.title('Outliers Superiores')
     if not df_roubo_veiculo_outliers_superiores.empty:
-        dados_superiores = df_roubo_veiculo_outliers_superiores.sort_values(by='roubo_veiculo', ascending=True)
+        # Vem em ordem decrescente: invertida, a maior barra fica no topo
+        dados_superiores = df_roubo_veiculo_outliers_superiores.iloc[::-1]
 
         # Cria o gráfico e guarda as barras
         barras = plt.barh(dados_superiores['munic'], dados_superiores['roubo_veiculo'], color='black')
@@ -162,8 +175,8 @@ try:
 
     # Ajusta os espaços do layout para que os gráficos não fiquem espremidos
     plt.tight_layout()
-    # Mostra a figura com os dois gráficos
-    plt.show()
+    # Mostra a figura com os dois gráficos (ou salva em arquivo, com --salvar)
+    mostrar_ou_salvar(args.salvar)
     
 except Exception as e:
     print(f'Erro ao plotar {e}')
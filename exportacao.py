@@ -0,0 +1,219 @@
+# Exportação das medidas e dos outliers em formatos para outros sistemas
+#
+# A saída dos relatórios é texto no console; painéis e outros sistemas
+# tinham que rodar a análise de novo ou ler o stdout. Aqui as tabelas de
+# medidas (uma linha por indicador, ou por grupo x indicador) e de outliers
+# são gravadas de uma vez em:
+#   - parquet (colunar, precisa do pyarrow);
+#   - json (JSON Lines: um registro por linha, .jsonl);
+#   - csv (separado por ';', como os arquivos do ISP, mas em UTF-8).
+# Os três formatos são escritos em blocos: quem gera resultados grandes (por
+# exemplo, outliers de muitos grupos) pode mandar um bloco de cada vez, sem
+# juntar tudo na memória (ver EscritorTabela e exportar_em_blocos).
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from instrumentacao import etapa
+
+# pyarrow é opcional: sem ele, só json e csv
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pq = None
+
+
+FORMATOS = {'parquet': '.parquet', 'json': '.jsonl', 'csv': '.csv'}
+
+# Ordem das colunas de medidas nos arquivos exportados
+COLUNAS_MEDIDAS = ['limite_inferior', 'minimo', 'q1', 'q2', 'q3', 'iqr', 'maximo',
+                   'limite_superior', 'media', 'mediana', 'distancia', 'amplitude_total']
+
+
+def formatos_disponiveis():
+    return [formato for formato in FORMATOS if formato != 'parquet' or pq is not None]
+
+
+def _preparar(df):
+    # Categóricos viram texto: o esquema fica igual em todos os blocos
+    if any(nome is not None for nome in df.index.names):
+        df = df.reset_index()
+    colunas = {coluna: df[coluna].astype(str) for coluna in df.columns
+               if isinstance(df[coluna].dtype, pd.CategoricalDtype)}
+    return df.assign(**colunas) if colunas else df
+
+
+def ordenar_colunas_medidas(df_medidas):
+    """Identificação (indicador, grupos) primeiro, depois as medidas em ordem fixa."""
+    df_medidas = _preparar(df_medidas)
+    medidas = [coluna for coluna in COLUNAS_MEDIDAS if coluna in df_medidas.columns]
+    outras = [coluna for coluna in df_medidas.columns if coluna not in medidas]
+    return df_medidas[outras + medidas]
+
+
+class EscritorTabela:
+    """Grava um arquivo em blocos: `escrever(df)` várias vezes, depois `fechar()`."""
+
+    def __init__(self, caminho, formato):
+        if formato not in FORMATOS:
+            raise ValueError(f'Formato {formato!r} não suportado (use {", ".join(FORMATOS)})')
+        if formato == 'parquet' and pq is None:
+            raise ValueError('Exportar em parquet precisa do pyarrow (pip install pyarrow)')
+        self.caminho = Path(caminho)
+        self.formato = formato
+        self.linhas = 0
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        # Grava num temporário e troca no fim: quem lê nunca vê um arquivo pela metade
+        self._temporario = self.caminho.with_name(self.caminho.name + '.tmp')
+        self._arquivo = None
+        self._parquet = None
+        self._esquema = None
+        # Último bloco vazio recebido antes de qualquer linha (só as colunas)
+        self._vazio = None
+
+    def _abrir(self, df):
+        if self.formato == 'parquet':
+            esquema = pa.Schema.from_pandas(df, preserve_index=False)
+            # Coluna só com nulos sai com tipo null, que não aceita os valores
+            # dos blocos seguintes: grava como texto
+            for i, campo in enumerate(esquema):
+                if pa.types.is_null(campo.type):
+                    esquema = esquema.set(i, campo.with_type(pa.string()))
+            self._esquema = esquema
+            self._parquet = pq.ParquetWriter(self._temporario, self._esquema)
+        else:
+            self._arquivo = open(self._temporario, 'w', encoding='utf-8', newline='')
+            if self.formato == 'csv':
+                self._arquivo.write(';'.join(map(str, df.columns)) + '\n')
+
+    def escrever(self, df):
+        df = _preparar(df)
+        if self._parquet is None and self._arquivo is None:
+            if not len(df):
+                # Bloco vazio não define o esquema: colunas de texto vazias
+                # viriam sem tipo. Espera o primeiro bloco com linhas
+                self._vazio = df
+                return
+            self._abrir(df)
+        if self.formato == 'parquet':
+            self._parquet.write_table(
+                pa.Table.from_pandas(df, schema=self._esquema, preserve_index=False))
+        else:
+            if self.formato == 'csv':
+                df.to_csv(self._arquivo, sep=';', index=False, header=False)
+            elif len(df):
+                # Cada bloco termina com quebra de linha: os próximos continuam o arquivo
+                df.to_json(self._arquivo, orient='records', lines=True, force_ascii=False)
+        self.linhas += len(df)
+
+    def fechar(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self._arquivo is not None:
+            self._arquivo.close()
+        else:
+            # Nenhuma linha: só o cabeçalho (csv), arquivo vazio (json) ou
+            # parquet sem linhas, com as colunas do último bloco vazio
+            vazio = self._vazio if self._vazio is not None else pd.DataFrame()
+            self._abrir(vazio)
+            if self._parquet is not None:
+                self._parquet.write_table(
+                    pa.Table.from_pandas(vazio, schema=self._esquema, preserve_index=False))
+            return self.fechar()
+        self._temporario.replace(self.caminho)
+        return self.caminho
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, rastro):
+        if tipo is None:
+            self.fechar()
+        else:
+            for recurso in (self._parquet, self._arquivo):
+                if recurso is not None:
+                    recurso.close()
+            self._temporario.unlink(missing_ok=True)
+
+
+class _EscritorFormatos:
+    # Um EscritorTabela por formato, todos recebendo os mesmos blocos
+    def __init__(self, caminho_base, formatos):
+        self.escritores = {formato: EscritorTabela(Path(caminho_base).with_suffix(FORMATOS[formato]),
+                                                   formato)
+                           for formato in formatos}
+
+    def escrever(self, df):
+        for escritor in self.escritores.values():
+            escritor.escrever(df)
+
+    def fechar(self):
+        return {formato: escritor.fechar() for formato, escritor in self.escritores.items()}
+
+    def abortar(self, erro):
+        for escritor in self.escritores.values():
+            escritor.__exit__(type(erro), erro, None)
+
+
+def exportar_em_blocos(blocos, caminho_base, formatos=('parquet', 'json', 'csv')):
+    """Grava um iterável de DataFrames em cada formato; devolve {formato: caminho}.
+
+    Cada bloco é escrito em todos os formatos assim que chega e depois
+    descartado.
+    """
+    escritor = _EscritorFormatos(caminho_base, formatos)
+    try:
+        for bloco in blocos:
+            escritor.escrever(bloco)
+    except BaseException as erro:
+        escritor.abortar(erro)
+        raise
+    return escritor.fechar()
+
+
+def exportar_resultados(resultados, diretorio, formatos=('parquet', 'json', 'csv'),
+                        metadados=None):
+    """Grava medidas.* e outliers.* em `diretorio` e um manifesto.json com o resumo.
+
+    `resultados` é um ResultadoLote/ResultadoGrupos (qualquer objeto com
+    `medidas` e `outliers`) ou um iterável deles, um por bloco, para
+    resultados que não cabem de uma vez na memória.
+    """
+    diretorio = Path(diretorio)
+    if hasattr(resultados, 'medidas'):
+        resultados = [resultados]
+    tabelas = {'medidas': _EscritorFormatos(diretorio / 'medidas', formatos),
+               'outliers': _EscritorFormatos(diretorio / 'outliers', formatos)}
+    blocos = 0
+    with etapa('exportacao', formatos=','.join(formatos)):
+        try:
+            for resultado in resultados:
+                tabelas['medidas'].escrever(ordenar_colunas_medidas(resultado.medidas))
+                tabelas['outliers'].escrever(resultado.outliers)
+                blocos += 1
+        except BaseException as erro:
+            for escritor in tabelas.values():
+                escritor.abortar(erro)
+            raise
+        arquivos = {tabela: escritor.fechar() for tabela, escritor in tabelas.items()}
+
+    manifesto = {
+        **(metadados or {}),
+        'blocos': blocos,
+        'linhas': {tabela: next(iter(escritor.escritores.values())).linhas
+                   for tabela, escritor in tabelas.items()},
+        'arquivos': {tabela: {formato: caminho.name for formato, caminho in caminhos.items()}
+                     for tabela, caminhos in arquivos.items()},
+    }
+    (diretorio / 'manifesto.json').write_text(
+        json.dumps(manifesto, ensure_ascii=False, indent=2, default=_json_padrao), encoding='utf-8')
+    return arquivos
+
+
+def _json_padrao(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return str(valor)
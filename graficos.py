@@ -0,0 +1,212 @@
+# Geração dos gráficos em arquivo (PNG/SVG), sem janela interativa
+#
+# plt.show() bloqueia a execução e precisa de uma tela, o que impede rodar os
+# relatórios em servidores e tarefas agendadas. Aqui usamos o backend Agg
+# (não interativo) e salvamos as figuras em arquivo.
+#
+# O painel 2x2 do exemplo3.py (boxplot, medidas, outliers inferiores e
+# superiores) vira um modelo (ModeloPainel): a figura e os subgráficos são
+# criados uma vez e, para cada indicador, apenas limpos e redesenhados.
+# renderizar_em_lote distribui muitos painéis entre vários processos, cada um
+# com o seu próprio modelo.
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import matplotlib
+import numpy as np
+
+from estatisticas import calcular_medidas, selecionar_extremos
+from instrumentacao import etapa
+
+
+FORMATOS = ('png', 'svg')
+
+
+def usar_modo_headless():
+    """Troca o backend do matplotlib para Agg (renderiza só em arquivo)."""
+    matplotlib.use('Agg')
+
+
+@dataclass
+class DadosGrafico:
+    titulo: str
+    rotulo: str
+    # nomes (ex.: munic) e valores totalizados, na mesma ordem
+    nomes: np.ndarray
+    valores: np.ndarray
+    metodo: str = 'weibull'
+
+    @classmethod
+    def de_dataframe(cls, df, indicador, chave='munic', titulo=None):
+        return cls(
+            titulo=titulo or f'Análise de {indicador} no RJ',
+            rotulo=f'Total {indicador}',
+            nomes=df[chave].astype(str).to_numpy(),
+            valores=df[indicador].to_numpy(),
+        )
+
+
+class ModeloPainel:
+    """Figura 2x2 criada uma vez e redesenhada para cada DadosGrafico."""
+
+    def __init__(self, figsize=(16, 10)):
+        import matplotlib.pyplot as plt
+        self.fig, self.eixos = plt.subplots(2, 2, figsize=figsize)
+
+    def desenhar(self, dados):
+        with etapa('grafico', titulo=dados.titulo, barras=len(dados.valores)):
+            self._desenhar(dados)
+
+    def _desenhar(self, dados):
+        medidas = calcular_medidas(dados.valores, metodo=dados.metodo)
+        ax_box, ax_medidas, ax_inf, ax_sup = self.eixos.flat
+        for ax in self.eixos.flat:
+            ax.cla()
+        self.fig.suptitle(dados.titulo)
+
+        # POSIÇÃO 01 - BOXPLOT
+        ax_box.boxplot(dados.valores, orientation='horizontal', showmeans=True)
+        ax_box.set_title('Boxplot dos Dados')
+
+        # POSIÇÃO 02 - MEDIDAS
+        ax_medidas.set_title('Medidas Estatísticas')
+        textos = [
+            (0.1, 0.9, f'Limite inferior: {medidas.limite_inferior}'),
+            (0.1, 0.8, f'Menor valor: {medidas.minimo}'),
+            (0.1, 0.7, f'Q1: {medidas.q1}'),
+            (0.1, 0.6, f'Mediana: {medidas.mediana}'),
+            (0.1, 0.5, f'Q3: {medidas.q3}'),
+            (0.1, 0.4, f'Média: {medidas.media:.3f}'),
+            (0.1, 0.3, f'Maior valor: {medidas.maximo}'),
+            (0.1, 0.2, f'Limite superior: {medidas.limite_superior}'),
+            (0.5, 0.9, f'Distância Média e Mediana: {medidas.distancia:.4f}'),
+            (0.5, 0.8, f'IQR: {medidas.iqr}'),
+            (0.5, 0.7, f'Amplitude Total: {medidas.amplitude_total}'),
+        ]
+        for x, y, texto in textos:
+            ax_medidas.text(x, y, texto, fontsize=10)
+
+        # POSIÇÕES 03 e 04 - OUTLIERS INFERIORES E SUPERIORES
+        extremos = selecionar_extremos(dados.valores, medidas, k=0)
+        self._barras(ax_inf, dados, extremos.outliers_inferiores,
+                     'Outliers Inferiores', 'Sem Outliers Inferiores')
+        # Ordem crescente: a maior barra fica no topo do gráfico horizontal
+        self._barras(ax_sup, dados, extremos.outliers_superiores[::-1],
+                     'Outliers Superiores', 'Sem outliers superiores')
+
+        self.fig.tight_layout()
+
+    @staticmethod
+    def _barras(ax, dados, posicoes, titulo, mensagem_vazio):
+        # `posicoes` já vêm na ordem das barras, de baixo para cima
+        ax.set_title(titulo)
+        if not len(posicoes):
+            ax.text(0.5, 0.5, mensagem_vazio, ha='center', va='center', fontsize=12)
+            ax.set_xticks([])
+            ax.set_yticks([])
+            return
+        barras = ax.barh(dados.nomes[posicoes], dados.valores[posicoes], color='black')
+        ax.bar_label(barras, fmt='%.0f', label_type='edge', fontsize=8, padding=2)
+        ax.tick_params(axis='both', labelsize=8)
+        ax.set_xlabel(dados.rotulo)
+
+    def salvar(self, caminho):
+        with etapa('grafico_salvar', arquivo=str(caminho)):
+            self.fig.savefig(caminho)
+        return Path(caminho)
+
+
+def renderizar(dados, caminho, modelo=None):
+    """Desenha um painel e salva em `caminho` (formato pela extensão)."""
+    modelo = modelo or ModeloPainel()
+    modelo.desenhar(dados)
+    return modelo.salvar(caminho)
+
+
+# Modelo de cada processo do pool, criado uma única vez por processo
+_modelo_processo = None
+
+
+def _iniciar_processo():
+    global _modelo_processo
+    usar_modo_headless()
+    _modelo_processo = ModeloPainel()
+
+
+def _renderizar_no_processo(dados, caminho):
+    return renderizar(dados, caminho, _modelo_processo)
+
+
+def nome_arquivo(texto):
+    return ''.join(c if c.isalnum() or c in '-_' else '_' for c in texto)
+
+
+def renderizar_em_lote(lista_dados, diretorio, formato='png', processos=None, nomes=None,
+                       retornar_excecoes=False):
+    """Renderiza vários painéis em paralelo, um arquivo por DadosGrafico.
+
+    `nomes` dá o nome de cada arquivo (sem extensão; padrão: o título). Com
+    processos=1 tudo roda no próprio processo, sem pool. Com
+    `retornar_excecoes`, um painel que falha devolve a exceção no lugar do
+    caminho e os demais continuam (como asyncio.gather).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato {formato!r} não suportado (use {", ".join(FORMATOS)})')
+    diretorio = Path(diretorio)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    nomes = nomes or [dados.titulo for dados in lista_dados]
+    caminhos = [diretorio / f'{nome_arquivo(nome)}.{formato}' for nome in nomes]
+    processos = processos or min(len(lista_dados), os.cpu_count() or 1) or 1
+    resultados = []
+    if processos == 1:
+        modelo = None
+        for dados, caminho in zip(lista_dados, caminhos):
+            try:
+                modelo = modelo or ModeloPainel()
+                resultados.append(renderizar(dados, caminho, modelo))
+            except Exception as erro:
+                if not retornar_excecoes:
+                    raise
+                resultados.append(erro)
+                # O erro pode ter deixado a figura num estado ruim: começa outra
+                modelo = None
+        return resultados
+    with ProcessPoolExecutor(processos, initializer=_iniciar_processo) as executor:
+        futuros = [executor.submit(_renderizar_no_processo, dados, caminho)
+                   for dados, caminho in zip(lista_dados, caminhos)]
+        for futuro in futuros:
+            try:
+                resultados.append(futuro.result())
+            except Exception as erro:
+                if not retornar_excecoes:
+                    raise
+                resultados.append(erro)
+    return resultados
+
+
+def graficos_por_indicador(df_agrupado, indicadores, chave='munic', metodo='weibull'):
+    """Um DadosGrafico por indicador de um DataFrame já totalizado por `chave`."""
+    lista = [DadosGrafico.de_dataframe(df_agrupado, indicador, chave) for indicador in indicadores]
+    for dados in lista:
+        dados.metodo = metodo
+    return lista
+
+
+def adicionar_argumento_salvar(parser):
+    """Acrescenta --salvar ARQUIVO a um argparse.ArgumentParser de relatório."""
+    parser.add_argument('--salvar', metavar='ARQUIVO',
+                        help='salva o gráfico em ARQUIVO (.png ou .svg) em vez de abrir a janela')
+    return parser
+
+
+def mostrar_ou_salvar(caminho=None):
+    """Salva a figura atual em `caminho` ou, sem caminho, abre a janela (plt.show)."""
+    import matplotlib.pyplot as plt
+    if caminho:
+        with etapa('grafico_salvar', arquivo=str(caminho)):
+            plt.savefig(caminho)
+        print(f'Gráfico salvo em {caminho}')
+    else:
+        plt.show()
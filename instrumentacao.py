@@ -0,0 +1,108 @@
+# Medição de tempo e memória por etapa do pipeline
+#
+# Cada etapa (download, leitura, agregação, estatísticas, gráfico) é envolvida
+# com `with etapa('nome'):`. Quando a instrumentação está ligada, ao final da
+# etapa é emitida uma linha JSON com tempo de relógio, tempo de CPU e pico de
+# memória alocada pelo Python/numpy (tracemalloc). Desligada (o padrão), a
+# etapa é um contexto vazio e o custo é só o de uma chamada de função.
+#
+# Para ligar: variável de ambiente ISP_INSTRUMENTACAO=1 (linhas em stderr) ou
+# ISP_INSTRUMENTACAO=caminho/arquivo.jsonl, ou ativar() no código.
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+class _Instrumentacao:
+    def __init__(self):
+        self.ativa = False
+        self.memoria = True
+        self.destino = None
+        # Pilha de etapas abertas: cada item guarda o maior pico dos filhos
+        self.pilha = []
+
+    def emitir(self, registro):
+        linha = json.dumps(registro, ensure_ascii=False)
+        if isinstance(self.destino, (str, os.PathLike)):
+            with open(self.destino, 'a', encoding='utf-8') as arquivo:
+                print(linha, file=arquivo)
+        else:
+            print(linha, file=self.destino or sys.stderr, flush=True)
+
+
+_estado = _Instrumentacao()
+
+
+def ativar(destino=None, memoria=True):
+    """Liga a instrumentação; `destino` é um arquivo .jsonl ou um stream (padrão: stderr)."""
+    _estado.ativa = True
+    _estado.destino = destino
+    _estado.memoria = memoria
+    if memoria and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def desativar():
+    _estado.ativa = False
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def ativa():
+    return _estado.ativa
+
+
+@contextmanager
+def _etapa_medida(nome, campos):
+    medir_memoria = _estado.memoria and tracemalloc.is_tracing()
+    if medir_memoria:
+        memoria_inicial = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    _estado.pilha.append(0)
+    inicio_relogio = time.perf_counter()
+    inicio_cpu = time.process_time()
+    situacao = 'ok'
+    try:
+        yield
+    except BaseException:
+        situacao = 'erro'
+        raise
+    finally:
+        registro = {
+            'etapa': nome,
+            'situacao': situacao,
+            'tempo_s': round(time.perf_counter() - inicio_relogio, 6),
+            'cpu_s': round(time.process_time() - inicio_cpu, 6),
+        }
+        pico_filhos = _estado.pilha.pop()
+        if medir_memoria:
+            # reset_peak() das etapas internas apaga o pico desta etapa, por
+            # isso o pico final é o maior entre o medido aqui e o dos filhos
+            pico = max(tracemalloc.get_traced_memory()[1], pico_filhos)
+            registro['pico_memoria_bytes'] = pico - memoria_inicial
+            if _estado.pilha:
+                _estado.pilha[-1] = max(_estado.pilha[-1], pico)
+        if resource is not None:
+            registro['rss_max_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        registro.update(campos)
+        _estado.emitir(registro)
+
+
+def etapa(nome, **campos):
+    """Contexto que mede a etapa `nome`; `campos` extras vão junto na linha JSON."""
+    if not _estado.ativa:
+        return nullcontext()
+    return _etapa_medida(nome, campos)
+
+
+_variavel = os.environ.get('ISP_INSTRUMENTACAO', '')
+if _variavel:
+    ativar(None if _variavel == '1' else _variavel)
@@ -0,0 +1,121 @@
+# Memoização de resultados de análise em disco
+#
+# Se o CSV do ISP não mudou, rodar o relatório de novo refaz o groupby, os
+# quantis e os filtros e chega exatamente ao mesmo resultado. Aqui o
+# resultado é guardado em disco com uma chave que combina:
+#   - a impressão digital (SHA-256) do arquivo de dados em cache;
+#   - o nome da análise e seus parâmetros (indicador, método dos quantis,
+#     multiplicador do IQR, período...).
+# Quando o ISP publica uma versão nova, a impressão digital muda: os
+# resultados da versão antiga deixam de ser usados e são apagados. O espaço
+# total é limitado, descartando primeiro os menos usados recentemente (LRU).
+#
+# Variável de ambiente:
+#   ISP_MEMO_LIMITE - limite de espaço dos resultados, em MB (padrão: 256)
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+
+import dados
+from agregacao import totalizar_ocorrencias
+from dados import impressao_digital
+from estatisticas import MULTIPLICADOR_IQR, analisar_indicador
+from instrumentacao import etapa
+
+
+LIMITE_PADRAO_MB = 256
+
+# Entra na chave: muda quando o formato dos resultados guardados muda
+# (2: menores/maiores/outliers de analisar_indicador já ordenados)
+VERSAO_RESULTADOS = 2
+
+
+def _diretorio(diretorio_cache=None):
+    base = Path(diretorio_cache) if diretorio_cache else dados.diretorio_cache_padrao()
+    return base / 'resultados'
+
+
+def _limite_bytes():
+    return int(float(os.environ.get('ISP_MEMO_LIMITE', LIMITE_PADRAO_MB)) * 1024 * 1024)
+
+
+def _chave(nome, parametros):
+    texto = json.dumps({'analise': nome, 'parametros': parametros, 'versao': VERSAO_RESULTADOS},
+                       sort_keys=True, default=str)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()[:32]
+
+
+def _prefixo_fonte(caminho_dados):
+    # Identifica a fonte (o arquivo), independente da versão dos dados
+    return hashlib.sha256(str(Path(caminho_dados).resolve()).encode('utf-8')).hexdigest()[:12]
+
+
+def _invalidar_versoes_antigas(diretorio, prefixo, digital):
+    for arquivo in diretorio.glob(f'{prefixo}_*.pkl'):
+        if not arquivo.name.startswith(f'{prefixo}_{digital[:16]}_'):
+            arquivo.unlink(missing_ok=True)
+
+
+def _aplicar_limite(diretorio, limite):
+    # LRU: a data de modificação é atualizada a cada leitura (ver memoizar)
+    arquivos = sorted(diretorio.glob('*.pkl'), key=lambda a: a.stat().st_mtime_ns)
+    total = sum(arquivo.stat().st_size for arquivo in arquivos)
+    for arquivo in arquivos:
+        if total <= limite:
+            break
+        total -= arquivo.stat().st_size
+        arquivo.unlink(missing_ok=True)
+
+
+def memoizar(nome, caminho_dados, parametros, calcular, diretorio_cache=None, limite_bytes=None):
+    """Devolve o resultado guardado de (`nome`, dados, `parametros`) ou chama `calcular()`.
+
+    Devolve a tupla (resultado, acerto), onde acerto indica se veio do disco.
+    """
+    diretorio = _diretorio(diretorio_cache)
+    diretorio.mkdir(parents=True, exist_ok=True)
+    digital = impressao_digital(caminho_dados)
+    prefixo = _prefixo_fonte(caminho_dados)
+    arquivo = diretorio / f'{prefixo}_{digital[:16]}_{_chave(nome, parametros)}.pkl'
+
+    _invalidar_versoes_antigas(diretorio, prefixo, digital)
+
+    if arquivo.exists():
+        try:
+            with etapa('memoizacao_leitura', analise=nome):
+                with open(arquivo, 'rb') as entrada:
+                    resultado = pickle.load(entrada)
+            os.utime(arquivo)
+            return resultado, True
+        except (OSError, pickle.UnpicklingError, EOFError):
+            # Arquivo corrompido ou apagado no meio do caminho: recalcula
+            pass
+
+    resultado = calcular()
+    temporario = arquivo.with_suffix('.tmp')
+    with open(temporario, 'wb') as saida:
+        pickle.dump(resultado, saida, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporario, arquivo)
+    _aplicar_limite(diretorio, _limite_bytes() if limite_bytes is None else limite_bytes)
+    return resultado, False
+
+
+def analisar_indicador_memoizado(indicador, metodo='weibull', multiplicador=MULTIPLICADOR_IQR,
+                                 inicio=None, fim=None, **opcoes_cache):
+    """estatisticas.analisar_indicador sobre o total por município, com memoização."""
+    resultado_cache = dados.obter_arquivo(**opcoes_cache)
+    parametros = {'indicador': indicador, 'metodo': metodo, 'multiplicador': multiplicador,
+                  'inicio': inicio, 'fim': fim}
+
+    def calcular():
+        # Do mesmo arquivo cuja impressão digital entra na chave
+        df = totalizar_ocorrencias([indicador], inicio=inicio, fim=fim, arquivo=resultado_cache,
+                                   **opcoes_cache)
+        return analisar_indicador(df, indicador, metodo, multiplicador)
+
+    analise, acerto = memoizar('analisar_indicador', resultado_cache.caminho, parametros, calcular,
+                               opcoes_cache.get('diretorio_cache'))
+    print(f'Resultado {"reaproveitado da memoização" if acerto else "calculado e memoizado"}')
+    return analise
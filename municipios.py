@@ -0,0 +1,121 @@
+# Índice inteiro de municípios
+#
+# Os nomes dos municípios têm acentos e às vezes chegam escritos de formas
+# diferentes em cada tabela do ISP ("Niterói", "NITEROI", "Niteroi "). Em vez
+# de juntar tabelas com merge de textos, cada nome é normalizado (sem acento,
+# minúsculo, sem espaços sobrando) e recebe um código inteiro fixo. As
+# junções viram indexação de arrays numpy por código.
+#
+# O índice é guardado em disco (indice_municipios.json no diretório do cache)
+# e só cresce: um código nunca muda de município entre execuções.
+#
+# O pipeline agrega e filtra pelos códigos int32; os nomes só voltam na hora
+# de imprimir ou desenhar (categorizar), como um categórico do pandas.
+import json
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import dados
+
+
+NOME_ARQUIVO_INDICE = 'indice_municipios.json'
+
+
+def normalizar_nome(nome):
+    """'  Niterói ' -> 'niteroi' (sem acentos, minúsculo, espaços simples)."""
+    sem_acento = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(sem_acento.lower().split())
+
+
+class IndiceMunicipios:
+    """Tabela nome normalizado <-> código inteiro (int32)."""
+
+    def __init__(self, nomes=()):
+        # nomes[codigo] guarda o nome como apareceu pela primeira vez
+        self.nomes = []
+        self._codigos = {}
+        for nome in nomes:
+            self.adicionar(nome)
+
+    def __len__(self):
+        return len(self.nomes)
+
+    def adicionar(self, nome):
+        chave = normalizar_nome(nome)
+        codigo = self._codigos.get(chave)
+        if codigo is None:
+            codigo = self._codigos[chave] = len(self.nomes)
+            self.nomes.append(str(nome))
+        return codigo
+
+    def codificar(self, nomes, adicionar=True):
+        """Array de códigos int32 para `nomes`; desconhecidos viram -1 se `adicionar` for falso."""
+        # Normaliza só os nomes distintos e espalha o resultado com o inverso
+        unicos, inverso = np.unique(np.asarray(nomes, dtype=object).astype(str), return_inverse=True)
+        if adicionar:
+            codigos_unicos = [self.adicionar(nome) for nome in unicos]
+        else:
+            codigos_unicos = [self._codigos.get(normalizar_nome(nome), -1) for nome in unicos]
+        return np.asarray(codigos_unicos, dtype=np.int32)[inverso.ravel()]
+
+    def codificar_coluna(self, serie, adicionar=True):
+        """Como codificar, mas com uma Series categórica normaliza só as categorias."""
+        if not isinstance(serie.dtype, pd.CategoricalDtype):
+            return self.codificar(serie.to_numpy(), adicionar)
+        codigos = serie.cat.codes.to_numpy()
+        if len(serie.cat.categories) == 0:
+            return np.full(len(codigos), -1, dtype=np.int32)
+        codigos_categorias = self.codificar(serie.cat.categories, adicionar)
+        return np.where(codigos >= 0, codigos_categorias[codigos], -1).astype(np.int32)
+
+    def decodificar(self, codigos):
+        return np.asarray(self.nomes, dtype=object)[np.asarray(codigos)]
+
+    def categorizar(self, codigos):
+        """Categórico com os nomes dos `codigos`, categorias em ordem alfabética.
+
+        Só os nomes usados são decodificados; as linhas continuam apontando
+        para eles por códigos inteiros.
+        """
+        codigos = np.asarray(codigos)
+        usados = np.unique(codigos)
+        nomes = self.decodificar(usados)
+        ordem = np.argsort(nomes, kind='stable')
+        posicao = np.empty(len(self.nomes), dtype=np.int32)
+        posicao[usados[ordem]] = np.arange(len(usados), dtype=np.int32)
+        return pd.Categorical.from_codes(posicao[codigos], categories=nomes[ordem])
+
+    def salvar(self, caminho):
+        caminho = Path(caminho)
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        caminho.write_text(json.dumps(self.nomes, ensure_ascii=False), encoding='utf-8')
+
+    @classmethod
+    def carregar(cls, caminho):
+        try:
+            return cls(json.loads(Path(caminho).read_text(encoding='utf-8')))
+        except FileNotFoundError:
+            return cls()
+
+
+def caminho_indice(diretorio_cache=None):
+    diretorio = Path(diretorio_cache) if diretorio_cache else dados.diretorio_cache_padrao()
+    return diretorio / NOME_ARQUIVO_INDICE
+
+
+def indice_padrao(diretorio_cache=None):
+    """Índice persistido no diretório do cache (vazio na primeira vez)."""
+    return IndiceMunicipios.carregar(caminho_indice(diretorio_cache))
+
+
+def memoria_por_codificacao(serie, indice=None):
+    """Bytes ocupados pela coluna como textos (object), categórico e códigos int32."""
+    indice = indice if indice is not None else IndiceMunicipios()
+    return {
+        'objeto': int(serie.astype(str).astype(object).memory_usage(index=False, deep=True)),
+        'categoria': int(serie.astype('category').memory_usage(index=False, deep=True)),
+        'int32': int(indice.codificar_coluna(serie).nbytes),
+    }
@@ -0,0 +1,167 @@
+# Análise de outliers por grupo (ano, região, ...) em vários processos
+#
+# Em vez de rodar milhares de pequenos groupby/quantile do pandas, um por
+# combinação de ano x região x indicador, fazemos:
+#   1. um único groupby([ano, regiao, munic]).sum() no processo principal,
+#      ordenado por grupo, gerando a matriz (linhas x indicadores);
+#   2. a matriz vai para memória compartilhada (shared_memory): os processos
+#      do pool leem direto dela, sem cópia nem pickle dos dados;
+#   3. os grupos são divididos em partições; cada processo calcula os quartis,
+#      limites e outliers de todos os indicadores do grupo de uma vez
+#      (calcular_medidas_matriz, com axis=0);
+#   4. o processo principal junta as tabelas em ordem fixa (por grupo e
+#      indicador), então o resultado não depende da ordem de término.
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, fields
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from dados import colunas_indicadores
+from estatisticas import MULTIPLICADOR_IQR, MedidasEstatisticas, calcular_medidas_matriz
+from instrumentacao import etapa
+
+
+CHAVES_PADRAO = ('ano', 'regiao')
+
+# Medidas devolvidas por calcular_medidas_matriz, na mesma ordem
+NOMES_MEDIDAS = [campo.name for campo in fields(MedidasEstatisticas) if campo.name != 'erro_rank']
+
+
+@dataclass
+class ResultadoGrupos:
+    # Uma linha por grupo x indicador: chaves, indicador e as medidas
+    medidas: pd.DataFrame
+    # Formato longo: chaves, indicador, munic, valor e tipo ('inferior'/'superior')
+    outliers: pd.DataFrame
+
+
+# Matriz compartilhada vista por cada processo do pool
+_matriz_processo = None
+_memoria_processo = None
+
+
+def _iniciar_processo(nome_memoria, forma, tipo):
+    global _matriz_processo, _memoria_processo
+    _memoria_processo = shared_memory.SharedMemory(name=nome_memoria)
+    _matriz_processo = np.ndarray(forma, dtype=tipo, buffer=_memoria_processo.buf)
+
+
+def _analisar_particao(limites_grupos, metodo, multiplicador, matriz=None):
+    """Medidas e outliers dos grupos da partição; `limites_grupos` = [(grupo, inicio, fim)].
+
+    Devolve só arrays numpy (pequenos), que voltam ao processo principal.
+    """
+    matriz = _matriz_processo if matriz is None else matriz
+    if not len(limites_grupos):
+        # Nenhum grupo (ex.: período sem dados): resultado vazio, mesmas colunas
+        vazio = np.empty(0, dtype=np.intp)
+        return (vazio, {nome: np.empty((0, matriz.shape[1])) for nome in NOMES_MEDIDAS},
+                (vazio, vazio, np.empty(0, dtype=bool)))
+    grupos, medidas = [], []
+    linhas_outliers, colunas_outliers, superiores_outliers = [], [], []
+    for grupo, inicio, fim in limites_grupos:
+        bloco = matriz[inicio:fim]
+        resultado = calcular_medidas_matriz(bloco, metodo, multiplicador)
+        grupos.append(grupo)
+        medidas.append(resultado)
+        inferiores = bloco < resultado['limite_inferior']
+        superiores = bloco > resultado['limite_superior']
+        linhas, colunas = np.nonzero(inferiores | superiores)
+        linhas_outliers.append(linhas + inicio)
+        colunas_outliers.append(colunas)
+        superiores_outliers.append(superiores[linhas, colunas])
+    # Cada medida vira uma matriz (grupos da partição x indicadores)
+    medidas = {nome: np.stack([m[nome] for m in medidas]) for nome in medidas[0]}
+    outliers = (np.concatenate(linhas_outliers), np.concatenate(colunas_outliers),
+                np.concatenate(superiores_outliers))
+    return np.asarray(grupos), medidas, outliers
+
+
+def _particionar(limites, particoes):
+    # Grupos consecutivos em partições de tamanho parecido (em linhas)
+    pesos = np.cumsum([fim - inicio for _, inicio, fim in limites])
+    cortes = np.searchsorted(pesos, np.linspace(0, pesos[-1], particoes + 1)[1:-1])
+    return [parte for parte in np.split(np.array(limites, dtype=np.int64), cortes) if len(parte)]
+
+
+def analisar_por_grupo(df, chaves=CHAVES_PADRAO, indicadores=None, chave='munic',
+                       processos=None, particoes=None, metodo='weibull',
+                       multiplicador=MULTIPLICADOR_IQR):
+    """Q1/Q3/IQR/limites e outliers de cada combinação de `chaves` x indicador.
+
+    `df` são as linhas brutas (uma por CISP/mês). Com processos=1 tudo roda no
+    próprio processo, sem pool nem memória compartilhada.
+    """
+    chaves = list(chaves)
+    if indicadores is None:
+        indicadores = [c for c in colunas_indicadores(df) if c not in chaves]
+
+    with etapa('agregacao_grupos', linhas=len(df)):
+        agrupado = (df[[*chaves, chave, *indicadores]]
+                    .groupby([*chaves, chave], observed=True, sort=True)
+                    .sum()
+                    .reset_index())
+        matriz = np.ascontiguousarray(agrupado[indicadores].to_numpy(dtype=np.float64))
+        # Início de cada grupo na matriz ordenada
+        codigos_grupo = agrupado.groupby(chaves, observed=True, sort=True).ngroup().to_numpy()
+        inicios = np.flatnonzero(np.r_[True, codigos_grupo[1:] != codigos_grupo[:-1]])
+        fins = np.r_[inicios[1:], len(agrupado)]
+        limites = [(g, int(i), int(f)) for g, (i, f) in enumerate(zip(inicios, fins))
+                   if f > i]
+
+    processos = processos or os.cpu_count() or 1
+    particoes = particoes or processos * 4
+
+    with etapa('estatisticas_grupos', grupos=len(limites), processos=processos):
+        if processos == 1 or len(limites) < 2:
+            partes = [_analisar_particao(limites, metodo, multiplicador, matriz)]
+        else:
+            memoria = shared_memory.SharedMemory(create=True, size=max(matriz.nbytes, 1))
+            try:
+                compartilhada = np.ndarray(matriz.shape, dtype=matriz.dtype, buffer=memoria.buf)
+                compartilhada[:] = matriz
+                iniciar = (memoria.name, matriz.shape, matriz.dtype.str)
+                with ProcessPoolExecutor(processos, initializer=_iniciar_processo,
+                                         initargs=iniciar) as executor:
+                    futuros = [executor.submit(_analisar_particao, [tuple(l) for l in parte],
+                                               metodo, multiplicador)
+                               for parte in _particionar(limites, particoes)]
+                    # Resultados lidos na ordem das partições, não na de término
+                    partes = [futuro.result() for futuro in futuros]
+                del compartilhada
+            finally:
+                memoria.close()
+                memoria.unlink()
+
+    return _juntar(partes, agrupado, chaves, chave, indicadores, inicios)
+
+
+def _juntar(partes, agrupado, chaves, chave, indicadores, inicios):
+    grupos = np.concatenate([parte[0] for parte in partes])
+    n_indicadores = len(indicadores)
+
+    # Medidas: uma linha por grupo x indicador, na ordem dos grupos
+    medidas = {nome: np.concatenate([parte[1][nome] for parte in partes]).ravel()
+               for nome in partes[0][1]}
+    grupo_da_linha = np.repeat(grupos, n_indicadores)
+    df_medidas = agrupado[chaves].iloc[inicios[grupo_da_linha]].reset_index(drop=True)
+    df_medidas['indicador'] = np.tile(np.asarray(indicadores, dtype=object), len(grupos))
+    df_medidas = pd.concat([df_medidas, pd.DataFrame(medidas)], axis=1)
+    df_medidas = df_medidas.iloc[np.argsort(grupo_da_linha, kind='stable')]
+    df_medidas = df_medidas.reset_index(drop=True)
+
+    # Outliers: as linhas da matriz já apontam para a linha de `agrupado`
+    linhas = np.concatenate([parte[2][0] for parte in partes])
+    colunas = np.concatenate([parte[2][1] for parte in partes])
+    superiores = np.concatenate([parte[2][2] for parte in partes])
+    df_outliers = agrupado[chaves].iloc[linhas].reset_index(drop=True)
+    df_outliers['indicador'] = np.asarray(indicadores, dtype=object)[colunas]
+    df_outliers[chave] = agrupado[chave].to_numpy()[linhas]
+    df_outliers['valor'] = agrupado[indicadores].to_numpy()[linhas, colunas]
+    df_outliers['tipo'] = np.where(superiores, 'superior', 'inferior')
+    df_outliers = df_outliers.sort_values([*chaves, 'indicador', 'tipo', 'valor'],
+                                          ignore_index=True, kind='stable')
+    return ResultadoGrupos(df_medidas, df_outliers)
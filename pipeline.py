@@ -0,0 +1,389 @@
+# Execução em lote por etapas, com retomada a partir da última etapa concluída
+#
+# Nos scripts de exemplo cada etapa fica num try/except Exception com exit():
+# um indicador com problema ou um gráfico que falha encerra tudo, e o que já
+# tinha sido calculado se perde. Para rodadas de produção (cron), o lote aqui
+# é dividido em etapas, cada uma com o seu resultado guardado em
+# DIRETORIO/<etapa>/:
+#   dados        - arquivo do ISP no cache local (dados.obter_arquivo);
+#   agregacao    - totais por chave (e por grupo, com `por`) de todos os indicadores;
+#   estatisticas - medidas e outliers, um arquivo por indicador;
+#   graficos     - um painel por indicador (opcional);
+#   exportacao   - medidas e outliers em parquet/json/csv (opcional).
+# O andamento fica em DIRETORIO/estado.json. Rodando de novo com os mesmos
+# dados (mesma impressão digital) e parâmetros, o que já foi concluído é lido
+# do disco. Um indicador que falha não interrompe os outros: o erro vai para o
+# estado (e o traceback para DIRETORIO/erros.log) e só ele é refeito na
+# próxima execução.
+import json
+import os
+import pickle
+import time
+import traceback
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import dados
+from agregacao import filtrar_periodo, gravar_parciais, ler_parciais
+from dados import impressao_digital
+from estatisticas import MULTIPLICADOR_IQR, analisar_indicadores
+from instrumentacao import etapa
+
+
+ETAPAS = ('dados', 'agregacao', 'estatisticas', 'graficos', 'exportacao')
+
+NOME_ESTADO = 'estado.json'
+NOME_LOG_ERROS = 'erros.log'
+
+
+class _EtapaInterrompida(Exception):
+    # Uma etapa sem a qual as seguintes não têm entrada (dados, agregacao)
+    pass
+
+
+@dataclass
+class ResultadoExecucao:
+    diretorio: Path
+    # Situação de cada etapa executada: 'ok', 'parcial' (alguns itens
+    # falharam) ou 'erro'
+    situacoes: dict = field(default_factory=dict)
+    # {etapa: {item: mensagem}}; o item é o indicador (ou o arquivo, nas
+    # etapas sem itens)
+    falhas: dict = field(default_factory=dict)
+    # Etapas lidas do disco, sem recalcular
+    reaproveitadas: list = field(default_factory=list)
+
+    @property
+    def ok(self):
+        return all(situacao == 'ok' for situacao in self.situacoes.values())
+
+    def resumo(self):
+        linhas = []
+        for nome, situacao in self.situacoes.items():
+            origem = ' (reaproveitada)' if nome in self.reaproveitadas else ''
+            linhas.append(f'{nome:<13} {situacao}{origem}')
+            for item, mensagem in self.falhas.get(nome, {}).items():
+                linhas.append(f'    {item}: {mensagem}')
+        return '\n'.join(linhas)
+
+
+def _agora():
+    return time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+def _gravar_objeto(objeto, caminho):
+    # Temporário + replace: uma execução interrompida nunca deixa um arquivo pela metade
+    temporario = caminho.with_suffix('.tmp')
+    with open(temporario, 'wb') as saida:
+        pickle.dump(objeto, saida, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporario, caminho)
+
+
+def _ler_objeto(caminho):
+    with open(caminho, 'rb') as entrada:
+        return pickle.load(entrada)
+
+
+class Pipeline:
+    """Lote de análise em etapas, com os pontos de retomada em `diretorio`.
+
+    Com `por` (ex.: ['ano', 'regiao']), as estatísticas são por grupo
+    (paralelo.analisar_por_grupo); `processos` vale para essa análise e para
+    os gráficos (graficos.renderizar_em_lote), e o padrão é 1, porque cada
+    indicador é analisado separadamente.
+    """
+
+    def __init__(self, diretorio, indicadores=None, chave='munic', por=None, inicio=None,
+                 fim=None, metodo='weibull', multiplicador=MULTIPLICADOR_IQR, graficos=False,
+                 formatos=(), processos=1, **opcoes_cache):
+        self.diretorio = Path(diretorio)
+        # Tudo o que muda o resultado das etapas: se mudar, nada é reaproveitado
+        # (ida e volta pelo JSON para comparar com o estado guardado)
+        self.parametros = json.loads(json.dumps({
+            'indicadores': list(indicadores) if indicadores else None,
+            'chave': chave,
+            'por': list(por) if por else None,
+            'inicio': inicio,
+            'fim': fim,
+            'metodo': metodo,
+            'multiplicador': multiplicador,
+        }))
+        self.graficos = graficos
+        self.formatos = list(formatos)
+        self.processos = processos
+        self.opcoes_cache = opcoes_cache
+        self.estado = None
+        self.resultado = None
+
+    def _carregar_estado(self):
+        try:
+            return json.loads((self.diretorio / NOME_ESTADO).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {'etapas': {}}
+
+    def _salvar_estado(self):
+        caminho = self.diretorio / NOME_ESTADO
+        temporario = caminho.with_suffix('.tmp')
+        temporario.write_text(json.dumps(self.estado, ensure_ascii=False, indent=2),
+                              encoding='utf-8')
+        os.replace(temporario, caminho)
+
+    def _registro(self, nome):
+        return self.estado['etapas'].setdefault(
+            nome, {'situacao': 'pendente', 'concluidos': [], 'falhas': {}})
+
+    def _invalidar(self, nome):
+        """Descarta o registro de `nome` e de todas as etapas seguintes."""
+        for posterior in ETAPAS[ETAPAS.index(nome):]:
+            self.estado['etapas'].pop(posterior, None)
+
+    def _concluir(self, nome, situacao=None, **campos):
+        registro = self._registro(nome)
+        if situacao is None:
+            # Etapas com itens: 'parcial' se algum falhou, 'erro' se todos
+            if not registro['falhas']:
+                situacao = 'ok'
+            else:
+                situacao = 'parcial' if registro['concluidos'] else 'erro'
+        registro.update(situacao=situacao, atualizado_em=_agora(), **campos)
+        self._salvar_estado()
+        self.resultado.situacoes[nome] = situacao
+        if registro['falhas']:
+            self.resultado.falhas[nome] = dict(registro['falhas'])
+
+    def _reaproveitar(self, nome):
+        registro = self.estado['etapas'][nome]
+        print(f'[{nome}] reaproveitada da execução de {registro["atualizado_em"]}')
+        self.resultado.situacoes[nome] = registro['situacao']
+        self.resultado.reaproveitadas.append(nome)
+        if registro['falhas']:
+            self.resultado.falhas[nome] = dict(registro['falhas'])
+
+    def _falhar(self, nome, item, erro):
+        """Registra o traceback em erros.log e devolve a mensagem curta do erro."""
+        mensagem = f'{type(erro).__name__}: {erro}'
+        with open(self.diretorio / NOME_LOG_ERROS, 'a', encoding='utf-8') as log:
+            log.write(f'[{_agora()}] {nome} / {item}\n')
+            log.write(''.join(traceback.format_exception(erro)))
+        print(f'[{nome}] {item}: falhou ({mensagem})')
+        return mensagem
+
+    def _pasta(self, nome):
+        pasta = self.diretorio / nome
+        pasta.mkdir(parents=True, exist_ok=True)
+        return pasta
+
+    def _arquivo_estatisticas(self, indicador):
+        return self._pasta('estatisticas') / f'{indicador}.pkl'
+
+    def _arquivo_grafico(self, indicador):
+        from graficos import nome_arquivo
+        return self._pasta('graficos') / f'{nome_arquivo(indicador)}.png'
+
+    def executar(self, desde=None):
+        """Roda as etapas pendentes e devolve um ResultadoExecucao.
+
+        `desde` força refazer a partir dessa etapa (ex.: 'estatisticas'),
+        mesmo que ela já esteja concluída.
+        """
+        if desde is not None and desde not in ETAPAS:
+            raise ValueError(f'Etapa inválida: {desde!r} (use {", ".join(ETAPAS)})')
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.estado = self._carregar_estado()
+        self.resultado = ResultadoExecucao(self.diretorio)
+        if desde is not None:
+            self._invalidar(desde)
+
+        with etapa('lote', diretorio=str(self.diretorio)):
+            try:
+                caminho_dados = self._etapa_dados()
+                agregado, indicadores = self._etapa_agregacao(caminho_dados)
+                concluidos = self._etapa_estatisticas(agregado, indicadores)
+                if self.graficos:
+                    self._etapa_graficos(agregado, concluidos)
+                if self.formatos:
+                    self._etapa_exportacao(concluidos)
+            except _EtapaInterrompida:
+                pass
+        return self.resultado
+
+    def _etapa_dados(self):
+        try:
+            with etapa('lote_dados'):
+                resultado = dados.obter_arquivo(**self.opcoes_cache)
+                digital = impressao_digital(resultado.caminho)
+        except Exception as erro:
+            self._registro('dados')['falhas'] = {'arquivo': self._falhar('dados', 'arquivo', erro)}
+            self._concluir('dados', 'erro')
+            raise _EtapaInterrompida from erro
+        print(resultado.resumo())
+
+        if (digital != self.estado.get('digital')
+                or self.parametros != self.estado.get('parametros')):
+            # Dados novos ou outros parâmetros: nada do que foi guardado vale mais
+            if self.estado['etapas']:
+                print('[dados] dados ou parâmetros mudaram: todas as etapas serão refeitas')
+            self.estado = {'digital': digital, 'parametros': self.parametros, 'etapas': {}}
+        self._registro('dados')['falhas'] = {}
+        self._concluir('dados', 'ok', arquivo=str(resultado.caminho))
+        return resultado.caminho
+
+    def _etapa_agregacao(self, caminho_dados):
+        # Mesma extensão das parciais mensais: feather com pyarrow, pickle sem
+        extensao = '.feather' if dados.feather is not None else '.pkl'
+        caminho = self._pasta('agregacao') / f'agregado{extensao}'
+        registro = self.estado['etapas'].get('agregacao')
+        if registro is not None and registro['situacao'] != 'erro':
+            agregado = ler_parciais(caminho)
+            if agregado is not None:
+                self._reaproveitar('agregacao')
+                return agregado, registro['indicadores']
+        self._invalidar('agregacao')
+        registro = self._registro('agregacao')
+
+        chave, por = self.parametros['chave'], self.parametros['por'] or []
+        try:
+            with etapa('lote_agregacao'):
+                # O arquivo já obtido na etapa dados, sem revalidar de novo
+                df = dados.ler_ocorrencias(**{**self.opcoes_cache, 'endereco': str(caminho_dados)})
+                df = filtrar_periodo(df, self.parametros['inicio'], self.parametros['fim'])
+                disponiveis = dados.colunas_indicadores(df)
+                pedidos = self.parametros['indicadores'] or disponiveis
+                # Um indicador pedido que não existe não impede os outros
+                indicadores = [indicador for indicador in pedidos if indicador in disponiveis]
+                registro['falhas'] = {indicador: 'não é uma coluna de indicador nos dados'
+                                      for indicador in pedidos if indicador not in disponiveis}
+                agregado = (df[[*por, chave, *indicadores]]
+                            .groupby([*por, chave], observed=True, sort=True)
+                            .sum()
+                            .reset_index())
+                temporario = caminho.with_name('agregado.tmp' + caminho.suffix)
+                gravar_parciais(agregado, temporario)
+                os.replace(temporario, caminho)
+        except Exception as erro:
+            registro['falhas'] = {'agregado': self._falhar('agregacao', 'agregado', erro)}
+            self._concluir('agregacao', 'erro')
+            raise _EtapaInterrompida from erro
+        for indicador, mensagem in registro['falhas'].items():
+            print(f'[agregacao] {indicador}: {mensagem}')
+        self._concluir('agregacao', 'parcial' if registro['falhas'] else 'ok',
+                       indicadores=indicadores)
+        return agregado, indicadores
+
+    def _analisar(self, agregado, indicador):
+        chave, por = self.parametros['chave'], self.parametros['por']
+        metodo, multiplicador = self.parametros['metodo'], self.parametros['multiplicador']
+        if por:
+            from paralelo import analisar_por_grupo
+            return analisar_por_grupo(agregado, por, [indicador], chave, processos=self.processos,
+                                      metodo=metodo, multiplicador=multiplicador)
+        return analisar_indicadores(agregado, chave, [indicador], metodo, multiplicador)
+
+    def _etapa_estatisticas(self, agregado, indicadores):
+        registro = self._registro('estatisticas')
+        pendentes = [indicador for indicador in indicadores
+                     if indicador not in registro['concluidos']
+                     or not self._arquivo_estatisticas(indicador).exists()]
+        if not pendentes and registro['situacao'] != 'pendente':
+            self._reaproveitar('estatisticas')
+            return list(registro['concluidos'])
+
+        for indicador in pendentes:
+            try:
+                with etapa('lote_estatisticas', indicador=indicador):
+                    _gravar_objeto(self._analisar(agregado, indicador),
+                                   self._arquivo_estatisticas(indicador))
+            except Exception as erro:
+                registro['falhas'][indicador] = self._falhar('estatisticas', indicador, erro)
+                self._salvar_estado()
+                continue
+            registro['falhas'].pop(indicador, None)
+            if indicador not in registro['concluidos']:
+                registro['concluidos'].append(indicador)
+            # Resultado novo: o gráfico e a exportação dele precisam ser refeitos
+            registro_graficos = self.estado['etapas'].get('graficos')
+            if registro_graficos is not None and indicador in registro_graficos['concluidos']:
+                registro_graficos['concluidos'].remove(indicador)
+            self.estado['etapas'].pop('exportacao', None)
+            self._salvar_estado()
+
+        # Na ordem dos indicadores, não na de conclusão
+        concluidos = [indicador for indicador in indicadores if indicador in registro['concluidos']]
+        registro['concluidos'] = concluidos
+        print(f'[estatisticas] {len(pendentes) - len(registro["falhas"])} calculado(s), '
+              f'{len(registro["falhas"])} com falha, {len(concluidos)} no total')
+        self._concluir('estatisticas')
+        return concluidos
+
+    def _etapa_graficos(self, agregado, concluidos):
+        import graficos
+        graficos.usar_modo_headless()
+        chave = self.parametros['chave']
+        registro = self._registro('graficos')
+        # Indicadores que não passaram nas estatísticas ficam de fora
+        registro['falhas'] = {indicador: mensagem for indicador, mensagem
+                              in registro['falhas'].items() if indicador in concluidos}
+        pendentes = [indicador for indicador in concluidos
+                     if indicador not in registro['concluidos']
+                     or not self._arquivo_grafico(indicador).exists()]
+        if not pendentes and registro['situacao'] != 'pendente':
+            self._reaproveitar('graficos')
+            return
+
+        try:
+            totais = agregado
+            if self.parametros['por']:
+                # Painel do período inteiro: soma dos grupos por chave
+                totais = agregado.groupby(chave, observed=True)[pendentes].sum().reset_index()
+            lista_dados = graficos.graficos_por_indicador(totais, pendentes, chave,
+                                                          self.parametros['metodo'])
+            with etapa('lote_graficos', indicadores=len(pendentes), processos=self.processos):
+                # Um painel com erro não impede os outros: a exceção volta no lugar do caminho
+                resultados = graficos.renderizar_em_lote(
+                    lista_dados, self._pasta('graficos'), processos=self.processos,
+                    nomes=pendentes, retornar_excecoes=True)
+        except Exception as erro:
+            resultados = [erro] * len(pendentes)
+        for indicador, resultado in zip(pendentes, resultados):
+            if isinstance(resultado, Exception):
+                registro['falhas'][indicador] = self._falhar('graficos', indicador, resultado)
+                continue
+            registro['falhas'].pop(indicador, None)
+            if indicador not in registro['concluidos']:
+                registro['concluidos'].append(indicador)
+        self._salvar_estado()
+        print(f'[graficos] {len(pendentes) - len(registro["falhas"])} painel(is) gerado(s) '
+              f'em {self._pasta("graficos")}')
+        self._concluir('graficos')
+
+    def _etapa_exportacao(self, concluidos):
+        registro = self.estado['etapas'].get('exportacao')
+        if (registro is not None and registro['situacao'] == 'ok'
+                and registro['formatos'] == self.formatos
+                and registro['concluidos'] == concluidos):
+            self._reaproveitar('exportacao')
+            return
+        self._invalidar('exportacao')
+        registro = self._registro('exportacao')
+
+        from exportacao import exportar_resultados
+        falhas = {nome: etapa_registro['falhas']
+                  for nome, etapa_registro in self.estado['etapas'].items()
+                  if etapa_registro['falhas']}
+        metadados = {'gerado_em': _agora(), **self.parametros, 'falhas': falhas}
+        # Um indicador por bloco: só um resultado fica na memória por vez
+        resultados = (_ler_objeto(self._arquivo_estatisticas(indicador))
+                      for indicador in concluidos)
+        try:
+            exportar_resultados(resultados, self._pasta('exportacao'), self.formatos, metadados)
+        except Exception as erro:
+            registro['falhas'] = {'arquivos': self._falhar('exportacao', 'arquivos', erro)}
+            self._concluir('exportacao', 'erro', formatos=self.formatos)
+            return
+        registro['concluidos'] = list(concluidos)
+        self._concluir('exportacao', 'ok', formatos=self.formatos)
+
+
+def executar_lote(diretorio, desde=None, **opcoes):
+    """Atalho: Pipeline(diretorio, **opcoes).executar(desde)."""
+    return Pipeline(diretorio, **opcoes).executar(desde)
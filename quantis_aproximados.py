@@ -0,0 +1,177 @@
+# Quantis aproximados em fluxo (esboço KLL) para dados que não cabem na memória
+#
+# np.quantile precisa de todos os valores em um array. Para analisar as linhas
+# brutas (por CISP e por mês, vários anos, ou vários estados juntos) usamos um
+# esboço KLL (Karnin, Lang e Liberty, 2016): ele recebe os dados bloco a bloco,
+# guarda só alguns milhares de valores e pode ser mesclado com esboços de
+# outros blocos/processos. O erro é no rank: com k=200, o quantil devolvido
+# para p=0.25 está, com alta probabilidade, entre os quantis exatos de
+# 0.25 - erro e 0.25 + erro (erro ~1,3%).
+import numpy as np
+import pandas as pd
+
+import dados
+from agregacao import filtrar_periodo, periodo_para_int
+from estatisticas import MULTIPLICADOR_IQR, PROBABILIDADES, MedidasEstatisticas
+
+
+K_PADRAO = 200
+
+# Semente fixa: a mesma entrada dá sempre os mesmos quantis (relatórios e
+# testes reproduzíveis). Esboços que serão mesclados podem usar sementes
+# diferentes para que as compactações não sorteiem o mesmo lado
+SEMENTE_PADRAO = 0
+
+# Fator de encolhimento da capacidade a cada nível abaixo do topo
+FATOR_CAPACIDADE = 2 / 3
+
+
+def erro_rank(k):
+    """Erro de rank normalizado do esboço KLL (constantes empíricas do Apache DataSketches)."""
+    return 2.296 / k ** 0.9723
+
+
+class EsbocoKLL:
+    """Esboço de quantis mesclável, alimentado com arrays de valores."""
+
+    def __init__(self, k=K_PADRAO, semente=SEMENTE_PADRAO):
+        self.k = k
+        self.n = 0
+        self.soma = 0.0
+        self.minimo = np.inf
+        self.maximo = -np.inf
+        # niveis[h] guarda valores que representam 2**h valores originais cada
+        self.niveis = [np.empty(0)]
+        self._rng = np.random.default_rng(semente)
+
+    @property
+    def erro(self):
+        # Enquanto nada foi compactado, os quantis são exatos
+        return 0.0 if len(self.niveis) == 1 else erro_rank(self.k)
+
+    def _capacidade(self, nivel):
+        profundidade = len(self.niveis) - nivel - 1
+        return max(2, int(np.ceil(self.k * FATOR_CAPACIDADE ** profundidade)))
+
+    def atualizar(self, valores):
+        valores = np.asarray(valores, dtype=float).ravel()
+        valores = valores[~np.isnan(valores)]
+        if valores.size == 0:
+            return self
+        self.n += valores.size
+        self.soma += valores.sum()
+        self.minimo = min(self.minimo, valores.min())
+        self.maximo = max(self.maximo, valores.max())
+        self.niveis[0] = np.concatenate([self.niveis[0], valores])
+        self._compactar()
+        return self
+
+    def mesclar(self, outro):
+        """Incorpora `outro` esboço (de outro bloco ou processo) a este."""
+        if outro.n == 0:
+            return self
+        self.n += outro.n
+        self.soma += outro.soma
+        self.minimo = min(self.minimo, outro.minimo)
+        self.maximo = max(self.maximo, outro.maximo)
+        while len(self.niveis) < len(outro.niveis):
+            self.niveis.append(np.empty(0))
+        for nivel, valores in enumerate(outro.niveis):
+            self.niveis[nivel] = np.concatenate([self.niveis[nivel], valores])
+        self._compactar()
+        return self
+
+    def _compactar(self):
+        nivel = 0
+        while nivel < len(self.niveis):
+            valores = self.niveis[nivel]
+            if valores.size <= self._capacidade(nivel):
+                nivel += 1
+                continue
+            if nivel + 1 == len(self.niveis):
+                # Um nível novo muda as capacidades: recomeça a verificação
+                self.niveis.append(np.empty(0))
+            valores = np.sort(valores)
+            # Com tamanho ímpar, o último valor fica no nível atual
+            resto = valores[valores.size - valores.size % 2:]
+            pares = valores[:valores.size - valores.size % 2]
+            # Sobe um de cada par (o primeiro ou o segundo, ao acaso), que
+            # passa a valer pelo dobro de valores originais
+            inicio = self._rng.integers(2)
+            self.niveis[nivel + 1] = np.concatenate([self.niveis[nivel + 1], pares[inicio::2]])
+            self.niveis[nivel] = resto
+            nivel = 0
+
+    def quantis(self, probabilidades):
+        """Quantis aproximados para o vetor de `probabilidades` (0 a 1)."""
+        if self.n == 0:
+            raise ValueError('Esboço vazio: nenhum valor foi adicionado')
+        valores = np.concatenate(self.niveis)
+        pesos = np.concatenate([np.full(v.size, 2.0 ** h) for h, v in enumerate(self.niveis)])
+        ordem = np.argsort(valores, kind='stable')
+        valores, acumulado = valores[ordem], np.cumsum(pesos[ordem])
+        probabilidades = np.asarray(probabilidades, dtype=float)
+        posicoes = np.searchsorted(acumulado, probabilidades * acumulado[-1], side='left')
+        resultado = valores[np.minimum(posicoes, valores.size - 1)]
+        # Extremos são guardados exatos
+        resultado = np.where(probabilidades <= 0, self.minimo, resultado)
+        return np.where(probabilidades >= 1, self.maximo, resultado)
+
+    def __len__(self):
+        return self.n
+
+
+def medidas_do_esboco(esboco, multiplicador=MULTIPLICADOR_IQR):
+    """MedidasEstatisticas a partir de um esboço (média, mínimo e máximo são exatos)."""
+    minimo, q1, q2, q3, maximo = esboco.quantis(PROBABILIDADES)
+    media = esboco.soma / esboco.n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distancia = abs((media - q2) / q2)
+    iqr = q3 - q1
+    return MedidasEstatisticas(
+        media=media,
+        mediana=q2,
+        distancia=distancia,
+        minimo=minimo,
+        q1=q1,
+        q2=q2,
+        q3=q3,
+        maximo=maximo,
+        amplitude_total=maximo - minimo,
+        iqr=iqr,
+        limite_inferior=q1 - (multiplicador * iqr),
+        limite_superior=q3 + (multiplicador * iqr),
+        erro_rank=esboco.erro,
+    )
+
+
+def esbocar_em_blocos(blocos, k=K_PADRAO, semente=SEMENTE_PADRAO):
+    """Constrói um esboço a partir de um iterável de arrays (blocos)."""
+    esboco = EsbocoKLL(k, semente)
+    for bloco in blocos:
+        esboco.atualizar(bloco)
+    return esboco
+
+
+def esbocar_csv(caminho, indicador, k=K_PADRAO, linhas_por_bloco=dados.LINHAS_POR_BLOCO,
+                semente=SEMENTE_PADRAO, inicio=None, fim=None):
+    """Esboço dos valores brutos (linha a linha) de `indicador`, lendo o CSV em blocos.
+
+    Com `inicio`/`fim` ('AAAA-MM'), ano e mês também são lidos e cada bloco é
+    filtrado antes de entrar no esboço.
+    """
+    periodo = periodo_para_int(inicio) is not None or periodo_para_int(fim, fim=True) is not None
+    colunas = [indicador, 'ano', 'mes'] if periodo else [indicador]
+    blocos = pd.read_csv(caminho, sep=dados.SEPARADOR, encoding=dados.CODIFICACAO,
+                         usecols=colunas, chunksize=linhas_por_bloco)
+    if periodo:
+        blocos = (filtrar_periodo(bloco, inicio, fim) for bloco in blocos)
+    return esbocar_em_blocos((bloco[indicador].to_numpy() for bloco in blocos), k, semente)
+
+
+def calcular_medidas_aproximadas(valores, k=K_PADRAO, tamanho_bloco=100_000,
+                                 multiplicador=MULTIPLICADOR_IQR, semente=SEMENTE_PADRAO):
+    """Como estatisticas.calcular_medidas, mas com quantis do esboço KLL."""
+    valores = np.asarray(valores)
+    blocos = (valores[i:i + tamanho_bloco] for i in range(0, valores.size, tamanho_bloco))
+    return medidas_do_esboco(esbocar_em_blocos(blocos, k, semente), multiplicador)
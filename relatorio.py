@@ -0,0 +1,411 @@
+# Ponto de entrada único dos relatórios de ocorrências
+#
+# Uso:
+#   python relatorio.py resumo   --indicador roubo_veiculo [--from 2023-01 --to 2023-12]
+#   python relatorio.py outliers --indicador roubo_veiculo
+#   python relatorio.py outliers --todos
+#   python relatorio.py grafico  --indicador roubo_veiculo --salvar painel.png
+#   python relatorio.py grafico  --indicador roubo_veiculo --grande --chave cisp --salvar p.png
+#   python relatorio.py outliers --indicador roubo_veiculo --por-100k
+#   python relatorio.py anomalias --indicador roubo_veiculo --modo sazonal --from 2024-01
+#   python relatorio.py exportar saida/ --formatos parquet json --por ano regiao
+#   python relatorio.py lote execucao/ --graficos --formatos parquet csv
+#
+# As bibliotecas pesadas são importadas só dentro de cada subcomando: um
+# resumo em texto nunca carrega o matplotlib. Com --profile-startup, o tempo
+# de importação de cada módulo é exibido ao final (útil para rodadas no cron).
+import argparse
+import importlib
+import sys
+import time
+
+
+INICIO = time.perf_counter()
+
+# Tempo gasto (em segundos) para importar cada módulo pela primeira vez
+TEMPOS_IMPORTACAO = {}
+
+
+def importar(nome):
+    """Importa `nome` sob demanda, registrando o tempo da primeira importação."""
+    if nome in sys.modules:
+        return sys.modules[nome]
+    inicio = time.perf_counter()
+    modulo = importlib.import_module(nome)
+    TEMPOS_IMPORTACAO[nome] = time.perf_counter() - inicio
+    return modulo
+
+
+def _importar_base():
+    # numpy e pandas primeiro, para que cada um apareça com o seu próprio tempo
+    importar('numpy')
+    importar('pandas')
+
+
+def _totalizar(args, indicadores=None):
+    agregacao = importar('agregacao')
+    indicadores = indicadores or [args.indicador]
+    df = agregacao.totalizar_ocorrencias(indicadores, inicio=args.inicio, fim=args.fim)
+    if args.por_100k:
+        df = importar('taxas').calcular_taxas(df, indicadores, args.populacao)
+    return df
+
+
+def _medidas(args, valores):
+    if args.quantis == 'aproximado':
+        quantis_aproximados = importar('quantis_aproximados')
+        return quantis_aproximados.calcular_medidas_aproximadas(valores, k=args.k)
+    return importar('estatisticas').calcular_medidas(valores, metodo=args.metodo)
+
+
+def _medidas_brutas(args):
+    # Valores linha a linha (por CISP e mês) em vez dos totais por município
+    if args.por_100k:
+        sys.exit('--por-100k não pode ser usado com --brutos (as taxas são por município)')
+    dados = importar('dados')
+    if args.quantis == 'aproximado':
+        # Lido em blocos direto do CSV: a coluna inteira nunca fica na memória
+        quantis_aproximados = importar('quantis_aproximados')
+        resultado = dados.obter_arquivo()
+        esboco = quantis_aproximados.esbocar_csv(resultado.caminho, args.indicador, k=args.k,
+                                                 inicio=args.inicio, fim=args.fim)
+        if not len(esboco):
+            sys.exit('Sem dados no período pedido')
+        return quantis_aproximados.medidas_do_esboco(esboco)
+    df = dados.ler_ocorrencias(colunas=[args.indicador, 'ano', 'mes'])
+    valores = importar('agregacao').filtrar_periodo(df, args.inicio, args.fim)[args.indicador]
+    if valores.empty:
+        sys.exit('Sem dados no período pedido')
+    return _medidas(args, valores.to_numpy())
+
+
+def _descrever_quantis(args, medidas):
+    if medidas.erro_rank:
+        return (f'Quantis aproximados (esboço KLL, k={args.k}): '
+                f'erro de rank de até ±{medidas.erro_rank:.2%}')
+    if args.quantis == 'aproximado':
+        return f'Quantis do esboço KLL (k={args.k}) sem compactação: erro de rank 0'
+    return f'Quantis exatos (np.quantile, método {args.metodo})'
+
+
+def comando_resumo(args):
+    _importar_base()
+    if args.brutos:
+        medidas = _medidas_brutas(args)
+    else:
+        df = _totalizar(args)
+        medidas = _medidas(args, df[args.indicador].to_numpy())
+
+    print(f'\nMEDIDAS - {args.indicador}')
+    print('~' * 67)
+    print(_descrever_quantis(args, medidas))
+    for nome, valor in medidas.como_dict().items():
+        print(f'{nome}: {valor}')
+
+
+def comando_outliers(args):
+    _importar_base()
+    estatisticas = importar('estatisticas')
+    if (args.por or args.todos) and args.quantis == 'aproximado':
+        sys.exit('--quantis aproximado não pode ser usado com --todos ou --por')
+    if args.por:
+        if args.por_100k:
+            sys.exit('--por-100k ainda não pode ser usado com --por')
+        paralelo = importar('paralelo')
+        df = importar('agregacao').filtrar_periodo(importar('dados').ler_ocorrencias(),
+                                                   args.inicio, args.fim)
+        indicadores = None if args.todos else [args.indicador]
+        resultado = paralelo.analisar_por_grupo(df, args.por, indicadores,
+                                                processos=args.processos, metodo=args.metodo)
+        colunas = [*args.por, 'indicador', 'q1', 'q3', 'iqr', 'limite_inferior', 'limite_superior']
+        print(resultado.medidas[colunas].to_string(index=False))
+        print()
+        print(resultado.outliers.to_string(index=False))
+        return
+    if args.todos:
+        populacao = importar('taxas').TabelaPopulacao.carregar(args.populacao) if args.por_100k else None
+        resultado = estatisticas.analisar_ocorrencias(metodo=args.metodo, populacao=populacao,
+                                                      inicio=args.inicio, fim=args.fim)
+        print(resultado.medidas.to_string())
+        print()
+        print(resultado.outliers.to_string())
+        return
+
+    df = _totalizar(args)
+    valores = df[args.indicador].to_numpy()
+    medidas = _medidas(args, valores)
+    print(_descrever_quantis(args, medidas))
+    print(f'Limites: {medidas.limite_inferior} a {medidas.limite_superior}')
+    extremos = estatisticas.selecionar_extremos(valores, medidas, k=0)
+    # Os dois em ordem crescente de valor
+    outliers = {
+        'inferiores': df.iloc[extremos.outliers_inferiores],
+        'superiores': df.iloc[extremos.outliers_superiores[::-1]],
+    }
+    for tipo, df_tipo in outliers.items():
+        print(f'\nOutliers {tipo}')
+        print(45 * '-')
+        if df_tipo.empty:
+            print(f'Não há outliers {tipo}')
+        else:
+            print(df_tipo.to_string(index=False))
+
+
+def comando_grafico(args):
+    _importar_base()
+    importar('matplotlib')
+    graficos = importar('graficos')
+    if args.salvar or args.indicadores:
+        graficos.usar_modo_headless()
+    if args.indicadores:
+        # Um painel por indicador, em DIRETORIO, renderizados em paralelo
+        if args.grande:
+            sys.exit('--grande gera o painel de um indicador por vez (use --indicador)')
+        if not args.salvar:
+            sys.exit('--indicadores precisa de --salvar DIRETORIO')
+        df = _totalizar(args, args.indicadores)
+        lista_dados = graficos.graficos_por_indicador(df, args.indicadores, metodo=args.metodo)
+        caminhos = graficos.renderizar_em_lote(lista_dados, args.salvar, args.formato,
+                                               args.processos, nomes=args.indicadores)
+        for caminho in caminhos:
+            print(f'Gráfico salvo em {caminho}')
+        return
+    if args.grande:
+        # Histograma, série mensal reduzida e só as maiores barras
+        if args.por_100k:
+            sys.exit('--por-100k ainda não pode ser usado com --grande')
+        visualizacao = importar('visualizacao')
+        parciais = importar('agregacao').atualizar_parciais([args.indicador], args.chave)
+        visualizacao.painel_grande(parciais, args.indicador, chave=args.chave, inicio=args.inicio,
+                                   fim=args.fim, metodo=args.metodo)
+        graficos.mostrar_ou_salvar(args.salvar)
+        return
+    df = _totalizar(args)
+    dados = graficos.DadosGrafico.de_dataframe(df, args.indicador)
+    dados.metodo = args.metodo
+    modelo = graficos.ModeloPainel()
+    modelo.desenhar(dados)
+    graficos.mostrar_ou_salvar(args.salvar)
+
+
+def comando_anomalias(args):
+    _importar_base()
+    anomalias = importar('anomalias')
+    resultado = anomalias.detectar_anomalias(args.indicador, modo=args.modo, janela=args.janela,
+                                             anos=args.anos, inicio=args.inicio, fim=args.fim,
+                                             metodo=args.metodo)
+    if args.modo == 'movel':
+        print(f'Base: mediana e IQR dos {args.janela} meses anteriores')
+    else:
+        print(f'Base: mesmo mês dos {args.anos} anos anteriores')
+    if resultado.empty:
+        print(f'Não há anomalias de {args.indicador} no período')
+        return
+    colunas = ['periodo', 'munic', 'valor', 'mediana', 'limite_inferior', 'limite_superior',
+               'escore', 'tipo']
+    print(resultado[colunas].to_string(index=False))
+
+
+def comando_exportar(args):
+    _importar_base()
+    dados = importar('dados')
+    exportacao = importar('exportacao')
+    estatisticas = importar('estatisticas')
+    df = importar('agregacao').filtrar_periodo(dados.ler_ocorrencias(), args.inicio, args.fim)
+    if args.por:
+        if args.por_100k:
+            sys.exit('--por-100k ainda não pode ser usado com --por')
+        paralelo = importar('paralelo')
+        # Um bloco por valor da primeira coluna (ex.: cada ano): só os
+        # resultados desse bloco ficam na memória até serem gravados
+        resultados = (paralelo.analisar_por_grupo(parte, args.por, processos=args.processos,
+                                                  metodo=args.metodo)
+                      for _, parte in df.groupby(args.por[0], observed=True, sort=True))
+    else:
+        indicadores = dados.colunas_indicadores(df)
+        df_agrupado = df[['munic', *indicadores]].groupby('munic', observed=True).sum().reset_index()
+        if args.por_100k:
+            df_agrupado = importar('taxas').calcular_taxas(df_agrupado, indicadores, args.populacao)
+        resultados = estatisticas.analisar_indicadores(df_agrupado, 'munic', indicadores,
+                                                       args.metodo)
+    metadados = {
+        'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'metodo': args.metodo,
+        'inicio': args.inicio,
+        'fim': args.fim,
+        'por': args.por or ['munic'],
+        'por_100k': args.por_100k,
+    }
+    arquivos = exportacao.exportar_resultados(resultados, args.diretorio, args.formatos,
+                                              metadados)
+    for tabela, caminhos in arquivos.items():
+        for caminho in caminhos.values():
+            print(f'{tabela}: {caminho}')
+
+
+def comando_lote(args):
+    _importar_base()
+    pipeline = importar('pipeline')
+    resultado = pipeline.executar_lote(args.diretorio, desde=args.desde,
+                                       indicadores=args.indicadores, por=args.por,
+                                       inicio=args.inicio, fim=args.fim, metodo=args.metodo,
+                                       graficos=args.graficos, formatos=args.formatos or (),
+                                       processos=args.processos)
+    print('\nETAPAS')
+    print('~' * 45)
+    print(resultado.resumo())
+    # Código de saída 1 quando algo falhou, mas com os resultados parciais gravados
+    if not resultado.ok:
+        sys.exit(1)
+
+
+def comando_baixar(args):
+    busca_async = importar('busca_async')
+    resultados = busca_async.obter_arquivos(args.conjuntos, limite_por_host=args.conexoes)
+    if any(isinstance(resultado, BaseException) for resultado in resultados.values()):
+        sys.exit(1)
+
+
+def imprimir_tempos_inicializacao():
+    print('\nTEMPOS DE INICIALIZAÇÃO', file=sys.stderr)
+    print('~' * 45, file=sys.stderr)
+    for nome, segundos in sorted(TEMPOS_IMPORTACAO.items(), key=lambda item: -item[1]):
+        print(f'import {nome:<20} {segundos * 1000:9.1f} ms', file=sys.stderr)
+    total = time.perf_counter() - INICIO
+    print(f'{"tempo total":<27} {total * 1000:9.1f} ms', file=sys.stderr)
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description='Relatórios de ocorrências do ISP-RJ')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='mostra o tempo de importação de cada módulo')
+    parser.add_argument('--metricas', metavar='ARQUIVO',
+                        help='grava tempo, CPU e memória de cada etapa em ARQUIVO (.jsonl); '
+                             'use - para a saída de erro')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    comandos = {
+        'resumo': (comando_resumo, 'medidas estatísticas de um indicador'),
+        'outliers': (comando_outliers, 'municípios fora dos limites de 1.5*IQR'),
+        'grafico': (comando_grafico, 'painel com boxplot, medidas e outliers'),
+    }
+    for nome, (funcao, ajuda) in comandos.items():
+        sub = subparsers.add_parser(nome, help=ajuda)
+        sub.set_defaults(funcao=funcao)
+        sub.add_argument('--indicador', default='roubo_veiculo')
+        sub.add_argument('--metodo', default='weibull', help='método do np.quantile')
+        # Mesmos argumentos de agregacao.adicionar_argumentos_periodo, repetidos
+        # aqui para não importar o pandas só para montar a linha de comando
+        sub.add_argument('--from', dest='inicio', metavar='AAAA-MM')
+        sub.add_argument('--to', dest='fim', metavar='AAAA-MM')
+        sub.add_argument('--por-100k', action='store_true',
+                         help='usa taxas por 100 mil habitantes em vez dos totais')
+        sub.add_argument('--populacao', metavar='ARQUIVO',
+                         help='tabela de população (CSV ou URL) para --por-100k '
+                              '(padrão: ISP_POPULACAO ou a do ISP)')
+        if nome in ('resumo', 'outliers'):
+            sub.add_argument('--quantis', choices=('exato', 'aproximado'), default='exato',
+                             help='quantis exatos (np.quantile) ou de um esboço KLL em fluxo')
+            sub.add_argument('--k', type=int, default=200,
+                             help='tamanho do esboço KLL (maior = mais preciso)')
+        if nome == 'resumo':
+            sub.add_argument('--brutos', action='store_true',
+                             help='usa os valores de cada linha (CISP/mês) em vez dos '
+                                  'totais por município')
+        if nome == 'outliers':
+            sub.add_argument('--todos', action='store_true',
+                             help='analisa todos os indicadores de uma vez')
+            sub.add_argument('--por', nargs='+', metavar='COLUNA',
+                             help='limites e outliers por grupo (ex.: --por ano regiao), '
+                                  'calculados em vários processos')
+            sub.add_argument('--processos', type=int,
+                             help='número de processos para --por (padrão: núcleos da CPU)')
+        if nome == 'grafico':
+            sub.add_argument('--salvar', metavar='ARQUIVO',
+                             help='salva em ARQUIVO (.png ou .svg) em vez de abrir a janela; '
+                                  'com --indicadores, o diretório dos painéis')
+            sub.add_argument('--indicadores', nargs='+', metavar='INDICADOR',
+                             help='um painel por indicador, gravados em --salvar DIRETORIO')
+            sub.add_argument('--formato', choices=('png', 'svg'), default='png',
+                             help='formato dos painéis de --indicadores')
+            sub.add_argument('--processos', type=int,
+                             help='processos para --indicadores (padrão: núcleos da CPU)')
+            sub.add_argument('--grande', action='store_true',
+                             help='painel reduzido (histograma, série mensal e maiores '
+                                  'outliers), para muitos municípios/CISPs')
+            sub.add_argument('--chave', choices=('munic', 'cisp'), default='munic',
+                             help='unidade de cada valor no painel --grande')
+
+    anomalias = subparsers.add_parser('anomalias',
+                                      help='meses fora do padrão do próprio município')
+    anomalias.set_defaults(funcao=comando_anomalias)
+    anomalias.add_argument('--indicador', default='roubo_veiculo')
+    anomalias.add_argument('--metodo', default='weibull', help='método do np.quantile')
+    anomalias.add_argument('--from', dest='inicio', metavar='AAAA-MM')
+    anomalias.add_argument('--to', dest='fim', metavar='AAAA-MM')
+    anomalias.add_argument('--modo', choices=('movel', 'sazonal'), default='movel',
+                           help='base dos meses anteriores (movel) ou do mesmo mês em '
+                                'anos anteriores (sazonal)')
+    anomalias.add_argument('--janela', type=int, default=12, help='meses da base no modo movel')
+    anomalias.add_argument('--anos', type=int, default=3, help='anos da base no modo sazonal')
+
+    exportar = subparsers.add_parser('exportar',
+                                     help='grava medidas e outliers de todos os indicadores '
+                                          'em parquet, json e csv')
+    exportar.set_defaults(funcao=comando_exportar)
+    exportar.add_argument('diretorio', help='diretório de saída')
+    exportar.add_argument('--formatos', nargs='+', choices=('parquet', 'json', 'csv'),
+                          default=['parquet', 'json', 'csv'])
+    exportar.add_argument('--metodo', default='weibull', help='método do np.quantile')
+    exportar.add_argument('--from', dest='inicio', metavar='AAAA-MM')
+    exportar.add_argument('--to', dest='fim', metavar='AAAA-MM')
+    exportar.add_argument('--por', nargs='+', metavar='COLUNA',
+                          help='medidas e outliers por grupo (ex.: --por ano regiao)')
+    exportar.add_argument('--processos', type=int,
+                          help='número de processos para --por (padrão: núcleos da CPU)')
+    exportar.add_argument('--por-100k', action='store_true',
+                          help='taxas por 100 mil habitantes (sem --por)')
+    exportar.add_argument('--populacao', metavar='ARQUIVO', help='tabela de população')
+
+    lote = subparsers.add_parser('lote',
+                                 help='análise de todos os indicadores em etapas, retomando '
+                                      'de onde a última execução parou')
+    lote.set_defaults(funcao=comando_lote)
+    lote.add_argument('diretorio', help='diretório com o estado e os resultados de cada etapa')
+    lote.add_argument('--indicadores', nargs='+', metavar='INDICADOR',
+                      help='indicadores analisados (padrão: todos)')
+    lote.add_argument('--metodo', default='weibull', help='método do np.quantile')
+    lote.add_argument('--from', dest='inicio', metavar='AAAA-MM')
+    lote.add_argument('--to', dest='fim', metavar='AAAA-MM')
+    lote.add_argument('--por', nargs='+', metavar='COLUNA',
+                      help='medidas e outliers por grupo (ex.: --por ano regiao)')
+    lote.add_argument('--processos', type=int, default=1,
+                      help='número de processos para --por (padrão: 1)')
+    lote.add_argument('--graficos', action='store_true', help='gera um painel por indicador')
+    lote.add_argument('--formatos', nargs='+', choices=('parquet', 'json', 'csv'),
+                      help='exporta medidas e outliers nesses formatos')
+    lote.add_argument('--desde', choices=('dados', 'agregacao', 'estatisticas', 'graficos',
+                                          'exportacao'),
+                      help='refaz a partir desta etapa, mesmo que já esteja concluída')
+
+    baixar = subparsers.add_parser('baixar', help='baixa vários arquivos do ISP ao mesmo tempo')
+    baixar.set_defaults(funcao=comando_baixar)
+    baixar.add_argument('conjuntos', nargs='+', metavar='CONJUNTO',
+                        help='cisp_mensal, municipio_mensal, populacao_cisp ou uma URL')
+    baixar.add_argument('--conexoes', type=int, default=4, help='conexões por servidor')
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.metricas:
+        importar('instrumentacao').ativar(None if args.metricas == '-' else args.metricas)
+    try:
+        args.funcao(args)
+    finally:
+        if args.profile_startup:
+            imprimir_tempos_inicializacao()
+
+
+if __name__ == '__main__':
+    main()
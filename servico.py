@@ -0,0 +1,360 @@
+# Serviço local de relatórios (HTTP/JSON) com os dados já carregados
+#
+# Cada script lê, agrega e calcula tudo do zero a cada execução. Este serviço
+# carrega as parciais mensais de todos os indicadores uma vez e responde às
+# consultas em JSON a partir da memória:
+#   GET  /saude                          versão dos dados e tamanho
+#   GET  /indicadores                    lista de indicadores
+#   GET  /medidas?indicador=X            medidas estatísticas
+#   GET  /outliers?indicador=X           outliers (sem indicador: todos)
+#   GET  /top?indicador=X&n=10&ordem=maiores|menores
+#   GET  /indicador/X                    medidas, menores/maiores e outliers
+#   POST /recarregar                     recarrega os dados agora
+# Todas as consultas aceitam from/to (AAAA-MM) e metodo (do np.quantile).
+#
+# As respostas de cada combinação de parâmetros ficam guardadas enquanto os
+# dados não mudam. Uma thread confere o arquivo do ISP a cada `intervalo`
+# segundos (respeitando o ISP_CACHE_TTL) e, quando sai uma versão nova,
+# carrega os dados em segundo plano e troca o estado de uma vez: as consultas
+# em andamento terminam com a versão antiga.
+#
+# Uso:
+#   python servico.py --porta 8000 --intervalo 600
+import argparse
+import json
+import math
+import threading
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import dados
+from agregacao import atualizar_parciais, totalizar_periodo
+from estatisticas import analisar_indicador, analisar_indicadores, selecionar_extremos
+from municipios import indice_padrao
+
+
+PORTA_PADRAO = 8000
+INTERVALO_PADRAO = 600
+TOP_N_PADRAO = 10
+
+# Quantos resultados diferentes cada versão dos dados guarda
+LIMITE_RESPOSTAS = 512
+
+
+class ErroConsulta(Exception):
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def _limpar(valor):
+    """Converte tipos do numpy/pandas em tipos do JSON (NaN vira null)."""
+    if isinstance(valor, pd.DataFrame):
+        return [_limpar(linha) for linha in valor.to_dict('records')]
+    if isinstance(valor, dict):
+        return {str(chave): _limpar(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple, np.ndarray)):
+        return [_limpar(item) for item in valor]
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    return valor
+
+
+class EstadoDados:
+    """Parciais mensais de uma versão dos dados e os resultados já calculados."""
+
+    def __init__(self, parciais, indicadores, caminho, versao, diretorio_cache=None):
+        self.parciais = parciais
+        self.indicadores = indicadores
+        self.caminho = caminho
+        self.versao = versao
+        self.carregado_em = time.time()
+        self.assinatura = _assinatura(caminho)
+        self.indice = indice_padrao(diretorio_cache)
+        self._respostas = {}
+        self._trava = threading.Lock()
+
+    def _memo(self, chave, calcular):
+        with self._trava:
+            if chave in self._respostas:
+                return self._respostas[chave]
+        # Calculado fora da trava: consultas diferentes não esperam umas pelas
+        # outras (duas iguais ao mesmo tempo só calculam em dobro)
+        resultado = calcular()
+        with self._trava:
+            if len(self._respostas) >= LIMITE_RESPOSTAS:
+                self._respostas.pop(next(iter(self._respostas)))
+            self._respostas[chave] = resultado
+        return resultado
+
+    def totais(self, inicio=None, fim=None):
+        return self._memo(('totais', inicio, fim), lambda: totalizar_periodo(
+            self.parciais, self.indicadores, 'munic', inicio, fim, self.indice))
+
+    def _totais_com_dados(self, inicio, fim):
+        # Sem nenhum mês no período não há quartis: a consulta vira um 404
+        df = self.totais(inicio, fim)
+        if df.empty:
+            raise ErroConsulta(f'Sem dados no período {inicio or "início"} a {fim or "fim"}', 404)
+        return df
+
+    def analise(self, indicador, inicio=None, fim=None, metodo='weibull'):
+        if indicador not in self.indicadores:
+            raise ErroConsulta(f'Indicador desconhecido: {indicador}', 404)
+        df = self._totais_com_dados(inicio, fim)
+        return self._memo(('analise', indicador, inicio, fim, metodo), lambda: analisar_indicador(
+            df[['munic', indicador]], indicador, metodo))
+
+    def lote(self, inicio=None, fim=None, metodo='weibull'):
+        df = self._totais_com_dados(inicio, fim)
+        return self._memo(('lote', inicio, fim, metodo), lambda: analisar_indicadores(
+            df, 'munic', self.indicadores, metodo))
+
+
+def _assinatura(caminho):
+    estado = caminho.stat()
+    return estado.st_size, estado.st_mtime_ns
+
+
+def carregar_estado(**opcoes_cache):
+    """Baixa/revalida os dados e carrega as parciais mensais de todos os indicadores."""
+    resultado = dados.obter_arquivo(**opcoes_cache)
+    amostra = pd.read_csv(resultado.caminho, sep=dados.SEPARADOR, encoding=dados.CODIFICACAO,
+                          nrows=1000)
+    indicadores = dados.colunas_indicadores(amostra)
+    # O mesmo arquivo revalidado acima: as parciais são conferidas pela impressão digital dele
+    parciais = atualizar_parciais(indicadores, arquivo=resultado, **opcoes_cache)
+    return EstadoDados(parciais, indicadores, resultado.caminho,
+                       dados.impressao_digital(resultado.caminho)[:16],
+                       opcoes_cache.get('diretorio_cache'))
+
+
+class Servico:
+    """Guarda o estado atual e o troca quando os dados mudam."""
+
+    def __init__(self, intervalo=INTERVALO_PADRAO, **opcoes_cache):
+        self.intervalo = intervalo
+        self.opcoes_cache = opcoes_cache
+        self.estado = carregar_estado(**opcoes_cache)
+        self._trava_recarga = threading.Lock()
+        self._parar = threading.Event()
+
+    def recarregar(self, forcar=False):
+        """Carrega a versão nova dos dados, se houver; devolve se a versão mudou.
+
+        Com `forcar`, o estado é recarregado mesmo com a versão igual (as
+        respostas guardadas são descartadas), mas o retorno continua dizendo
+        só se os dados mudaram.
+        """
+        with self._trava_recarga:
+            resultado = dados.obter_arquivo(**self.opcoes_cache)
+            if not forcar and _assinatura(resultado.caminho) == self.estado.assinatura:
+                return False
+            novo = carregar_estado(**self.opcoes_cache)
+            mudou = novo.versao != self.estado.versao
+            if not forcar and not mudou:
+                # Mesmo conteúdo com data nova: só atualiza a assinatura
+                self.estado.assinatura = novo.assinatura
+                return False
+            # Troca de referência: quem já pegou o estado antigo segue com ele
+            self.estado = novo
+            if mudou:
+                print(f'Dados recarregados: versão {novo.versao}')
+            return mudou
+
+    def _vigiar(self):
+        while not self._parar.wait(self.intervalo):
+            try:
+                self.recarregar()
+            except Exception as e:
+                # Falha de rede ou arquivo inválido: continua com a versão atual
+                print(f'Falha ao recarregar os dados: {e}')
+
+    def iniciar_vigia(self):
+        threading.Thread(target=self._vigiar, name='vigia-dados', daemon=True).start()
+
+    def parar(self):
+        self._parar.set()
+
+
+def _parametros(consulta):
+    valores = {nome: lista[-1] for nome, lista in parse_qs(consulta).items()}
+    return {
+        'inicio': valores.get('from'),
+        'fim': valores.get('to'),
+        'metodo': valores.get('metodo', 'weibull'),
+        'indicador': valores.get('indicador'),
+        'n': valores.get('n', str(TOP_N_PADRAO)),
+        'ordem': valores.get('ordem', 'maiores'),
+    }
+
+
+def _exigir_indicador(parametros):
+    if not parametros['indicador']:
+        raise ErroConsulta('Informe o parâmetro indicador')
+    return parametros['indicador']
+
+
+def rota_saude(estado, parametros):
+    return {
+        'versao': estado.versao,
+        'carregado_em': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(estado.carregado_em)),
+        'indicadores': len(estado.indicadores),
+        'linhas_parciais': len(estado.parciais),
+    }
+
+
+def rota_indicadores(estado, parametros):
+    return estado.indicadores
+
+
+def rota_medidas(estado, parametros):
+    analise = estado.analise(_exigir_indicador(parametros), parametros['inicio'],
+                             parametros['fim'], parametros['metodo'])
+    return analise.medidas.como_dict()
+
+
+def rota_outliers(estado, parametros):
+    if not parametros['indicador']:
+        return estado.lote(parametros['inicio'], parametros['fim'], parametros['metodo']).outliers
+    analise = estado.analise(parametros['indicador'], parametros['inicio'], parametros['fim'],
+                             parametros['metodo'])
+    return {
+        'limite_inferior': analise.medidas.limite_inferior,
+        'limite_superior': analise.medidas.limite_superior,
+        'inferiores': analise.outliers_inferiores,
+        'superiores': analise.outliers_superiores,
+    }
+
+
+def rota_top(estado, parametros):
+    indicador = _exigir_indicador(parametros)
+    # Só dígitos: recusa negativos, frações (3.5) e sinais
+    if not parametros['n'].isdecimal():
+        raise ErroConsulta(f'n deve ser um inteiro não negativo: {parametros["n"]}')
+    n = int(parametros['n'])
+    if parametros['ordem'] not in ('maiores', 'menores'):
+        raise ErroConsulta('ordem deve ser maiores ou menores')
+    analise = estado.analise(indicador, parametros['inicio'], parametros['fim'],
+                             parametros['metodo'])
+    df = analise.df_agrupado
+    extremos = selecionar_extremos(df[indicador].to_numpy(), analise.medidas, k=n)
+    if parametros['ordem'] == 'maiores':
+        return df.iloc[extremos.maiores_k]
+    return df.iloc[extremos.menores_k]
+
+
+def rota_indicador(estado, parametros):
+    analise = estado.analise(parametros['indicador'], parametros['inicio'], parametros['fim'],
+                             parametros['metodo'])
+    return {
+        'medidas': analise.medidas.como_dict(),
+        'menores': analise.menores,
+        'maiores': analise.maiores,
+        'outliers_inferiores': analise.outliers_inferiores,
+        'outliers_superiores': analise.outliers_superiores,
+    }
+
+
+ROTAS = {
+    '/saude': rota_saude,
+    '/indicadores': rota_indicadores,
+    '/medidas': rota_medidas,
+    '/outliers': rota_outliers,
+    '/top': rota_top,
+}
+
+
+class ManipuladorRelatorios(BaseHTTPRequestHandler):
+    # Definido em criar_servidor
+    servico = None
+
+    def _responder(self, status, conteudo):
+        corpo = json.dumps(_limpar(conteudo), ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        partes = urlsplit(self.path)
+        parametros = _parametros(partes.query)
+        caminho = partes.path.rstrip('/') or '/'
+        rota = ROTAS.get(caminho)
+        if rota is None and caminho.startswith('/indicador/'):
+            parametros['indicador'] = caminho[len('/indicador/'):]
+            rota = rota_indicador
+        if rota is None:
+            self._responder(404, {'erro': f'Rota desconhecida: {caminho}'})
+            return
+        # O estado é lido uma vez: a consulta inteira usa a mesma versão
+        estado = self.servico.estado
+        try:
+            self._responder(200, rota(estado, parametros))
+        except ErroConsulta as e:
+            self._responder(e.status, {'erro': str(e)})
+        except ValueError as e:
+            # Ex.: período inválido em from/to
+            self._responder(400, {'erro': str(e)})
+        except Exception as e:
+            self._erro_interno(e)
+
+    def _erro_interno(self, erro):
+        # Qualquer outra falha: o cliente recebe um 500 em JSON e o traceback fica no log
+        self.log_error('%s', traceback.format_exc())
+        self._responder(500, {'erro': f'Erro interno: {type(erro).__name__}: {erro}'})
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip('/') != '/recarregar':
+            self._responder(404, {'erro': f'Rota desconhecida: {self.path}'})
+            return
+        try:
+            mudou = self.servico.recarregar(forcar=True)
+        except Exception as e:
+            self._erro_interno(e)
+            return
+        self._responder(200, {'recarregado': mudou, 'versao': self.servico.estado.versao})
+
+
+class ServidorRelatorios(ThreadingHTTPServer):
+    daemon_threads = True
+    # A fila padrão (5) recusa conexões em rajadas de consultas simultâneas
+    request_queue_size = 128
+
+
+def criar_servidor(servico, host='127.0.0.1', porta=PORTA_PADRAO):
+    manipulador = type('Manipulador', (ManipuladorRelatorios,), {'servico': servico})
+    return ServidorRelatorios((host, porta), manipulador)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serviço HTTP/JSON dos relatórios do ISP-RJ')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=PORTA_PADRAO)
+    parser.add_argument('--intervalo', type=float, default=INTERVALO_PADRAO,
+                        help='segundos entre as verificações de dados novos')
+    args = parser.parse_args(argv)
+
+    servico = Servico(args.intervalo)
+    servico.iniciar_vigia()
+    servidor = criar_servidor(servico, args.host, args.porta)
+    print(f'Servindo em http://{args.host}:{args.porta} (dados versão {servico.estado.versao})')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servico.parar()
+        servidor.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+# Taxas por 100 mil habitantes
+#
+# O total de roubo_veiculo por município mede, antes de tudo, o tamanho da
+# população: os "outliers superiores" são sempre as mesmas cidades grandes.
+# Aqui os totais viram taxas por 100 mil habitantes.
+#
+# A junção com a tabela de população não é um merge por nome (os nomes têm
+# acentos e grafias diferentes): a população é guardada em um array indexado
+# pelo código inteiro do município (municipios.IndiceMunicipios), calculado
+# uma vez. Depois disso, a taxa de todos os indicadores é uma única operação
+# de arrays: matriz (municípios x indicadores) / populacao[codigos].
+#
+# A tabela de população pode ter uma linha por município ou por CISP (como a
+# PopulacaoEvolucaoMensalCisp.csv do ISP); com ano/mês, vale o período mais
+# recente. Variável de ambiente:
+#   ISP_POPULACAO - caminho ou URL da tabela de população
+#                   (padrão: PopulacaoEvolucaoMensalCisp.csv do ISP)
+import os
+
+import numpy as np
+import pandas as pd
+
+import dados
+from instrumentacao import etapa
+from municipios import caminho_indice, indice_padrao
+
+
+POR_HABITANTES = 100_000
+
+ENDERECO_POPULACAO = 'https://www.ispdados.rj.gov.br/Arquivos/PopulacaoEvolucaoMensalCisp.csv'
+
+# Nomes de coluna usados nas tabelas de população do ISP e do IBGE
+COLUNAS_POPULACAO = ('populacao', 'pop', 'pop_circ', 'pop_munic', 'pop_cisp')
+COLUNAS_CISP = ('cisp', 'circ')
+COLUNAS_ANO = ('ano', 'vano')
+
+
+def _primeira_coluna(df, candidatas):
+    return next((coluna for coluna in candidatas if coluna in df.columns), None)
+
+
+def ler_populacao(origem=None, coluna_munic='munic', coluna_populacao=None, **opcoes_cache):
+    """Tabela munic -> populacao a partir de um CSV local ou de uma URL (via cache).
+
+    Tabelas por CISP sem a coluna do município são ligadas ao município pelo
+    par cisp/munic dos próprios dados de ocorrências.
+    """
+    origem = origem or os.environ.get('ISP_POPULACAO') or ENDERECO_POPULACAO
+    if '://' in str(origem):
+        origem = dados.obter_arquivo(endereco=origem, **opcoes_cache).caminho
+
+    with etapa('leitura_populacao', origem=str(origem)):
+        df = pd.read_csv(origem, sep=dados.SEPARADOR, encoding=dados.CODIFICACAO)
+        df.columns = df.columns.str.strip().str.lower()
+    coluna_populacao = coluna_populacao or _primeira_coluna(df, COLUNAS_POPULACAO)
+    if coluna_populacao is None:
+        raise ValueError(f'Coluna de população não encontrada em {origem} '
+                         f'(esperado uma de {", ".join(COLUNAS_POPULACAO)})')
+
+    # Com várias datas, fica só o período mais recente
+    coluna_ano = _primeira_coluna(df, COLUNAS_ANO)
+    if coluna_ano is not None:
+        periodo = df[coluna_ano] * 100 + (df['mes'] if 'mes' in df.columns else 0)
+        df = df[periodo == periodo.max()]
+
+    if coluna_munic not in df.columns:
+        coluna_cisp = _primeira_coluna(df, COLUNAS_CISP)
+        if coluna_cisp is None:
+            raise ValueError(f'{origem} não tem coluna de município nem de CISP')
+        pares = (dados.ler_ocorrencias(colunas=['cisp', coluna_munic], **opcoes_cache)
+                 .drop_duplicates('cisp'))
+        # cisp -> município por indexação: array do tamanho do maior código de CISP
+        cisps = pares['cisp'].to_numpy(dtype=np.int64)
+        munic_por_cisp = np.full(cisps.max() + 1, None, dtype=object)
+        munic_por_cisp[cisps] = pares[coluna_munic].astype(str).to_numpy()
+        cisps_populacao = df[coluna_cisp].to_numpy(dtype=np.int64)
+        conhecidas = cisps_populacao < len(munic_por_cisp)
+        nomes = np.full(len(df), None, dtype=object)
+        nomes[conhecidas] = munic_por_cisp[cisps_populacao[conhecidas]]
+        df = df.assign(**{coluna_munic: nomes}).dropna(subset=[coluna_munic])
+
+    return pd.DataFrame({'munic': df[coluna_munic].astype(str).to_numpy(),
+                         'populacao': pd.to_numeric(df[coluna_populacao]).to_numpy()})
+
+
+class TabelaPopulacao:
+    """População em um array indexado pelo código do município."""
+
+    def __init__(self, df_populacao, indice=None, diretorio_cache=None):
+        self.indice = indice if indice is not None else indice_padrao(diretorio_cache)
+        tamanho_antes = len(self.indice)
+        codigos = self.indice.codificar(df_populacao['munic'])
+        if len(self.indice) != tamanho_antes and indice is None:
+            self.indice.salvar(caminho_indice(diretorio_cache))
+
+        # Linhas repetidas do mesmo município (CISPs) são somadas
+        valores = df_populacao['populacao'].to_numpy(dtype=np.float64)
+        self.populacao = np.bincount(codigos, weights=valores, minlength=len(self.indice))
+        presentes = np.bincount(codigos, minlength=len(self.indice)) > 0
+        self.populacao[~presentes] = np.nan
+
+    @classmethod
+    def carregar(cls, origem=None, diretorio_cache=None, **opcoes):
+        return cls(ler_populacao(origem, diretorio_cache=diretorio_cache, **opcoes),
+                   diretorio_cache=diretorio_cache)
+
+    def populacao_de(self, nomes):
+        """População de cada nome (NaN quando o município não está na tabela)."""
+        if isinstance(nomes, pd.Series):
+            codigos = self.indice.codificar_coluna(nomes, adicionar=False)
+        else:
+            codigos = self.indice.codificar(nomes, adicionar=False)
+        # Códigos criados depois da tabela também ficam sem população
+        conhecidos = (codigos >= 0) & (codigos < len(self.populacao))
+        populacao = np.full(len(codigos), np.nan)
+        populacao[conhecidos] = self.populacao[codigos[conhecidos]]
+        return populacao
+
+    def taxas(self, df_agrupado, indicadores, chave='munic', por=POR_HABITANTES):
+        """Troca os totais de `indicadores` por taxas por `por` habitantes.
+
+        Municípios sem população conhecida (ou com população zero) são
+        retirados, com aviso: uma taxa NaN atrapalharia os quantis.
+        """
+        with etapa('taxas', municipios=len(df_agrupado), indicadores=len(indicadores)):
+            populacao = self.populacao_de(df_agrupado[chave])
+            validos = populacao > 0
+            if not validos.all():
+                faltando = df_agrupado.loc[~validos, chave].astype(str).tolist()
+                print(f'Sem população para {len(faltando)} município(s), ignorado(s): '
+                      f'{", ".join(faltando)}')
+            matriz = df_agrupado.loc[validos, indicadores].to_numpy(dtype=np.float64)
+            df_taxas = df_agrupado.loc[validos].copy()
+            df_taxas[indicadores] = matriz / populacao[validos, None] * por
+            return df_taxas.reset_index(drop=True)
+
+
+def calcular_taxas(df_agrupado, indicadores, populacao=None, chave='munic', por=POR_HABITANTES):
+    """Atalho: taxas por 100 mil habitantes com a tabela de população padrão."""
+    tabela = populacao if isinstance(populacao, TabelaPopulacao) else TabelaPopulacao.carregar(populacao)
+    return tabela.taxas(df_agrupado, indicadores, chave, por)
@@ -0,0 +1,50 @@
+# Configuração comum dos testes: os módulos ficam na raiz do repositório
+import functools
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class _Manipulador(SimpleHTTPRequestHandler):
+    # HTTP/1.1 para exercitar o keep-alive; responde 304 a If-Modified-Since
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor_http(tmp_path):
+    """Servidor http.server local servindo `tmp_path / 'www'`; devolve (url_base, pasta)."""
+    pasta = tmp_path / 'www'
+    pasta.mkdir()
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0),
+                                   functools.partial(_Manipulador, directory=str(pasta)))
+    linha = threading.Thread(target=servidor.serve_forever, args=(0.05,), daemon=True)
+    linha.start()
+    try:
+        yield f'http://127.0.0.1:{servidor.server_address[1]}', pasta
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+@pytest.fixture
+def gravar_csv_isp():
+    """Função que grava um DataFrame no formato do CSV do ISP (';', Latin-1)."""
+    import dados
+
+    def gravar(df, caminho, modificado_ns=None):
+        df.to_csv(caminho, sep=dados.SEPARADOR, encoding=dados.CODIFICACAO, index=False)
+        if modificado_ns is not None:
+            # Data de modificação explícita: duas gravações seguidas nunca empatam
+            os.utime(caminho, ns=(modificado_ns, modificado_ns))
+        return caminho
+
+    return gravar
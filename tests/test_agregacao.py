@@ -0,0 +1,138 @@
+import pandas as pd
+import pytest
+
+import agregacao
+
+MUNICIPIOS = ['Niterói', 'Rio de Janeiro', 'São Gonçalo']
+
+
+def _linhas(meses, valor=1):
+    # Uma linha por CISP (duas por município) e mês
+    linhas = []
+    for ano, mes in meses:
+        for i, munic in enumerate(MUNICIPIOS):
+            for cisp in (2 * i, 2 * i + 1):
+                linhas.append({'cisp': cisp, 'mes': mes, 'ano': ano, 'munic': munic,
+                               'roubo_veiculo': valor * (cisp + mes),
+                               'furto_veiculos': 10 * valor + cisp})
+    return pd.DataFrame(linhas)
+
+
+def _esperado(df, indicadores):
+    return (df.groupby('munic')[indicadores].sum().reset_index()
+            .sort_values('munic', ignore_index=True))
+
+
+def _totalizar(indicadores, csv, cache, **periodo):
+    df = agregacao.totalizar_ocorrencias(indicadores, endereco=str(csv), diretorio_cache=cache,
+                                         **periodo)
+    df['munic'] = df['munic'].astype(str)
+    return df
+
+
+@pytest.fixture
+def caminhos(tmp_path):
+    return tmp_path / 'BaseDPEvolucaoMensalCisp.csv', tmp_path / 'cache'
+
+
+def test_mes_novo_entra_com_todos_os_indicadores(caminhos, gravar_csv_isp):
+    csv, cache = caminhos
+    jan_fev = _linhas([(2023, 1), (2023, 2)])
+    gravar_csv_isp(jan_fev, csv, modificado_ns=1_000_000_000)
+    _totalizar(['roubo_veiculo'], csv, cache)
+    _totalizar(['furto_veiculos'], csv, cache)
+
+    # Março publicado: quem pede só um indicador não deixa o outro sem o mês novo
+    jan_mar = pd.concat([jan_fev, _linhas([(2023, 3)])], ignore_index=True)
+    gravar_csv_isp(jan_mar, csv, modificado_ns=2_000_000_000)
+    _totalizar(['roubo_veiculo'], csv, cache)
+    total = _totalizar(['roubo_veiculo', 'furto_veiculos'], csv, cache)
+    pd.testing.assert_frame_equal(total, _esperado(jan_mar, ['roubo_veiculo', 'furto_veiculos']),
+                                  check_dtype=False)
+
+    so_marco = _totalizar(['furto_veiculos'], csv, cache, inicio='2023-03', fim='2023-03')
+    assert not so_marco['furto_veiculos'].isna().any()
+    pd.testing.assert_frame_equal(so_marco, _esperado(_linhas([(2023, 3)]), ['furto_veiculos']),
+                                  check_dtype=False)
+
+
+def test_revisao_de_mes_antigo_refaz_as_parciais(caminhos, gravar_csv_isp):
+    csv, cache = caminhos
+    original = _linhas([(2023, 1), (2023, 2)])
+    gravar_csv_isp(original, csv, modificado_ns=1_000_000_000)
+    _totalizar(['roubo_veiculo'], csv, cache)
+
+    # O ISP revisa janeiro sem acrescentar meses
+    revisado = original.copy()
+    revisado.loc[revisado['mes'] == 1, 'roubo_veiculo'] += 5
+    gravar_csv_isp(revisado, csv, modificado_ns=2_000_000_000)
+    total = _totalizar(['roubo_veiculo'], csv, cache)
+    pd.testing.assert_frame_equal(total, _esperado(revisado, ['roubo_veiculo']),
+                                  check_dtype=False)
+
+
+def test_outro_arquivo_nao_usa_as_parciais_guardadas(tmp_path, gravar_csv_isp):
+    cache = tmp_path / 'cache'
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    df_a = _linhas([(2023, 1)])
+    df_b = _linhas([(2023, 1), (2023, 2)], valor=3)
+    csv_a = gravar_csv_isp(df_a, tmp_path / 'a' / 'x.csv')
+    csv_b = gravar_csv_isp(df_b, tmp_path / 'b' / 'x.csv')
+
+    pd.testing.assert_frame_equal(_totalizar(['roubo_veiculo'], csv_a, cache),
+                                  _esperado(df_a, ['roubo_veiculo']), check_dtype=False)
+    pd.testing.assert_frame_equal(_totalizar(['roubo_veiculo'], csv_b, cache),
+                                  _esperado(df_b, ['roubo_veiculo']), check_dtype=False)
+
+
+def test_so_meses_novos_ou_revisados_sao_somados(caminhos, gravar_csv_isp, monkeypatch):
+    csv, cache = caminhos
+    original = _linhas([(2023, 1), (2023, 2), (2023, 3)])
+    gravar_csv_isp(original, csv, modificado_ns=1_000_000_000)
+    _totalizar(['roubo_veiculo', 'furto_veiculos'], csv, cache)
+
+    etapas = []
+    etapa_original = agregacao.etapa
+
+    def registrar(nome, **campos):
+        etapas.append((nome, campos))
+        return etapa_original(nome, **campos)
+
+    monkeypatch.setattr(agregacao, 'etapa', registrar)
+    # Fevereiro revisado e abril publicado; janeiro e março continuam iguais
+    nova = pd.concat([original, _linhas([(2023, 4)])], ignore_index=True)
+    nova.loc[nova['mes'] == 2, 'furto_veiculos'] += 7
+    gravar_csv_isp(nova, csv, modificado_ns=2_000_000_000)
+    parciais = agregacao.atualizar_parciais(['roubo_veiculo'], endereco=str(csv),
+                                            diretorio_cache=cache)
+    campos = dict(etapas)['agregacao']
+    assert campos['incremental'] and campos['meses'] == 2
+    assert campos['linhas'] == 2 * 2 * len(MUNICIPIOS)
+
+    refeitas = agregacao.atualizar_parciais(['roubo_veiculo', 'furto_veiculos'],
+                                            endereco=str(csv), diretorio_cache=cache,
+                                            reconstruir=True)
+    pd.testing.assert_frame_equal(parciais, refeitas)
+    total = _totalizar(['roubo_veiculo', 'furto_veiculos'], csv, cache)
+    pd.testing.assert_frame_equal(total, _esperado(nova, ['roubo_veiculo', 'furto_veiculos']),
+                                  check_dtype=False)
+
+
+def test_parciais_por_cisp_em_int32(caminhos, gravar_csv_isp):
+    csv, cache = caminhos
+    df = _linhas([(2023, 1), (2023, 2)])
+    gravar_csv_isp(df, csv)
+    parciais = agregacao.atualizar_parciais(['roubo_veiculo'], 'cisp', endereco=str(csv),
+                                            diretorio_cache=cache)
+    assert parciais['cisp'].dtype == 'int32'
+    total = agregacao.totalizar_periodo(parciais, ['roubo_veiculo'], 'cisp', fim='2023-01')
+    esperado = df[df['mes'] == 1].groupby('cisp')['roubo_veiculo'].sum()
+    assert total['cisp'].tolist() == esperado.index.tolist()
+    assert total['roubo_veiculo'].tolist() == esperado.tolist()
+
+
+@pytest.mark.parametrize('texto', ['2024-13', '2024-0', '202400', '2024-123'])
+def test_periodo_invalido(texto):
+    with pytest.raises(ValueError):
+        agregacao.periodo_para_int(texto)
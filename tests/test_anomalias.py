@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import anomalias
+
+MUNICIPIOS = ['Niterói', 'Rio de Janeiro', 'São Gonçalo']
+
+
+def _serie(meses, semente=0):
+    # Uma linha por município e mês, contagens com sazonalidade e algum ruído
+    rng = np.random.default_rng(semente)
+    linhas = []
+    for ano, mes in meses:
+        for i, munic in enumerate(MUNICIPIOS):
+            linhas.append({'cisp': i, 'mes': mes, 'ano': ano, 'munic': munic,
+                           'roubo_veiculo': int(rng.poisson(20 + 10 * i + 5 * (mes % 4)))})
+    return pd.DataFrame(linhas)
+
+
+def _meses(inicio, quantidade):
+    ano, mes = inicio
+    return [(ano + (mes - 1 + k) // 12, (mes - 1 + k) % 12 + 1) for k in range(quantidade)]
+
+
+def _bases(csv, cache, modo):
+    tabela = anomalias.atualizar_bases('roubo_veiculo', modo=modo, janela=6, anos=2,
+                                       endereco=str(csv), diretorio_cache=cache)
+    return tabela.sort_values(['munic', 'periodo'], ignore_index=True)
+
+
+@pytest.mark.parametrize('modo', anomalias.MODOS)
+def test_meses_novos_e_revisados_iguais_ao_calculo_completo(modo, tmp_path, gravar_csv_isp,
+                                                            monkeypatch):
+    csv = tmp_path / 'base.csv'
+    historico = _serie(_meses((2020, 1), 36))
+    gravar_csv_isp(historico, csv, modificado_ns=1_000_000_000)
+    _bases(csv, tmp_path / 'cache', modo)
+
+    etapas = []
+    etapa_original = anomalias.etapa
+
+    def registrar(nome, **campos):
+        etapas.append((nome, campos))
+        return etapa_original(nome, **campos)
+
+    monkeypatch.setattr(anomalias, 'etapa', registrar)
+    # Três meses publicados: só eles são calculados
+    com_novos = pd.concat([historico, _serie(_meses((2023, 1), 3), semente=1)],
+                          ignore_index=True)
+    gravar_csv_isp(com_novos, csv, modificado_ns=2_000_000_000)
+    incremental = _bases(csv, tmp_path / 'cache', modo)
+    assert dict(etapas)['anomalias'] == {'indicador': 'roubo_veiculo', 'modo': modo,
+                                         'meses': 3, 'incremental': True}
+    pd.testing.assert_frame_equal(incremental, _bases(csv, tmp_path / 'completo1', modo))
+
+    # Um mês antigo revisado: refeitos a partir dele
+    revisado = com_novos.copy()
+    revisado.loc[(revisado['ano'] == 2022) & (revisado['mes'] == 10), 'roubo_veiculo'] += 40
+    gravar_csv_isp(revisado, csv, modificado_ns=3_000_000_000)
+    etapas.clear()
+    incremental = _bases(csv, tmp_path / 'cache', modo)
+    assert dict(etapas)['anomalias']['meses'] == 6
+    pd.testing.assert_frame_equal(incremental, _bases(csv, tmp_path / 'completo2', modo))
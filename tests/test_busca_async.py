@@ -0,0 +1,112 @@
+import asyncio
+import os
+import socket
+
+import pytest
+
+import busca_async
+import dados
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_baixa_e_revalida_com_304(servidor_http, tmp_path):
+    url_base, pasta = servidor_http
+    (pasta / 'base.csv').write_text('a;b\n1;2\n', encoding='utf-8')
+    # Data de modificação no passado, para o If-Modified-Since valer
+    os.utime(pasta / 'base.csv', (1_600_000_000, 1_600_000_000))
+    endereco = f'{url_base}/base.csv'
+    cache = tmp_path / 'cache'
+
+    primeiro = busca_async.obter_arquivos([endereco], diretorio_cache=cache)[endereco]
+    assert primeiro.situacao == 'miss'
+    assert primeiro.caminho.read_text(encoding='utf-8') == 'a;b\n1;2\n'
+
+    segundo = busca_async.obter_arquivos([endereco], diretorio_cache=cache)[endereco]
+    assert segundo.situacao == 'revalidado'
+    assert segundo.bytes_baixados == 0
+
+    # O cache é o mesmo de dados.obter_arquivo
+    assert dados.obter_arquivo(endereco, diretorio_cache=cache, ttl=0).situacao == 'revalidado'
+
+
+def test_reaproveita_conexao(servidor_http, tmp_path):
+    url_base, pasta = servidor_http
+    enderecos = []
+    for i in range(3):
+        (pasta / f'{i}.csv').write_text(f'x\n{i}\n', encoding='utf-8')
+        enderecos.append(f'{url_base}/{i}.csv')
+
+    async def baixar_em_sequencia():
+        pool = busca_async.PoolConexoes(limite_por_host=1)
+        try:
+            for endereco in enderecos:
+                await busca_async.baixar(pool, endereco, tmp_path / 'cache')
+        finally:
+            await pool.fechar()
+        return pool.conexoes_abertas
+
+    assert asyncio.run(baixar_em_sequencia()) == 1
+
+
+def test_falha_ao_conectar_devolve_a_vaga():
+    url = f'http://127.0.0.1:{_porta_livre()}/nada.csv'
+
+    async def requisitar_duas_vezes():
+        pool = busca_async.PoolConexoes(limite_por_host=1, timeout=2)
+        for _ in range(2):
+            with pytest.raises(OSError):
+                await pool.requisitar(url, {})
+
+    # Sem a vaga devolvida, a segunda requisição ficaria esperando para sempre
+    asyncio.run(asyncio.wait_for(requisitar_duas_vezes(), 5))
+
+
+def test_servidor_mudo_estoura_o_timeout():
+    ouvinte = socket.socket()
+    ouvinte.bind(('127.0.0.1', 0))
+    ouvinte.listen()
+    url = f'http://127.0.0.1:{ouvinte.getsockname()[1]}/mudo.csv'
+
+    async def requisitar():
+        pool = busca_async.PoolConexoes(limite_por_host=1, timeout=0.2)
+        for _ in range(2):
+            with pytest.raises(TimeoutError):
+                await pool.requisitar(url, {})
+
+    try:
+        asyncio.run(asyncio.wait_for(requisitar(), 5))
+    finally:
+        ouvinte.close()
+
+
+def test_falha_ao_gravar_devolve_a_vaga(servidor_http, tmp_path, monkeypatch):
+    url_base, pasta = servidor_http
+    (pasta / 'base.csv').write_text('a;b\n1;2\n', encoding='utf-8')
+    endereco = f'{url_base}/base.csv'
+    falhas = []
+    mkstemp = busca_async.tempfile.mkstemp
+
+    def mkstemp_falha_uma_vez(*args, **kwargs):
+        if not falhas:
+            falhas.append(1)
+            raise OSError('disco cheio')
+        return mkstemp(*args, **kwargs)
+
+    monkeypatch.setattr(busca_async.tempfile, 'mkstemp', mkstemp_falha_uma_vez)
+
+    async def baixar():
+        pool = busca_async.PoolConexoes(limite_por_host=1, timeout=2)
+        try:
+            return await busca_async.baixar(pool, endereco, tmp_path / 'cache', espera_inicial=0)
+        finally:
+            await pool.fechar()
+
+    # A nova tentativa precisa da única vaga do host, que a falha não pode prender
+    resultado = asyncio.run(asyncio.wait_for(baixar(), 5))
+    assert falhas and resultado.situacao == 'miss'
+    assert resultado.caminho.read_text(encoding='utf-8') == 'a;b\n1;2\n'
@@ -0,0 +1,87 @@
+import os
+
+import pytest
+
+import dados
+
+CONTEUDO = 'ano;mes;roubo_veiculo\n2023;1;10\n'
+
+
+def _publicar(pasta, nome, conteudo, modificado):
+    # Data de modificação no passado, para o If-Modified-Since valer
+    caminho = pasta / nome
+    caminho.parent.mkdir(parents=True, exist_ok=True)
+    caminho.write_text(conteudo, encoding='utf-8')
+    os.utime(caminho, (modificado, modificado))
+    return caminho
+
+
+@pytest.fixture
+def publicado(servidor_http, tmp_path):
+    url_base, pasta = servidor_http
+    _publicar(pasta, 'base.csv', CONTEUDO, 1_600_000_000)
+    return f'{url_base}/base.csv', pasta, tmp_path / 'cache'
+
+
+def test_baixa_e_revalida(publicado):
+    endereco, pasta, cache = publicado
+    tamanho = len(CONTEUDO)
+
+    primeiro = dados.obter_arquivo(endereco, diretorio_cache=cache, ttl=0)
+    assert primeiro.situacao == 'miss' and not primeiro.acerto
+    assert (primeiro.bytes_baixados, primeiro.bytes_economizados) == (tamanho, 0)
+    assert primeiro.caminho.read_text(encoding='utf-8') == CONTEUDO
+
+    # Arquivo igual no servidor: 304, nada baixado
+    segundo = dados.obter_arquivo(endereco, diretorio_cache=cache, ttl=0)
+    assert segundo.situacao == 'revalidado' and segundo.acerto
+    assert (segundo.bytes_baixados, segundo.bytes_economizados) == (0, tamanho)
+
+    # Nova publicação: baixada de novo
+    novo = CONTEUDO + '2023;2;12\n'
+    _publicar(pasta, 'base.csv', novo, 1_700_000_000)
+    terceiro = dados.obter_arquivo(endereco, diretorio_cache=cache, ttl=0)
+    assert terceiro.situacao == 'miss'
+    assert terceiro.bytes_baixados == len(novo)
+    assert terceiro.caminho.read_text(encoding='utf-8') == novo
+
+
+def test_dentro_do_ttl_nem_pergunta_ao_servidor(publicado):
+    endereco, pasta, cache = publicado
+    dados.obter_arquivo(endereco, diretorio_cache=cache, ttl=0)
+    _publicar(pasta, 'base.csv', CONTEUDO + '2023;2;12\n', 1_700_000_000)
+
+    resultado = dados.obter_arquivo(endereco, diretorio_cache=cache, ttl=3600)
+    assert resultado.situacao == 'hit'
+    assert (resultado.bytes_baixados, resultado.bytes_economizados) == (0, len(CONTEUDO))
+    assert resultado.caminho.read_text(encoding='utf-8') == CONTEUDO
+
+
+def test_offline_usa_a_copia_local(publicado):
+    endereco, pasta, cache = publicado
+    with pytest.raises(FileNotFoundError):
+        dados.obter_arquivo(endereco, diretorio_cache=cache, offline=True)
+
+    dados.obter_arquivo(endereco, diretorio_cache=cache, ttl=0)
+    (pasta / 'base.csv').unlink()
+    resultado = dados.obter_arquivo(endereco, diretorio_cache=cache, offline=True)
+    assert resultado.situacao == 'offline'
+    assert (resultado.bytes_baixados, resultado.bytes_economizados) == (0, len(CONTEUDO))
+    assert resultado.caminho.read_text(encoding='utf-8') == CONTEUDO
+
+
+def test_outro_endereco_com_o_mesmo_nome_nao_usa_a_copia(servidor_http, tmp_path):
+    url_base, pasta = servidor_http
+    cache = tmp_path / 'cache'
+    _publicar(pasta, 'a/base.csv', CONTEUDO, 1_600_000_000)
+    outro = 'ano;mes;roubo_veiculo\n2022;12;3\n'
+    _publicar(pasta, 'b/base.csv', outro, 1_600_000_000)
+
+    dados.obter_arquivo(f'{url_base}/a/base.csv', diretorio_cache=cache, ttl=0)
+    # Mesmo nome no cache: sem os cabeçalhos de revalidação de a/base.csv, mesmo com TTL
+    resultado = dados.obter_arquivo(f'{url_base}/b/base.csv', diretorio_cache=cache, ttl=3600)
+    assert resultado.situacao == 'miss'
+    assert resultado.bytes_baixados == len(outro)
+    assert resultado.caminho.read_text(encoding='utf-8') == outro
+    with pytest.raises(FileNotFoundError):
+        dados.obter_arquivo(f'{url_base}/a/base.csv', diretorio_cache=cache, offline=True)
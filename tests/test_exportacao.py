@@ -0,0 +1,63 @@
+import json
+
+import pandas as pd
+import pytest
+
+import exportacao
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def _ler(caminhos):
+    return {
+        'parquet': pq.read_table(caminhos['parquet']).to_pandas(),
+        'json': pd.read_json(caminhos['json'], lines=True),
+        'csv': pd.read_csv(caminhos['csv'], sep=';'),
+    }
+
+
+def _bloco(linhas):
+    return pd.DataFrame(linhas, columns=['indicador', 'munic', 'valor', 'tipo'])
+
+
+def test_tres_formatos_com_primeiro_bloco_vazio(tmp_path):
+    blocos = [
+        _bloco([]),
+        # Coluna só com nulos no primeiro bloco com linhas
+        _bloco([('roubo_veiculo', None, 4824.0, 'superior')]),
+        _bloco([('hom_doloso', 'Niterói', 12.5, 'inferior'),
+                ('hom_doloso', 'Magé', 293.0, 'superior')]),
+    ]
+    caminhos = exportacao.exportar_em_blocos(blocos, tmp_path / 'outliers')
+    assert {caminho.suffix for caminho in caminhos.values()} == {'.parquet', '.jsonl', '.csv'}
+
+    for formato, df in _ler(caminhos).items():
+        assert list(df.columns) == ['indicador', 'munic', 'valor', 'tipo'], formato
+        assert df['indicador'].tolist() == ['roubo_veiculo', 'hom_doloso', 'hom_doloso'], formato
+        assert df['valor'].tolist() == [4824.0, 12.5, 293.0], formato
+        assert pd.isna(df['munic'][0]) and df['munic'][1:].tolist() == ['Niterói', 'Magé'], formato
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_so_blocos_vazios_gravam_so_as_colunas(tmp_path):
+    caminhos = exportacao.exportar_em_blocos([_bloco([]), _bloco([])], tmp_path / 'vazio')
+    assert pq.read_schema(caminhos['parquet']).names == ['indicador', 'munic', 'valor', 'tipo']
+    assert caminhos['csv'].read_text(encoding='utf-8') == 'indicador;munic;valor;tipo\n'
+    assert caminhos['json'].read_text(encoding='utf-8') == ''
+
+
+def test_exportar_resultados_com_manifesto(tmp_path):
+    medidas = pd.DataFrame({'q1': [1.0], 'q3': [3.0], 'iqr': [2.0]},
+                           index=pd.Index(['roubo_veiculo'], name='indicador'))
+    outliers = _bloco([('roubo_veiculo', 'Rio de Janeiro', 4824.0, 'superior')])
+    vazio = type('Resultado', (), {'medidas': medidas.iloc[:0], 'outliers': outliers.iloc[:0]})
+    cheio = type('Resultado', (), {'medidas': medidas, 'outliers': outliers})
+    arquivos = exportacao.exportar_resultados([vazio, cheio], tmp_path, formatos=['parquet', 'csv'],
+                                              metadados={'metodo': 'weibull'})
+
+    manifesto = json.loads((tmp_path / 'manifesto.json').read_text(encoding='utf-8'))
+    assert manifesto['blocos'] == 2
+    assert manifesto['linhas'] == {'medidas': 1, 'outliers': 1}
+    assert manifesto['metodo'] == 'weibull'
+    df_medidas = pq.read_table(arquivos['medidas']['parquet']).to_pandas()
+    assert df_medidas.columns.tolist() == ['indicador', 'q1', 'q3', 'iqr']
@@ -0,0 +1,81 @@
+import os
+import time
+
+import pandas as pd
+
+import memoizacao
+
+
+def _calculo(valor, chamadas):
+    def calcular():
+        chamadas.append(valor)
+        # ~1 KB por resultado, para o limite de espaço contar em entradas
+        return {'valor': valor, 'enchimento': 'x' * 1000}
+    return calcular
+
+
+def _memoizar(caminho, parametros, chamadas, cache, **opcoes):
+    resultado, acerto = memoizacao.memoizar('analise', caminho, parametros,
+                                            _calculo(parametros['valor'], chamadas), cache,
+                                            **opcoes)
+    assert resultado['valor'] == parametros['valor']
+    return acerto
+
+
+def test_reaproveita_e_invalida_por_parametros_e_dados(tmp_path):
+    caminho = tmp_path / 'dados.csv'
+    caminho.write_text('a\n1\n', encoding='utf-8')
+    os.utime(caminho, ns=(1_000_000_000, 1_000_000_000))
+    cache = tmp_path / 'cache'
+    chamadas = []
+
+    assert not _memoizar(caminho, {'valor': 1}, chamadas, cache)
+    assert _memoizar(caminho, {'valor': 1}, chamadas, cache)
+    # Outros parâmetros: outra chave
+    assert not _memoizar(caminho, {'valor': 1, 'metodo': 'linear'}, chamadas, cache)
+    assert chamadas == [1, 1]
+
+    # Versão nova dos dados: recalcula e apaga os resultados da versão antiga
+    caminho.write_text('a\n2\n', encoding='utf-8')
+    os.utime(caminho, ns=(2_000_000_000, 2_000_000_000))
+    assert not _memoizar(caminho, {'valor': 1}, chamadas, cache)
+    assert len(list((cache / 'resultados').glob('*.pkl'))) == 1
+    assert chamadas == [1, 1, 1]
+
+
+def test_limite_descarta_o_menos_usado(tmp_path):
+    caminho = tmp_path / 'dados.csv'
+    caminho.write_text('a\n1\n', encoding='utf-8')
+    cache = tmp_path / 'cache'
+    chamadas = []
+    # Cabem dois resultados
+    limite = 2500
+
+    for valor in (1, 2):
+        _memoizar(caminho, {'valor': valor}, chamadas, cache, limite_bytes=limite)
+        time.sleep(0.02)
+    # Ler 1 o torna o mais recente: quem sai ao gravar 3 é o 2
+    assert _memoizar(caminho, {'valor': 1}, chamadas, cache, limite_bytes=limite)
+    time.sleep(0.02)
+    _memoizar(caminho, {'valor': 3}, chamadas, cache, limite_bytes=limite)
+    assert len(list((cache / 'resultados').glob('*.pkl'))) == 2
+
+    assert _memoizar(caminho, {'valor': 1}, chamadas, cache, limite_bytes=limite)
+    assert _memoizar(caminho, {'valor': 3}, chamadas, cache, limite_bytes=limite)
+    assert chamadas == [1, 2, 3]
+    assert not _memoizar(caminho, {'valor': 2}, chamadas, cache, limite_bytes=limite)
+
+
+def test_analise_memoizada(tmp_path, gravar_csv_isp, capsys):
+    linhas = [{'cisp': i, 'mes': 1, 'ano': 2023, 'munic': f'M{i}', 'roubo_veiculo': i * i}
+              for i in range(8)]
+    csv = gravar_csv_isp(pd.DataFrame(linhas), tmp_path / 'base.csv')
+    opcoes = {'endereco': str(csv), 'diretorio_cache': tmp_path / 'cache'}
+
+    primeira = memoizacao.analisar_indicador_memoizado('roubo_veiculo', **opcoes)
+    assert 'calculado e memoizado' in capsys.readouterr().out
+    segunda = memoizacao.analisar_indicador_memoizado('roubo_veiculo', **opcoes)
+    assert 'reaproveitado da memoização' in capsys.readouterr().out
+    assert segunda.medidas == primeira.medidas
+    pd.testing.assert_frame_equal(segunda.df_agrupado, primeira.df_agrupado)
+    pd.testing.assert_frame_equal(segunda.outliers_superiores, primeira.outliers_superiores)
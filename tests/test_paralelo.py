@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+import paralelo
+from estatisticas import calcular_medidas
+
+INDICADORES = ['roubo_veiculo', 'furto_veiculos', 'hom_doloso']
+CHAVES = ['ano', 'regiao']
+
+
+def _linhas_brutas():
+    # Três regiões com 5 a 9 municípios, duas CISPs por município e um pico
+    # em alguns municípios, para haver outliers dos dois lados
+    rng = np.random.default_rng(12)
+    linhas = []
+    for r, regiao in enumerate(['Baixada', 'Capital', 'Interior']):
+        for m in range(5 + 2 * r):
+            munic = f'{regiao} {m}'
+            for ano in (2022, 2023):
+                for mes in range(1, 13):
+                    for cisp in range(2):
+                        valores = rng.poisson([30, 12, 2]) * (8 if m == 1 else 1)
+                        linhas.append({'ano': ano, 'mes': mes, 'regiao': regiao, 'munic': munic,
+                                       'cisp': 100 * r + 10 * m + cisp,
+                                       **dict(zip(INDICADORES, valores.tolist()))})
+    return pd.DataFrame(linhas)
+
+
+def _ingenuo(df):
+    # Um groupby e um calcular_medidas por combinação de grupo e indicador
+    medidas, outliers = [], []
+    for (ano, regiao), grupo in df.groupby(CHAVES, sort=True):
+        totais = grupo.groupby('munic')[INDICADORES].sum()
+        for indicador in INDICADORES:
+            m = calcular_medidas(totais[indicador].to_numpy(dtype=np.float64))
+            medidas.append({'ano': ano, 'regiao': regiao, 'indicador': indicador,
+                            **{nome: getattr(m, nome) for nome in paralelo.NOMES_MEDIDAS}})
+            for munic, valor in totais[indicador].items():
+                if valor < m.limite_inferior or valor > m.limite_superior:
+                    outliers.append({'ano': ano, 'regiao': regiao, 'indicador': indicador,
+                                     'munic': munic, 'valor': valor,
+                                     'tipo': 'superior' if valor > m.limite_superior
+                                     else 'inferior'})
+    return pd.DataFrame(medidas), pd.DataFrame(outliers)
+
+
+def _normalizar(df):
+    df = df.astype({'regiao': str, 'munic': str}, errors='ignore')
+    return df.sort_values(list(df.columns[:5]), ignore_index=True)
+
+
+def test_processos_e_ingenuo_iguais():
+    df = _linhas_brutas()
+    resultados = [paralelo.analisar_por_grupo(df, CHAVES, INDICADORES, processos=processos,
+                                              particoes=4)
+                  for processos in (1, 3)]
+    # Com vários processos, a mesma tabela, na mesma ordem
+    pd.testing.assert_frame_equal(resultados[0].medidas, resultados[1].medidas)
+    pd.testing.assert_frame_equal(resultados[0].outliers, resultados[1].outliers)
+
+    medidas, outliers = _ingenuo(df)
+    assert len(outliers) > 0
+    pd.testing.assert_frame_equal(resultados[0].medidas.astype({'regiao': str}), medidas,
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(_normalizar(resultados[0].outliers), _normalizar(outliers),
+                                  check_dtype=False)
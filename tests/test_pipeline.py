@@ -0,0 +1,64 @@
+import pandas as pd
+
+import pipeline
+
+MUNICIPIOS = ['Niterói', 'Rio de Janeiro', 'São Gonçalo', 'Itaboraí', 'Maricá', 'Magé']
+INDICADORES = ['roubo_veiculo', 'furto_veiculos', 'hom_doloso']
+
+
+def _base(tmp_path, gravar_csv_isp):
+    linhas = [{'cisp': i, 'mes': mes, 'ano': 2023, 'munic': munic,
+               'roubo_veiculo': (i + 1) * mes, 'furto_veiculos': 3 * i + mes,
+               'hom_doloso': (7 * i) % 5 + (mes == 6) * 40}
+              for mes in range(1, 13) for i, munic in enumerate(MUNICIPIOS)]
+    return gravar_csv_isp(pd.DataFrame(linhas), tmp_path / 'base.csv')
+
+
+def _lote(diretorio, csv, cache):
+    return pipeline.Pipeline(diretorio, indicadores=INDICADORES, formatos=['csv'],
+                             endereco=str(csv), diretorio_cache=cache)
+
+
+def _exportado(diretorio):
+    return {nome: pd.read_csv(diretorio / 'exportacao' / f'{nome}.csv')
+            for nome in ('medidas', 'outliers')}
+
+
+def test_retoma_sem_refazer_o_que_ja_foi_concluido(tmp_path, gravar_csv_isp, monkeypatch):
+    csv, cache = _base(tmp_path, gravar_csv_isp), tmp_path / 'cache'
+    lote = tmp_path / 'lote'
+    analisar = pipeline.Pipeline._analisar
+    chamadas, falhas = [], []
+
+    def analisar_com_falha(self, agregado, indicador):
+        chamadas.append(indicador)
+        # Falha só na primeira execução
+        if indicador == 'furto_veiculos' and not falhas:
+            falhas.append(indicador)
+            raise ValueError('coluna corrompida')
+        return analisar(self, agregado, indicador)
+
+    monkeypatch.setattr(pipeline.Pipeline, '_analisar', analisar_com_falha)
+    primeira = _lote(lote, csv, cache).executar()
+    assert primeira.situacoes['estatisticas'] == 'parcial'
+    assert list(primeira.falhas['estatisticas']) == ['furto_veiculos']
+    assert 'coluna corrompida' in (lote / pipeline.NOME_LOG_ERROS).read_text(encoding='utf-8')
+
+    chamadas.clear()
+    segunda = _lote(lote, csv, cache).executar()
+    assert segunda.ok
+    assert segunda.reaproveitadas == ['agregacao']
+    # Só o indicador que falhou é analisado de novo
+    assert chamadas == ['furto_veiculos']
+
+    # Mesmo resultado de uma execução limpa, sem falhas
+    limpa = _lote(tmp_path / 'limpo', csv, cache).executar()
+    assert limpa.ok
+    for nome, tabela in _exportado(lote).items():
+        pd.testing.assert_frame_equal(tabela, _exportado(tmp_path / 'limpo')[nome])
+
+    # Tudo concluído: a terceira execução só lê do disco
+    chamadas.clear()
+    terceira = _lote(lote, csv, cache).executar()
+    assert chamadas == []
+    assert terceira.reaproveitadas == ['agregacao', 'estatisticas', 'exportacao']
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import quantis_aproximados
+from quantis_aproximados import EsbocoKLL, erro_rank
+
+
+def _rank(ordenados, valor):
+    # Fração dos valores menores ou iguais a `valor`
+    return np.searchsorted(ordenados, valor, side='right') / len(ordenados)
+
+
+@pytest.mark.parametrize('k', [50, 200])
+def test_erro_de_rank_dentro_do_limite(k):
+    valores = np.random.default_rng(42).lognormal(3, 1.5, size=300_000)
+    esboco = EsbocoKLL(k)
+    for inicio in range(0, len(valores), 10_000):
+        esboco.atualizar(valores[inicio:inicio + 10_000])
+    probabilidades = np.linspace(0.01, 0.99, 99)
+    ordenados = np.sort(valores)
+    ranks = _rank(ordenados, esboco.quantis(probabilidades))
+    assert np.max(np.abs(ranks - probabilidades)) <= erro_rank(k)
+    assert len(esboco) == len(valores)
+    # Guarda só uma fração dos valores
+    assert sum(nivel.size for nivel in esboco.niveis) < len(valores) // 10
+
+
+def test_mescla_mantem_o_limite():
+    rng = np.random.default_rng(7)
+    partes = [rng.poisson(20 + 10 * i, size=50_000).astype(float) for i in range(4)]
+    esboco = EsbocoKLL(200, semente=0)
+    for i, parte in enumerate(partes):
+        outro = EsbocoKLL(200, semente=i + 1)
+        outro.atualizar(parte)
+        esboco.mesclar(outro)
+    ordenados = np.sort(np.concatenate(partes))
+    probabilidades = np.array([0.25, 0.5, 0.75])
+    ranks = _rank(ordenados, esboco.quantis(probabilidades))
+    # Valores inteiros repetidos: o rank do quantil pode pular o empate inteiro
+    largura_empate = np.array([_rank(ordenados, q) - _rank(ordenados, q - 1)
+                               for q in esboco.quantis(probabilidades)])
+    assert np.all(ranks - largura_empate - erro_rank(200) <= probabilidades)
+    assert np.all(probabilidades <= ranks + erro_rank(200))
+
+
+def test_semente_padrao_reproduz_o_resultado():
+    valores = np.random.default_rng(3).normal(size=200_000)
+    a = quantis_aproximados.calcular_medidas_aproximadas(valores, k=50)
+    b = quantis_aproximados.calcular_medidas_aproximadas(valores, k=50)
+    assert a == b
+    assert a.erro_rank == pytest.approx(erro_rank(50))
+
+
+def test_esboco_do_csv_respeita_o_periodo(tmp_path, gravar_csv_isp):
+    linhas = [{'ano': ano, 'mes': mes, 'cisp': 1, 'roubo_veiculo': ano * 100 + mes}
+              for ano in (2022, 2023) for mes in range(1, 13)]
+    caminho = tmp_path / 'base.csv'
+    gravar_csv_isp(pd.DataFrame(linhas), caminho)
+    esboco = quantis_aproximados.esbocar_csv(caminho, 'roubo_veiculo', linhas_por_bloco=5,
+                                             inicio='2022-11', fim='2023-02')
+    assert len(esboco) == 4
+    assert list(esboco.quantis(np.array([0.0, 1.0]))) == [202211, 202302]
+    assert len(quantis_aproximados.esbocar_csv(caminho, 'roubo_veiculo')) == 24
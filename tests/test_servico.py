@@ -0,0 +1,131 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+import servico
+
+MUNICIPIOS = ['Niterói', 'Rio de Janeiro', 'São Gonçalo', 'Macaé', 'Magé', 'Japeri', 'Queimados',
+              'Itaboraí']
+
+
+def _linhas(meses, fator=1):
+    linhas = []
+    for ano, mes in meses:
+        for i, munic in enumerate(MUNICIPIOS):
+            linhas.append({'cisp': i, 'mes': mes, 'ano': ano, 'munic': munic,
+                           'roubo_veiculo': fator * (i + 1) * (100 if i == 1 else 1),
+                           'hom_doloso': i + mes})
+    return pd.DataFrame(linhas)
+
+
+@pytest.fixture
+def api(servidor_http, tmp_path, gravar_csv_isp):
+    """Serviço carregado de um CSV servido por http.server; devolve (consultar, servico, gravar)."""
+    url_base, pasta = servidor_http
+
+    def gravar(df, segundos):
+        # Datas de modificação em segundos diferentes: o If-Modified-Since percebe a troca
+        gravar_csv_isp(df, pasta / 'base.csv', modificado_ns=segundos * 10**9)
+
+    gravar(_linhas([(2023, 1), (2023, 2)]), 1_600_000_000)
+    estado_servico = servico.Servico(intervalo=3600, endereco=f'{url_base}/base.csv',
+                                     diretorio_cache=tmp_path / 'cache', ttl=0)
+    servidor = servico.criar_servidor(estado_servico, porta=0)
+    threading.Thread(target=servidor.serve_forever, args=(0.05,), daemon=True).start()
+    endereco = f'http://127.0.0.1:{servidor.server_address[1]}'
+
+    def consultar(caminho, metodo='GET'):
+        requisicao = urllib.request.Request(endereco + caminho, method=metodo)
+        try:
+            with urllib.request.urlopen(requisicao, timeout=10) as resposta:
+                return resposta.status, json.loads(resposta.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    try:
+        yield consultar, estado_servico, gravar
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def test_rotas(api):
+    consultar, _, _ = api
+    status, saude = consultar('/saude')
+    assert status == 200 and saude['indicadores'] == 2
+
+    assert consultar('/indicadores') == (200, ['roubo_veiculo', 'hom_doloso'])
+
+    status, medidas = consultar('/medidas?indicador=roubo_veiculo')
+    assert status == 200
+    assert medidas['maximo'] == 400 and medidas['minimo'] == 2
+
+    status, top = consultar('/top?indicador=roubo_veiculo&n=2')
+    assert status == 200
+    assert [linha['munic'] for linha in top] == ['Rio de Janeiro', 'Itaboraí']
+
+    status, outliers = consultar('/outliers?indicador=roubo_veiculo')
+    assert status == 200
+    assert [linha['munic'] for linha in outliers['superiores']] == ['Rio de Janeiro']
+
+    status, todos = consultar('/outliers')
+    assert status == 200 and {linha['indicador'] for linha in todos} == {'roubo_veiculo'}
+
+    status, so_janeiro = consultar('/indicador/hom_doloso?from=2023-01&to=2023-01')
+    assert status == 200 and so_janeiro['medidas']['maximo'] == 8
+
+
+@pytest.mark.parametrize('caminho, status', [
+    ('/medidas', 400),
+    ('/medidas?indicador=nao_existe', 404),
+    ('/medidas?indicador=roubo_veiculo&from=abc', 400),
+    ('/medidas?indicador=roubo_veiculo&from=2024-13', 400),
+    ('/top?indicador=roubo_veiculo&n=-1', 400),
+    ('/top?indicador=roubo_veiculo&ordem=aleatoria', 400),
+    ('/nada', 404),
+    # Período sem nenhum mês: 404 em JSON, não uma conexão derrubada
+    ('/medidas?indicador=roubo_veiculo&from=2030-01', 404),
+    ('/outliers?from=2030-01', 404),
+    ('/top?indicador=roubo_veiculo&to=2020-12', 404),
+])
+def test_erros_em_json(api, caminho, status):
+    consultar, _, _ = api
+    recebido, corpo = consultar(caminho)
+    assert recebido == status
+    assert corpo['erro']
+
+
+def test_erro_inesperado_vira_500(api, monkeypatch):
+    consultar, _, _ = api
+
+    def quebrar(estado, parametros):
+        raise IndexError('falha de teste')
+
+    monkeypatch.setitem(servico.ROTAS, '/saude', quebrar)
+    status, corpo = consultar('/saude')
+    assert status == 500
+    assert 'IndexError' in corpo['erro']
+
+
+def test_recarga_a_quente(api):
+    consultar, estado_servico, gravar = api
+    versao = consultar('/saude')[1]['versao']
+    assert consultar('/medidas?indicador=roubo_veiculo')[1]['maximo'] == 400
+
+    # Forçar sem dados novos recarrega, mas informa que a versão é a mesma
+    assert consultar('/recarregar', 'POST') == (200, {'recarregado': False, 'versao': versao})
+    assert estado_servico.recarregar() is False
+
+    gravar(_linhas([(2023, 1), (2023, 2), (2023, 3)], fator=2), 1_600_000_100)
+    status, corpo = consultar('/recarregar', 'POST')
+    assert status == 200 and corpo['recarregado'] is True and corpo['versao'] != versao
+    # As respostas guardadas da versão antiga não são mais usadas
+    assert consultar('/medidas?indicador=roubo_veiculo')[1]['maximo'] == 1200
+
+    gravar(_linhas([(2023, 1)]), 1_600_000_200)
+    assert estado_servico.recarregar() is True
+    assert consultar('/medidas?indicador=roubo_veiculo')[1]['maximo'] == 200
@@ -0,0 +1,208 @@
+# Painéis para muitos municípios/CISPs e séries mensais longas
+#
+# O painel de graficos.py desenha um boxplot com todos os pontos e uma barra
+# (com rótulo) por outlier: fica lento e ilegível passando de ~100 barras ou
+# quando a série mensal entra no gráfico. Aqui tudo é reduzido antes de
+# chegar ao matplotlib, então o número de elementos desenhados não depende
+# do tamanho da entrada:
+#   - distribuição: histograma em faixas (np.histogram) com as linhas de Q1,
+#     mediana, Q3 e limites, em vez do boxplot, quando há muitos valores;
+#   - série mensal: total do estado e das chaves com maiores valores,
+#     reduzidas com LTTB (Largest-Triangle-Three-Buckets, Steinarsson 2013),
+#     que mantém picos e vales com poucos pontos;
+#   - barras: só as LIMITE_BARRAS maiores, com o número das que ficaram de fora.
+# O layout 2x2 é o mesmo do exemplo3.py (ver ModeloPainelGrande).
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from agregacao import periodo_para_int, totalizar_periodo
+from anomalias import mes_para_periodo, serie_mensal
+from estatisticas import calcular_medidas, selecionar_extremos
+from graficos import ModeloPainel
+from instrumentacao import etapa
+from municipios import indice_padrao
+
+
+LIMITE_BOXPLOT = 200
+FAIXAS_HISTOGRAMA = 40
+PONTOS_SERIE = 300
+LIMITE_BARRAS = 15
+SERIES_DESTACADAS = 5
+
+
+def lttb(x, y, n_pontos):
+    """Posições dos `n_pontos` de (x, y) escolhidos pelo LTTB (inclui o primeiro e o último)."""
+    n = len(x)
+    if n_pontos >= n or n_pontos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Os pontos do meio divididos em n_pontos - 2 faixas de tamanho parecido
+    limites = np.linspace(1, n - 1, n_pontos - 1).astype(np.int64)
+    escolhidos = np.empty(n_pontos, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    anterior = 0
+    for i in range(n_pontos - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        # Média da faixa seguinte (na última, o último ponto)
+        fim_proxima = limites[i + 2] if i + 2 < len(limites) else n
+        media_x = x[fim:fim_proxima].mean()
+        media_y = y[fim:fim_proxima].mean()
+        # Ponto da faixa que forma o maior triângulo com o anterior e a média
+        areas = np.abs((x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        escolhidos[i + 1] = anterior
+    return escolhidos
+
+
+def reduzir_serie(x, y, n_pontos=PONTOS_SERIE):
+    """(x, y) com no máximo `n_pontos`; meses sem dados (NaN) são ignorados."""
+    validos = ~np.isnan(y)
+    x, y = np.asarray(x)[validos], np.asarray(y)[validos]
+    posicoes = lttb(x, y, n_pontos)
+    return x[posicoes], y[posicoes]
+
+
+@dataclass
+class DadosPainelGrande:
+    titulo: str
+    rotulo: str
+    # Totais do período por chave (município, CISP...), na mesma ordem
+    nomes: np.ndarray
+    valores: np.ndarray
+    # Séries mensais: meses absolutos (ano*12 + mes - 1) e {nome: valores}
+    meses: np.ndarray
+    series: dict
+    metodo: str = 'weibull'
+
+    @classmethod
+    def de_parciais(cls, parciais, indicador, chave='munic', inicio=None, fim=None,
+                    indice=None, titulo=None, metodo='weibull'):
+        """Totais do período e séries mensais a partir das parciais de agregacao.py."""
+        codificada = chave == 'munic' and pd.api.types.is_integer_dtype(parciais[chave])
+        if codificada and indice is None:
+            indice = indice_padrao()
+        df = totalizar_periodo(parciais, [indicador], chave, inicio, fim, indice)
+        nomes = df[chave].astype(str).to_numpy()
+        valores = df[indicador].to_numpy()
+
+        # Série mensal com o mesmo recorte de meses dos totais
+        matriz, chaves, primeiro = serie_mensal(parciais, indicador, chave)
+        meses = np.arange(primeiro, primeiro + matriz.shape[1])
+        periodos = mes_para_periodo(meses)
+        no_periodo = np.ones(len(meses), dtype=bool)
+        if inicio is not None:
+            no_periodo &= periodos >= periodo_para_int(inicio)
+        if fim is not None:
+            no_periodo &= periodos <= periodo_para_int(fim, fim=True)
+        matriz, meses = matriz[:, no_periodo], meses[no_periodo]
+
+        series = {'Total': np.nansum(matriz, axis=0)}
+        # As chaves com maiores totais ganham uma linha própria
+        medidas = calcular_medidas(valores, metodo)
+        maiores = selecionar_extremos(valores, medidas, k=SERIES_DESTACADAS).maiores_k
+        if codificada:
+            linhas = np.searchsorted(chaves, indice.codificar(nomes[maiores], adicionar=False))
+        else:
+            linhas = np.searchsorted(chaves, df[chave].to_numpy()[maiores])
+        for nome, linha in zip(nomes[maiores], linhas):
+            series[nome] = matriz[linha]
+        return cls(
+            titulo=titulo or f'Análise de {indicador} no RJ',
+            rotulo=f'Total {indicador}',
+            nomes=nomes,
+            valores=valores,
+            meses=meses,
+            series=series,
+            metodo=metodo,
+        )
+
+
+def _rotulo_mes(mes, _posicao=None):
+    periodo = int(mes_para_periodo(int(round(mes))))
+    return f'{periodo // 100}-{periodo % 100:02d}'
+
+
+class ModeloPainelGrande(ModeloPainel):
+    """Painel 2x2 com distribuição, medidas, séries mensais e maiores valores, em tempo limitado."""
+
+    def _desenhar(self, dados):
+        from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+        medidas = calcular_medidas(dados.valores, metodo=dados.metodo)
+        extremos = selecionar_extremos(dados.valores, medidas, k=LIMITE_BARRAS)
+        ax_dist, ax_medidas, ax_serie, ax_barras = self.eixos.flat
+        for ax in self.eixos.flat:
+            ax.cla()
+        self.fig.suptitle(dados.titulo)
+
+        # POSIÇÃO 01 - DISTRIBUIÇÃO
+        if len(dados.valores) <= LIMITE_BOXPLOT:
+            ax_dist.boxplot(dados.valores, orientation='horizontal', showmeans=True)
+            ax_dist.set_title('Boxplot dos Dados')
+        else:
+            # Contagens costumam ter cauda longa: faixas logarítmicas (e uma
+            # faixa [0, 1) para os zeros) quando o maior valor passa de 100x a mediana
+            faixas = FAIXAS_HISTOGRAMA
+            if medidas.minimo >= 0 and medidas.maximo > 100 * max(medidas.mediana, 1):
+                faixas = np.concatenate(([0], np.geomspace(1, medidas.maximo, FAIXAS_HISTOGRAMA)))
+                ax_dist.set_xscale('symlog', linthresh=1)
+            contagens, bordas = np.histogram(dados.valores, bins=faixas)
+            ax_dist.stairs(contagens, bordas, fill=True, color='gray')
+            linhas = [(medidas.q1, 'Q1', ':'), (medidas.mediana, 'Mediana', '-'),
+                      (medidas.q3, 'Q3', ':'), (medidas.limite_superior, 'Limite superior', '--')]
+            if medidas.limite_inferior >= bordas[0]:
+                linhas.append((medidas.limite_inferior, 'Limite inferior', '--'))
+            for valor, nome, estilo in linhas:
+                ax_dist.axvline(valor, color='black', linestyle=estilo, linewidth=1, label=nome)
+            ax_dist.legend(fontsize=8)
+            ax_dist.set_title(f'Distribuição ({len(dados.valores)} valores)')
+            ax_dist.set_xlabel(dados.rotulo)
+
+        # POSIÇÃO 02 - MEDIDAS
+        ax_medidas.set_title('Medidas Estatísticas')
+        ax_medidas.axis('off')
+        textos = [
+            f'Limite inferior: {medidas.limite_inferior:.2f}',
+            f'Q1: {medidas.q1:.2f}   Mediana: {medidas.mediana:.2f}   Q3: {medidas.q3:.2f}',
+            f'Limite superior: {medidas.limite_superior:.2f}',
+            f'Média: {medidas.media:.3f}   IQR: {medidas.iqr:.2f}',
+            f'Menor valor: {medidas.minimo}   Maior valor: {medidas.maximo}',
+            f'Outliers inferiores: {len(extremos.outliers_inferiores)}',
+            f'Outliers superiores: {len(extremos.outliers_superiores)}',
+        ]
+        for i, texto in enumerate(textos):
+            ax_medidas.text(0.05, 0.9 - i * 0.12, texto, fontsize=10)
+
+        # POSIÇÃO 03 - SÉRIES MENSAIS
+        for nome, valores in dados.series.items():
+            x, y = reduzir_serie(dados.meses, valores)
+            ax_serie.plot(x, y, linewidth=1.5 if nome == 'Total' else 1, label=nome)
+        ax_serie.set_yscale('symlog')
+        ax_serie.xaxis.set_major_locator(MaxNLocator(8, integer=True))
+        ax_serie.xaxis.set_major_formatter(FuncFormatter(_rotulo_mes))
+        ax_serie.tick_params(axis='x', labelsize=8, rotation=30)
+        ax_serie.legend(fontsize=7)
+        ax_serie.set_title('Série mensal')
+
+        # POSIÇÃO 04 - MAIORES OUTLIERS SUPERIORES
+        posicoes = extremos.outliers_superiores[:LIMITE_BARRAS]
+        fora = len(extremos.outliers_superiores) - len(posicoes)
+        titulo = 'Outliers Superiores' + (f' ({LIMITE_BARRAS} maiores, +{fora})' if fora else '')
+        # Ordem crescente: a maior barra fica no topo do gráfico horizontal
+        self._barras(ax_barras, dados, posicoes[::-1], titulo, 'Sem outliers superiores')
+
+        self.fig.tight_layout()
+
+
+def painel_grande(parciais, indicador, caminho=None, chave='munic', inicio=None, fim=None,
+                  modelo=None, **opcoes):
+    """Monta o painel reduzido de `indicador` e salva em `caminho` (sem caminho, só desenha)."""
+    with etapa('painel_grande_dados', indicador=indicador):
+        dados = DadosPainelGrande.de_parciais(parciais, indicador, chave, inicio, fim, **opcoes)
+    modelo = modelo or ModeloPainelGrande()
+    modelo.desenhar(dados)
+    return modelo.salvar(caminho) if caminho else modelo